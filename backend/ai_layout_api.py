@@ -1,33 +1,65 @@
 import os
-import base64
+import asyncio
+import string
 import textwrap
 import random
 import json
+import math
 import re
+import threading
 import unicodedata
+from functools import lru_cache
 from io import BytesIO
 
 from dotenv import load_dotenv
-from groq import Groq
 
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import Body, FastAPI, File, HTTPException, UploadFile, Form, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from PIL import Image, ImageDraw, ImageFont
 
+from workers import WorkerPool
+from copy_cache import CopyCache
+from encoding import EncodeSettings, encode_image, resolve_encoding
+from result_store import LocalResultStore, RESPONSE_MODE, publish, result_routes, validate_response_mode
+from asset_store import AssetEntry, AssetStore
+from render_plans import HEADLINE_WRAP, LOGO_SCALE, TemplateIndex, TextPlan, load_templates
+from text_fit import fit_text, font_metrics
+from metrics import TimingMiddleware, log, metrics_routes, stage
+from image_limits import MAX_IMAGE_MEGAPIXELS, ImageInfo, PixelBudget, memory_budget, read_header
+from compliance import COMPLIANCE_MAX_CHARS, COMPLIANCE_MAX_TEXTS, COPY_COMPLIANCE, scanner
+from startup import Startup, health_routes
+
 # SETUP
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None  # point at a local stub for testing
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "8"))  # seconds per LLM call
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "1"))
+AD_COPY_DEADLINE = float(os.getenv("AD_COPY_DEADLINE", "12"))  # seconds for all copy in one request
+AD_COPY_MODE = os.getenv("AD_COPY_MODE", "parallel")  # "parallel" (one call per variation) or "batch" (one call for all)
+AI_MODEL = "openai/gpt-oss-120b"
+
 
-if GROQ_API_KEY:
-    client = Groq(api_key=GROQ_API_KEY)
-    AI_MODEL = "openai/gpt-oss-120b"
-    print(f"✅ Groq API Key found. Using model: {AI_MODEL}")
-else:
-    client = None
-    print("❌ NO GROQ API KEY FOUND. Using offline fallbacks.")
+@lru_cache(maxsize=1)
+def groq_clients() -> tuple:
+    """(sync, async) Groq clients, built on first use; (None, None) without GROQ_API_KEY"""
+    if not GROQ_API_KEY:
+        return None, None
+    from groq import AsyncGroq, Groq  # slow to import, so deferred to the startup task
+
+    options = dict(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, timeout=GROQ_TIMEOUT, max_retries=GROQ_MAX_RETRIES)
+    return Groq(**options), AsyncGroq(**options)
+
+
+def warm_llm_client() -> None:
+    """Import the Groq SDK and build the clients before the first request needs them"""
+    if groq_clients()[1]:
+        print(f"✅ Groq API Key found. Using model: {AI_MODEL}")
+    else:
+        print("❌ NO GROQ API KEY FOUND. Using offline fallbacks.")
 
 
 app = FastAPI()
@@ -38,8 +70,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage timings: Server-Timing on every response, histograms at /metrics
+app.add_middleware(TimingMiddleware, service="layout")
+app.include_router(metrics_routes())
+
+# Fonts, the render pool and the LLM client warm up in the background; see /ready
+startup = Startup("layout")
+app.include_router(health_routes(startup))
+
+# Decoding, rendering and PNG encoding run here, never on the event loop
+workers = WorkerPool("layout")
+
+# Renders of the (template x platform) grid fan out here; a process pool by
+# default so rendering scales with cores instead of contending for the GIL
+RENDER_POOL_KIND = os.getenv("RENDER_POOL_KIND", "process")
+render_pool = WorkerPool("layout-render", kind=RENDER_POOL_KIND)
+
+# Rendered variations are returned as URLs into this store
+result_store = LocalResultStore()
+app.include_router(result_routes(result_store))
+
+# Decoded uploads behind handles, for incremental re-renders
+asset_store = AssetStore()
+
+# Uploads are size-checked from their headers before decoding. Layout only
+# needs the pre-reduced image, so oversized uploads are downscaled by default
+LAYOUT_MAX_MEGAPIXELS = float(os.getenv("LAYOUT_MAX_MEGAPIXELS", str(MAX_IMAGE_MEGAPIXELS)))
+LAYOUT_DOWNSCALE_ON_DECODE = os.getenv("LAYOUT_DOWNSCALE_ON_DECODE", "1") == "1"
+pixel_budget = PixelBudget(LAYOUT_MAX_MEGAPIXELS, LAYOUT_DOWNSCALE_ON_DECODE)
+
+# Validated LLM copy keyed by normalized product name + angle
+copy_cache = CopyCache()
+
 PLATFORM_DIMENSIONS = {
     "facebook_feed": (1200, 628),
     "instagram_square": (1080, 1080),
@@ -110,11 +175,17 @@ def parse_color(color_input: str) -> tuple:
     except:
         return (255, 255, 255, 255)
 
-def get_font(size: int, bold=False):
+@lru_cache(maxsize=256)
+def load_font(path: str, size: int):
+    """Fonts are parsed from disk once per (path, size) and shared afterwards"""
     try:
-        return ImageFont.truetype("arialbd.ttf" if bold else "arial.ttf", size)
+        return ImageFont.truetype(path, size)
     except:
-        return ImageFont.load_default()
+        # Pillow's bundled scalable font, so headline sizes still apply without Arial
+        return ImageFont.load_default(size)
+
+def get_font(size: int, bold=False):
+    return load_font("arialbd.ttf" if bold else "arial.ttf", size)
 
 
 # LAYOUT TEMPLATES 
@@ -145,7 +216,7 @@ LAYOUT_TEMPLATES = [
         "id": "bold_bottom",
         "name": "Bold Bottom",
         "product": {"x": 0.5, "y": 0.3, "w": 0.75, "h": 0.45},
-        "headline": {"x": 0.5, "y": 0.83, "align": "center"},
+        "headline": {"x": 0.5, "y": 0.83, "align": "center", "h": 0.12},  # clear of the CTA below
         "cta": {"x": 0.5, "y": 0.93, "align": "center"}
     },
     
@@ -196,6 +267,17 @@ LAYOUT_TEMPLATES = [
 
 ]
 
+# Built-ins plus LAYOUT_TEMPLATE_DIR, validated and compiled into render plans
+# for every platform size once, at startup
+template_index = TemplateIndex(load_templates(LAYOUT_TEMPLATES), PLATFORM_DIMENSIONS.values())
+LAYOUT_TEMPLATES = template_index.templates
+
+
+def warm_fonts() -> None:
+    """Parse every font size the render plans use, with the ASCII glyph advances for headline fitting"""
+    for font_size in template_index.font_sizes():
+        font_metrics(get_font(font_size, bold=True)).width(string.printable)
+
 
 # TEXT SANITIZATION
 
@@ -237,16 +319,12 @@ def extract_json_from_text(text: str):
         except:
             return None
 
-def generate_ad_copy(product_name: str, variation_idx: int):
-    if not product_name or product_name.strip() == "":
-        product_name = "this product"
-    
-    if client:
-        angles = ["Short & Punchy", "Emotional", "Urgent (FOMO)", "Luxury"]
-        angle = angles[variation_idx % len(angles)]
-        
-        system_prompt = "You are a creative ad copywriter. Output strictly JSON only."
-        user_prompt = f"""
+COPY_ANGLES = ["Short & Punchy", "Emotional", "Urgent (FOMO)", "Luxury"]
+COPY_SYSTEM_PROMPT = "You are a creative ad copywriter. Output strictly JSON only."
+
+
+def build_copy_prompt(product_name: str, angle: str) -> str:
+    return f"""
 You are a world-class ad copywriter for premium brands.
 
 Create a high-impact ad for this exact product:
@@ -263,100 +341,394 @@ Examples:
 
 Output ONLY valid JSON: {{"headline": "...", "cta": "..."}}
 """
-        
+
+
+def build_batch_copy_prompt(product_name: str, angles: list) -> str:
+    tones = "\n".join(f"{i + 1}. {angle}" for i, angle in enumerate(angles))
+    return f"""
+You are a world-class ad copywriter for premium brands.
+
+Create {len(angles)} high-impact ads for this exact product, one per tone, in this order:
+→ "{product_name}"
+
+Tones:
+{tones}
+
+Guidelines:
+- Headline: max 5 words, **DO NOT USE EMOJIS OR SYMBOLS** (PIL can't render them)
+- CTA: 2 words, action-driven
+
+Output ONLY valid JSON: {{"ads": [{{"headline": "...", "cta": "..."}}, ...]}}
+"""
+
+
+def copy_request(user_prompt: str, max_tokens: int = 350) -> dict:
+    """Chat-completion arguments shared by the sync and async clients"""
+    return dict(
+        model=AI_MODEL,
+        messages=[
+            {"role": "system", "content": COPY_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.7,
+        max_tokens=max_tokens,
+        top_p=1,
+        stream=False,
+        stop=None,
+    )
+
+
+def compliant(data):
+    """`data`, or None if its headline or CTA trips a compliance rule (so the fallback is used)"""
+    if data is None or not COPY_COMPLIANCE:
+        return data
+    headline, cta = scanner.scan_many([str(data["headline"]), str(data["cta"])])
+    if headline or cta:
+        rules = sorted({finding.rule for finding in headline + cta})
+        log(f"⚠️ [Compliance] Discarding copy that matched {', '.join(rules)}. Falling back.")
+        return None
+    return data
+
+
+def parse_copy(response_text: str):
+    data = extract_json_from_text(response_text)
+    if data and "headline" in data and "cta" in data:
+        return compliant(data)
+    return None
+
+
+def parse_batch_copy(response_text: str, n: int) -> list:
+    """List of n copy dicts (None where the model output was unusable or not compliant)"""
+    data = extract_json_from_text(response_text)
+    ads = data.get("ads") if isinstance(data, dict) else None
+    if not isinstance(ads, list):
+        return [None] * n
+    ads = [compliant(ad) if isinstance(ad, dict) and "headline" in ad and "cta" in ad else None for ad in ads[:n]]
+    return ads + [None] * (n - len(ads))
+
+
+def fallback_copy(product_name: str) -> dict:
+    # Fallback with sanitization
+    log("⚠️ [System] Using Offline Dictionary Fallback")
+    verbs = ["Discover", "Experience", "Unleash", "Elevate"]
+    adjectives = ["Pure", "Bold", "Timeless", "Ultimate"]
+    headline = f"{random.choice(verbs)} {random.choice(adjectives)} {product_name.title()}"
+    return {"headline": sanitize_headline(headline), "cta": "Shop Now"}
+
+
+def normalize_product_name(product_name: str) -> str:
+    if not product_name or product_name.strip() == "":
+        return "this product"
+    return product_name
+
+
+def generate_ad_copy(product_name: str, variation_idx: int):
+    product_name = normalize_product_name(product_name)
+    client = groq_clients()[0]
+    
+    if client:
+        angle = COPY_ANGLES[variation_idx % len(COPY_ANGLES)]
+        cached = copy_cache.get(product_name, angle)
+        if cached:
+            return cached
         try:
-            print(f"\n🧠 [Groq] Thinking about '{product_name}' with angle '{angle}'...")
-            completion = client.chat.completions.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=350,
-                top_p=1,
-                stream=False,
-                stop=None,
-            )
+            log(f"\n🧠 [Groq] Thinking about '{product_name}' with angle '{angle}'...")
+            with stage("llm"):
+                completion = client.chat.completions.create(**copy_request(build_copy_prompt(product_name, angle)))
             response_text = completion.choices[0].message.content
-            print(f"✅ [Groq] Raw Output: {response_text.strip()}")
-            data = extract_json_from_text(response_text)
-            if data and "headline" in data and "cta" in data:
+            log(f"✅ [Groq] Raw Output: {response_text.strip()}")
+            data = parse_copy(response_text)
+            if data:
+                copy_cache.put(product_name, angle, data)
                 return data
             else:
                 print("⚠️ [Groq] Output wasn't valid JSON. Falling back.")
         except Exception as e:
             print(f"❌ [Groq Error] {str(e)}")
 
-    # Fallback with sanitization
-    print("⚠️ [System] Using Offline Dictionary Fallback")
-    verbs = ["Discover", "Experience", "Unleash", "Elevate"]
-    adjectives = ["Pure", "Bold", "Timeless", "Ultimate"]
-    headline = f"{random.choice(verbs)} {random.choice(adjectives)} {product_name.title()}"
-    return {"headline": sanitize_headline(headline), "cta": "Shop Now"}
+    return fallback_copy(product_name)
+
+
+async def generate_ad_copy_async(product_name: str, variation_idx: int):
+    """Async version of generate_ad_copy; returns None instead of falling back"""
+    product_name = normalize_product_name(product_name)
+    async_client = groq_clients()[1]
+    if not async_client:
+        return None
+    angle = COPY_ANGLES[variation_idx % len(COPY_ANGLES)]
+    try:
+        log(f"\n🧠 [Groq] Thinking about '{product_name}' with angle '{angle}'...")
+        with stage("llm"):
+            completion = await async_client.chat.completions.create(**copy_request(build_copy_prompt(product_name, angle)))
+        response_text = completion.choices[0].message.content
+        log(f"✅ [Groq] Raw Output: {response_text.strip()}")
+        data = parse_copy(response_text)
+        if not data:
+            print("⚠️ [Groq] Output wasn't valid JSON. Falling back.")
+        return data
+    except Exception as e:
+        print(f"❌ [Groq Error] {str(e)}")
+        return None
+
+
+async def generate_ad_copy_batch(product_name: str, n: int) -> list:
+    """Ask for all n angles in a single JSON call; None entries need a fallback"""
+    product_name = normalize_product_name(product_name)
+    async_client = groq_clients()[1]
+    if not async_client:
+        return [None] * n
+    angles = [COPY_ANGLES[i % len(COPY_ANGLES)] for i in range(n)]
+    try:
+        log(f"\n🧠 [Groq] Thinking about '{product_name}' with {n} angles in one call...")
+        with stage("llm"):
+            completion = await async_client.chat.completions.create(
+                **copy_request(build_batch_copy_prompt(product_name, angles), max_tokens=200 + 150 * n)
+            )
+        response_text = completion.choices[0].message.content
+        log(f"✅ [Groq] Raw Output: {response_text.strip()}")
+        return parse_batch_copy(response_text, n)
+    except Exception as e:
+        print(f"❌ [Groq Error] {str(e)}")
+        return [None] * n
+
+
+class CopyPlanner:
+    """
+    Copy generation for one /generate-layout request.
+
+    Each variation's copy is requested concurrently (or once for all of them in
+    batch mode). Every call is bounded by GROQ_TIMEOUT and the request as a
+    whole by AD_COPY_DEADLINE, after which the offline fallback is used.
+
+    The requests are sent when the planner is created, so they overlap with
+    whatever the caller does before get() (decoding, background removal).
+    `variations` limits which indices are prefetched (all n by default).
+    """
+
+    def __init__(
+        self, product_name: str, n: int, mode: str = AD_COPY_MODE, deadline: float = AD_COPY_DEADLINE,
+        variations=None,
+    ):
+        self.product_name = normalize_product_name(product_name)
+        self.n = n
+        self.mode = mode
+        self._deadline = asyncio.get_running_loop().time() + deadline
+        self._batch = None
+        self._fetches = {}  # variation index -> task, in parallel mode
+        self.results = {}  # variation index -> copy returned by get()
+        if mode == "batch" and groq_clients()[1]:
+            # Only pay for the batch call if some angle isn't cached yet
+            self._cached = [copy_cache.get(self.product_name, self.angle(i)) for i in range(n)]
+            if not all(self._cached):
+                self._batch = asyncio.ensure_future(self._fetch_batch())
+        else:
+            for i in range(n) if variations is None else variations:
+                self._fetches[i] = asyncio.ensure_future(self._fetch(i))
+
+    @staticmethod
+    def angle(variation_idx: int) -> str:
+        return COPY_ANGLES[variation_idx % len(COPY_ANGLES)]
+
+    def _remaining(self) -> float:
+        return max(0.0, self._deadline - asyncio.get_running_loop().time())
+
+    async def _bounded(self, coro):
+        try:
+            return await asyncio.wait_for(coro, timeout=min(GROQ_TIMEOUT, self._remaining()))
+        except asyncio.TimeoutError:
+            print("⚠️ [Groq] Timed out. Falling back.")
+            return None
+
+    async def _fetch_batch(self) -> list:
+        ads = await self._bounded(generate_ad_copy_batch(self.product_name, self.n)) or [None] * self.n
+        for i, data in enumerate(ads):
+            if data:
+                await asyncio.to_thread(copy_cache.put, self.product_name, self.angle(i), data)
+        return ads
+
+    async def _fetch(self, variation_idx: int):
+        return await copy_cache.get_or_fetch(
+            self.product_name,
+            self.angle(variation_idx),
+            lambda: self._bounded(generate_ad_copy_async(self.product_name, variation_idx)),
+        )
+
+    async def get(self, variation_idx: int) -> dict:
+        if self.mode == "batch" and groq_clients()[1]:
+            data = self._cached[variation_idx]
+            if not data and self._batch is not None:
+                data = (await asyncio.shield(self._batch))[variation_idx]
+        else:
+            fetch = self._fetches.get(variation_idx)
+            if fetch is None:
+                fetch = self._fetches[variation_idx] = asyncio.ensure_future(self._fetch(variation_idx))
+            data = await asyncio.shield(fetch)
+        self.results[variation_idx] = data or fallback_copy(self.product_name)
+        return self.results[variation_idx]
+
+    def cancel(self) -> None:
+        """Stop copy requests still in flight (the request failed or was abandoned)"""
+        for task in [self._batch, *self._fetches.values()]:
+            if task is not None:
+                task.cancel()
 
 
 # RENDER ENGINE 
 
-def render_layout(template, product_img, logo_img, text_data, brand_colors, platform_size):
-    w, h = platform_size
-    primary_color = brand_colors["primary"]
-    text_color = brand_colors["text"]
+HEADLINE_FIT = os.getenv("HEADLINE_FIT", "auto")  # "auto" (fit the template's text box) or "wrap" (HEADLINE_WRAP characters per line)
+
+
+class PreparedAsset:
+    """
+    A decoded product/logo image, pre-reduced once per request to the largest
+    box any template needs. Resized copies are memoized by target box so
+    rendering many variations or platforms resizes each box only once.
+    """
+
+    def __init__(self, image, max_box: tuple):
+        self.image = image.copy() if image.width > max_box[0] or image.height > max_box[1] else image
+        self.image.thumbnail(max_box, Image.LANCZOS)
+        self.mode = self.image.mode
+        self._fitted = {}
+        self._lock = threading.Lock()
+
+    def fit(self, box: tuple):
+        fitted = self._fitted.get(box)
+        if fitted is None:
+            fitted = self.image.copy()
+            fitted.thumbnail(box, Image.LANCZOS)
+            with self._lock:
+                self._fitted[box] = fitted
+        return fitted
+
+    def __getstate__(self):
+        # Sent to process workers without the memo and lock
+        return {"image": self.image, "mode": self.mode}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fitted = {}
+        self._lock = threading.Lock()
+
+
+def fit_image(img, box: tuple):
+    """Copy of `img` scaled to fit `box`, memoized when `img` is a PreparedAsset"""
+    if isinstance(img, PreparedAsset):
+        return img.fit(box)
+    img_copy = img.copy()
+    img_copy.thumbnail(box, Image.LANCZOS)
+    return img_copy
+
+
+def product_box(template, platform_size) -> tuple:
+    return template_index.plan(template, platform_size).product.box
+
+
+def logo_box(platform_size) -> tuple:
+    logo_size = int(platform_size[0] * LOGO_SCALE)
+    return logo_size, logo_size
+
+
+def max_product_box(templates, platform_sizes) -> tuple:
+    boxes = [product_box(t, size) for t in templates for size in platform_sizes]
+    return max(b[0] for b in boxes), max(b[1] for b in boxes)
+
+
+def max_logo_box(platform_sizes) -> tuple:
+    return max(logo_box(size) for size in platform_sizes)
+
+
+def headline_font(size: int):
+    return get_font(size, bold=True)
+
+
+@lru_cache(maxsize=1024)
+def headline_layout(headline: str, plan: TextPlan) -> tuple:
+    """Sanitized headline with its line breaks, and the font size to draw it at"""
+    text = sanitize_headline(headline)
+    if HEADLINE_FIT == "wrap":
+        return textwrap.fill(text, width=HEADLINE_WRAP), plan.font_size
+    return fit_text(text, plan.box, plan.font_size, plan.min_font_size, headline_font)
+
+
+@lru_cache(maxsize=256)
+def headline_mask(text: str, font_size: int, align: str):
+    """
+    Headline coverage rasterized once into an "L" mask, reused for both the
+    drop shadow and the text. Returns (mask, offset of its top-left from the
+    text anchor point).
+    """
+    font = get_font(font_size, bold=True)
+    anchor = "mm" if align == "center" else "lm"
+    probe = ImageDraw.Draw(Image.new("L", (1, 1)))
+    left, top, right, bottom = probe.multiline_textbbox((0, 0), text, font=font, anchor=anchor, align=align)
+    # Whole pixels, with a pixel of room for antialiasing
+    left, top, right, bottom = math.floor(left) - 1, math.floor(top) - 1, math.ceil(right) + 1, math.ceil(bottom) + 1
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).multiline_text((-left, -top), text, fill=255, font=font, anchor=anchor, align=align)
+    return mask, (left, top)
+
+
+@lru_cache(maxsize=256)
+def cta_button(text: str, font_size: int, pad_w: int, pad_h: int, fill: tuple, text_fill: tuple):
+    """CTA button (rectangle + label) rasterized once as an opaque RGB tile"""
+    font = get_font(font_size, bold=True)
+    probe = ImageDraw.Draw(Image.new("L", (1, 1)))
+    left, top, right, bottom = probe.textbbox((0, 0), text, font=font)
+    btn_w = (right - left) + pad_w
+    btn_h = (bottom - top) + pad_h
+    tile = Image.new("RGB", (btn_w + 1, 2 * (btn_h // 2) + 1), fill)
+    ImageDraw.Draw(tile).text((btn_w // 2, btn_h // 2), text, fill=text_fill, font=font, anchor="mm")
+    return tile
+
+
+def render_base(template, product_img, primary_color, platform_size):
+    """Background and product: the layers that don't depend on copy or text colour"""
+    plan = template_index.plan(template, platform_size)
     
     # Create canvas with brand background
-    canvas = Image.new("RGB", (w, h), primary_color[:3])
-    draw = ImageDraw.Draw(canvas)
+    canvas = Image.new("RGB", plan.size, primary_color[:3])
 
     # Product Placement
-    p_conf = template["product"]
-    target_w = int(w * p_conf["w"])
-    target_h = int(h * p_conf["h"])
-    product_copy = product_img.copy()
-    product_copy.thumbnail((target_w, target_h), Image.LANCZOS)
-    dest_x = int(w * p_conf["x"] - product_copy.width / 2)
-    dest_y = int(h * p_conf["y"] - product_copy.height / 2)
+    product_copy = fit_image(product_img, plan.product.box)
+    dest = plan.product.origin(product_copy.size)
     if product_copy.mode in ("RGBA", "LA"):
-        canvas.paste(product_copy, (dest_x, dest_y), product_copy)
+        canvas.paste(product_copy, dest, product_copy)
     else:
-        canvas.paste(product_copy, (dest_x, dest_y))
+        canvas.paste(product_copy, dest)
+    return canvas
 
-    # Headline (SANITIZED)
-    cleaned_headline = sanitize_headline(text_data["headline"])
-    wrapped_text = textwrap.fill(cleaned_headline, width=18)
-    
-    h_conf = template["headline"]
-    font_size = max(48, int(w * 0.06))
-    font = get_font(font_size, bold=True)
-    tx = int(w * h_conf["x"])
-    ty = int(h * h_conf["y"])
-    anchor = "mm" if h_conf["align"] == "center" else "lm"
+
+def render_overlays(canvas, template, logo_img, text_data, brand_colors, platform_size):
+    """Headline, CTA and logo, composited in place onto a base canvas"""
+    plan = template_index.plan(template, platform_size)
+    primary_color = brand_colors["primary"]
+    text_color = brand_colors["text"]
+
+    # Headline (SANITIZED), fitted to the template's text box
+    hp = plan.headline
+    wrapped_text, font_size = headline_layout(text_data["headline"], hp)
+    mask, (off_x, off_y) = headline_mask(wrapped_text, font_size, hp.align)
     
     # Text shadow for readability
-    draw.multiline_text((tx+2, ty+2), wrapped_text, fill=(0,0,0), font=font, anchor=anchor, align=h_conf["align"])
-    draw.multiline_text((tx, ty), wrapped_text, fill=text_color[:3], font=font, anchor=anchor, align=h_conf["align"])
+    canvas.paste((0, 0, 0), (hp.x + off_x + 2, hp.y + off_y + 2), mask)
+    canvas.paste(text_color[:3], (hp.x + off_x, hp.y + off_y), mask)
 
     # CTA Button
-    c_conf = template["cta"]
-    cta_font_size = max(32, int(w * 0.04))
-    cta_font = get_font(cta_font_size, bold=True)
-    cta_text = text_data["cta"].upper()
-    left, top, right, bottom = draw.textbbox((0, 0), cta_text, font=cta_font)
-    btn_w = (right - left) + int(w * 0.08)
-    btn_h = (bottom - top) + int(h * 0.04)
-    cx = int(w * c_conf["x"])
-    cy = int(h * c_conf["y"])
-    cx_rect = cx - (btn_w // 2) if c_conf["align"] == "center" else cx
-    draw.rectangle([cx_rect, cy - btn_h//2, cx_rect + btn_w, cy + btn_h//2], fill=text_color[:3])
-    cx_text = cx if c_conf["align"] == "center" else cx + (btn_w // 2)
-    draw.text((cx_text, cy), cta_text, fill=primary_color[:3], font=cta_font, anchor="mm")
+    cp = plan.cta
+    button = cta_button(
+        text_data["cta"].upper(), cp.font_size, cp.pad_w, cp.pad_h,
+        tuple(text_color[:3]), tuple(primary_color[:3])
+    )
+    btn_w = button.width - 1
+    cx_rect = cp.x - (btn_w // 2) if cp.align == "center" else cp.x
+    canvas.paste(button, (cx_rect, cp.y - button.height // 2))
 
     # Logo (top-right)
     if logo_img:
-        logo_size = int(w * 0.12)
-        logo_copy = logo_img.copy()
-        logo_copy.thumbnail((logo_size, logo_size), Image.LANCZOS)
-        lx = w - logo_copy.width - int(w * 0.04)
-        ly = int(h * 0.04)
+        logo_copy = fit_image(logo_img, plan.logo_box)
+        lx = plan.size[0] - logo_copy.width - plan.logo_margin[0]
+        ly = plan.logo_margin[1]
         if logo_copy.mode in ("RGBA", "LA"):
             logo_rgb = Image.new("RGB", logo_copy.size, primary_color[:3])
             logo_rgb.paste(logo_copy, mask=logo_copy.split()[-1])
@@ -367,55 +739,418 @@ def render_layout(template, product_img, logo_img, text_data, brand_colors, plat
     return canvas
 
 
+def render_layout(template, product_img, logo_img, text_data, brand_colors, platform_size):
+    canvas = render_base(template, product_img, brand_colors["primary"], platform_size)
+    return render_overlays(canvas, template, logo_img, text_data, brand_colors, platform_size)
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    with stage("upload_read"):
+        return await file.read()
+
+
+def decode_rgba(data: bytes):
+    return Image.open(BytesIO(data)).convert("RGBA")
+
+
+def check_upload(file: UploadFile, max_box: tuple = None) -> ImageInfo:
+    """Sniff and size-check an upload from its header (400/413 before anything is decoded)"""
+    return pixel_budget.check(read_header(file.file), max_box)
+
+
+def upload_cost(uploads) -> int:
+    """Estimated memory for decoding (ImageInfo, max_box) pairs"""
+    return sum(pixel_budget.memory_cost(info, box) for info, box in uploads)
+
+
+def decode_prepared(data: bytes, max_box: tuple) -> PreparedAsset:
+    """Decode an upload straight into a PreparedAsset (JPEG decodes at reduced scale)"""
+    with stage("decode"):
+        img = pixel_budget.decode(data, "RGBA", box=max_box)
+    return PreparedAsset(img, max_box)
+
+
+def render_variation(template, product_img, logo_img, text_data, brand_colors, platform_size,
+                     encoding: EncodeSettings = EncodeSettings()) -> tuple:
+    """
+    Render and encode one variation (runs in the render pool, so the encodes
+    of all variations proceed in parallel). Returns (encoded bytes, encode stats).
+    """
+    with stage("render"):
+        final_img = render_layout(template, product_img, logo_img, text_data, brand_colors, platform_size)
+    data, encode_ms = encode_image(final_img, encoding)
+    return data, {"format": encoding.format, "bytes": len(data), "encode_ms": encode_ms}
+
+
+def resolve_platforms(platforms: str) -> list:
+    """Parse a comma-separated platform list (or "all")"""
+    if platforms.strip().lower() == "all":
+        return list(PLATFORM_DIMENSIONS)
+    names = [p.strip() for p in platforms.split(",") if p.strip()]
+    unknown = [p for p in names if p not in PLATFORM_DIMENSIONS]
+    if unknown or not names:
+        raise ValueError(
+            f"Unknown platform(s): {', '.join(unknown) or '(none)'}. Allowed: all, {', '.join(PLATFORM_DIMENSIONS)}"
+        )
+    return list(dict.fromkeys(names))
+
+
+def resolve_targets(platform: str, platforms: str = None) -> dict:
+    """Platform name -> canvas size for this request (raises ValueError on unknown names)"""
+    if platforms:
+        return {name: PLATFORM_DIMENSIONS[name] for name in resolve_platforms(platforms)}
+    return {platform: PLATFORM_DIMENSIONS.get(platform, (1080, 1080))}
+
+
+async def render_grid(request, templates, planner, product_img, logo_img, colors, sizes, encoding, response_mode):
+    """
+    Render every (template x size) pair, yielding (template index, size,
+    image reference, encode stats) as each one finishes. Each template's copy
+    is fetched once and shared by all of its sizes.
+    """
+    copies = [asyncio.ensure_future(planner.get(i)) for i in range(len(templates))]
+
+    async def build(i, size):
+        copy = await copies[i]
+        data, stats = await render_pool.run(
+            render_variation, templates[i], product_img, logo_img, copy, colors, size, encoding
+        )
+        return i, size, await publish(result_store, request, data, encoding.media_type, response_mode), stats
+
+    tasks = [asyncio.create_task(build(i, size)) for i in range(len(templates)) for size in sizes]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks + copies:
+            task.cancel()
+        planner.cancel()
+
+
+def group_variations(templates, targets: dict, rendered: dict) -> tuple:
+    """Group {(template index, size): (ref, stats)} by platform: (refs, encode stats)"""
+    grouped = {
+        name: [rendered[(i, size)][0] for i in range(len(templates))]
+        for name, size in targets.items()
+    }
+    encode_stats = {
+        name: [dict(rendered[(i, size)][1], template=t["id"]) for i, t in enumerate(templates)]
+        for name, size in targets.items()
+    }
+    return grouped, encode_stats
+
+
 # ENDPOINT
 
 @app.post("/generate-layout")
 async def generate_layout(
-    product_image: UploadFile = File(...),
+    request: Request,
+    product_image: UploadFile = File(None),
     logo_image: UploadFile = File(None),
     product_name: str = Form(""),
     primary_color: str = Form("#ffffff"),
     text_color: str = Form("#000000"),
     platform: str = Form("instagram_story"),
-    num_variations: int = Form(3)
+    num_variations: int = Form(3),
+    copy_mode: str = Form(AD_COPY_MODE),
+    platforms: str = Form(None),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    lossless: bool = Form(False),
+    response_mode: str = Form(RESPONSE_MODE),
+    asset_handle: str = Form(None),
+    align: str = Form(None)
 ):
-    print(f"\n✅ INPUTS: product='{product_name}', primary='{primary_color}', text='{text_color}'")
+    """
+    Render layout variations for one platform, or for several at once.
+
+    With `platforms` (comma-separated names or "all") the uploads are decoded
+    once, each template's copy is reused across sizes, and the response is
+    grouped by platform: {"platforms": {name: [URLs]}, "templates": [ids]}.
+    Otherwise the single `platform` is rendered and returned as {"variations": [...]}.
+
+    `output_format` (png, webp, jpeg), `quality`, `compress_level` and `lossless`
+    control encoding; encode time and bytes per variation are returned in "encoding".
+    Images are returned as URLs into the result store, or inline with
+    `response_mode=data_url`.
+
+    An `asset_handle` from POST /assets can be sent instead of the uploads; the
+    copy chosen per template is then remembered for /re-render.
+
+    Templates are drawn from those supporting every requested aspect ratio,
+    optionally only with headline `align` (left or center).
+    """
+    log(f"\n✅ INPUTS: product='{product_name}', primary='{primary_color}', text='{text_color}'")
+    
+    try:
+        encoding = resolve_encoding(output_format, quality, compress_level, lossless)
+        response_mode = validate_response_mode(response_mode)
+        targets = resolve_targets(platform, platforms)
+        # Platforms sharing dimensions get the same render
+        sizes = sorted(set(targets.values()))
+        templates = template_index.select(num_variations, sizes, align)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    entry = None
+    if asset_handle:
+        entry = asset_store.get(asset_handle)
+        if entry is None:
+            return JSONResponse(status_code=404, content={"detail": "Unknown or expired asset handle"})
+        product_name = product_name or entry.product_name
+    elif not product_image:
+        return JSONResponse(status_code=400, content={"detail": "product_image or asset_handle is required"})
+    uploads = []
+    if not entry:
+        product_box, logo_box = max_product_box(templates, sizes), max_logo_box(sizes)
+        uploads.append((check_upload(product_image, product_box), product_box))
+        if logo_image:
+            uploads.append((check_upload(logo_image, logo_box), logo_box))
     
     try:
-        product_img = Image.open(BytesIO(await product_image.read())).convert("RGBA")
+        async with workers.admit(), memory_budget.reserve(upload_cost(uploads)):
+            colors = {
+                "primary": parse_color(primary_color),
+                "text": parse_color(text_color)
+            }
+
+            log(f"✅ Selected templates: {[t['id'] for t in templates]}")
+
+            if entry:
+                product_img, logo_img = entry.product, entry.logo
+            else:
+                # Decode once, pre-reduced to the largest box any selected template needs on any size
+                product_img = await workers.run(decode_prepared, await read_upload(product_image), product_box)
+                logo_img = None
+                if logo_image:
+                    logo_img = await workers.run(decode_prepared, await read_upload(logo_image), logo_box)
+
+            # Copy for every variation is requested concurrently; each template
+            # starts rendering as soon as its own copy arrives
+            planner = CopyPlanner(product_name, len(templates), mode=copy_mode)
+
+            rendered = {}
+            async for i, size, ref, stats in render_grid(
+                request, templates, planner, product_img, logo_img, colors, sizes, encoding, response_mode
+            ):
+                rendered[(i, size)] = (ref, stats)
+            grouped, encode_stats = group_variations(templates, targets, rendered)
+
+            extra = {}
+            if entry:
+                entry.copies.update({t["id"]: planner.results[i] for i, t in enumerate(templates)})
+                extra["asset_handle"] = asset_handle
+            if not platforms:
+                return JSONResponse(content={
+                    "variations": grouped[platform],
+                    "encoding": encode_stats[platform],
+                    **extra
+                })
+            return JSONResponse(content={
+                "platforms": grouped,
+                "templates": [t["id"] for t in templates],
+                "encoding": encode_stats,
+                **extra
+            })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+def rerender_variation(entry: AssetEntry, template, text_data, brand_colors, platform_size,
+                       encoding: EncodeSettings = EncodeSettings()) -> tuple:
+    """
+    Re-render one variation from a handle (runs in the thread pool so the
+    entry's memoized layers are reused). The background + product layer is
+    cached per (template, size, primary colour); only overlays are redrawn.
+    """
+    with stage("render"):
+        base = entry.layer(
+            (template["id"], platform_size, tuple(brand_colors["primary"][:3])),
+            lambda: render_base(template, entry.product, brand_colors["primary"], platform_size)
+        )
+        final_img = render_overlays(base.copy(), template, entry.logo, text_data, brand_colors, platform_size)
+    data, encode_ms = encode_image(final_img, encoding)
+    return data, {"format": encoding.format, "bytes": len(data), "encode_ms": encode_ms}
+
+
+@app.post("/assets")
+async def upload_assets(
+    product_image: UploadFile = File(...),
+    logo_image: UploadFile = File(None),
+    product_name: str = Form("")
+):
+    """
+    Decode the product (and logo) once and return a handle for /generate-layout
+    and /re-render. Assets are pre-reduced for every template and platform.
+    """
+    sizes = list(PLATFORM_DIMENSIONS.values())
+    product_box, logo_box = max_product_box(LAYOUT_TEMPLATES, sizes), max_logo_box(sizes)
+    uploads = [(check_upload(product_image, product_box), product_box)]
+    if logo_image:
+        uploads.append((check_upload(logo_image, logo_box), logo_box))
+    async with workers.admit(), memory_budget.reserve(upload_cost(uploads)):
+        product_img = await workers.run(decode_prepared, await read_upload(product_image), product_box)
         logo_img = None
         if logo_image:
-            logo_img = Image.open(BytesIO(await logo_image.read())).convert("RGBA")
+            logo_img = await workers.run(decode_prepared, await read_upload(logo_image), logo_box)
+    handle = asset_store.add(AssetEntry(product_img, logo_img, product_name))
+    return {
+        "asset_handle": handle,
+        "product_size": {"width": product_img.image.width, "height": product_img.image.height},
+        "expires_in": asset_store.ttl
+    }
 
-        colors = {
-            "primary": parse_color(primary_color),
-            "text": parse_color(text_color)
-        }
-        size = PLATFORM_DIMENSIONS.get(platform, (1080, 1080))
 
-        templates = random.sample(LAYOUT_TEMPLATES, min(num_variations, len(LAYOUT_TEMPLATES)))
-        print(f"✅ Selected templates: {[t['id'] for t in templates]}")
+@app.post("/re-render")
+async def re_render(
+    request: Request,
+    asset_handle: str = Form(...),
+    template_id: str = Form(...),
+    platform: str = Form("instagram_story"),
+    primary_color: str = Form("#ffffff"),
+    text_color: str = Form("#000000"),
+    headline: str = Form(None),
+    cta: str = Form(None),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    lossless: bool = Form(False),
+    response_mode: str = Form(RESPONSE_MODE)
+):
+    """
+    Re-render one template from an asset handle after a tweak.
 
-        variations = []
-        for i, template in enumerate(templates):
-            copy = generate_ad_copy(product_name, i)
-            final_img = render_layout(template, product_img, logo_img, copy, colors, size)
-            
-            buf = BytesIO()
-            final_img.save(buf, format="PNG")
-            img_str = base64.b64encode(buf.getvalue()).decode("utf-8")
-            variations.append(f"data:image/png;base64,{img_str}")
+    Nothing is re-uploaded or re-decoded. The copy previously used for this
+    template is reused (edited `headline`/`cta` replace and are remembered),
+    and the LLM is only called for templates that have no copy yet.
+    """
+    template = template_index.get(template_id)
+    if template is None:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown template_id '{template_id}'"})
+    try:
+        encoding = resolve_encoding(output_format, quality, compress_level, lossless)
+        response_mode = validate_response_mode(response_mode)
+        size = resolve_targets(platform)[platform]
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    entry = asset_store.get(asset_handle)
+    if entry is None:
+        return JSONResponse(status_code=404, content={"detail": "Unknown or expired asset handle"})
 
-        return JSONResponse(content={"variations": variations})
+    try:
+        async with workers.admit():
+            copy = entry.copies.get(template_id)
+            if copy is None:
+                idx = LAYOUT_TEMPLATES.index(template)
+                copy = await CopyPlanner(entry.product_name, idx + 1, mode="parallel", variations=[idx]).get(idx)
+            copy = dict(copy)
+            if headline is not None:
+                copy["headline"] = headline
+            if cta is not None:
+                copy["cta"] = cta
+            entry.copies[template_id] = copy
 
+            colors = {
+                "primary": parse_color(primary_color),
+                "text": parse_color(text_color)
+            }
+            data, stats = await workers.run(rerender_variation, entry, template, copy, colors, size, encoding)
+            return JSONResponse(content={
+                "image": await publish(result_store, request, data, encoding.media_type, response_mode),
+                "template": template_id,
+                "platform": platform,
+                "copy": copy,
+                "encoding": stats
+            })
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+
+async def warm_render_pool():
+    # Fonts first, so forked render workers inherit the parsed fonts
+    await asyncio.to_thread(warm_fonts)
+    await render_pool.warm_up()
+
+@app.on_event("startup")
+async def start_result_gc():
+    app.state.result_gc = asyncio.create_task(result_store.gc_loop())
+
+@app.on_event("startup")
+async def warm_up():
+    """Warm fonts, the render pool and the LLM client in the background (see /ready)"""
+    startup.begin(render=warm_render_pool, llm_client=lambda: asyncio.to_thread(warm_llm_client))
+
+@app.on_event("shutdown")
+def stop_workers():
+    app.state.result_gc.cancel()
+    startup.cancel()
+    workers.shutdown()
+    render_pool.shutdown()
+
+@app.get("/templates")
+async def list_templates(platform: str = None, align: str = None):
+    """Available layout templates, optionally only those usable for `platform` / with `align`"""
+    try:
+        sizes = [PLATFORM_DIMENSIONS[platform]] if platform else []
+        templates = template_index.candidates(sizes, align)
+    except (KeyError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"detail": f"Invalid filter: {e}"})
+    return {
+        "templates": [
+            {"id": t["id"], "name": t["name"], "aspects": t["aspects"], "align": t["headline"]["align"]}
+            for t in templates
+        ]
+    }
+
+@app.get("/ad-copy/alternatives")
+async def ad_copy_alternatives(product_name: str = "", angle: str = COPY_ANGLES[0], count: int = 5):
+    """Cached copy alternatives for a product and angle (no LLM call)"""
+    items = copy_cache.lookup(normalize_product_name(product_name), angle, count=count)
+    return {"product_name": product_name, "angle": angle, "alternatives": items}
+
+@app.post("/compliance/scan")
+async def compliance_scan(texts: list[str] = Body(..., embed=True)):
+    """
+    Scan many texts for sensitive data in one pass. Body: {"texts": [...]}.
+    Each result lists the matches as {"rule", "start", "end"}; "rules" maps
+    rule ids to their warning messages.
+    """
+    if len(texts) > COMPLIANCE_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"Too many texts. Maximum: {COMPLIANCE_MAX_TEXTS}")
+    if sum(map(len, texts)) > COMPLIANCE_MAX_CHARS:
+        raise HTTPException(status_code=413, detail=f"Texts too long. Maximum: {COMPLIANCE_MAX_CHARS} characters in total")
+    async with workers.admit():
+        with stage("compliance"):
+            results = await workers.run(scanner.scan_many, texts)
+    return {
+        "results": [{"flagged": bool(findings), "findings": [f.as_dict() for f in findings]} for findings in results],
+        "flagged": sum(1 for findings in results if findings),
+        "rules": {rule.id: rule.message for rule in scanner.rules.values()}
+    }
+
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok" if startup.ready else startup.state,
+        "startup": startup.status(),
+        "workers": workers.stats(),
+        "render_pool": render_pool.stats(),
+        "result_store": result_store.stats(),
+        "asset_store": asset_store.stats(),
+        "templates": template_index.stats(),
+        "copy_cache": copy_cache.stats(),
+        "pixel_budget": pixel_budget.stats(),
+        "compliance": scanner.stats(),
+        "memory_budget": memory_budget.stats()
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,105 @@
+"""
+Server-side asset handles for incremental layout re-renders.
+
+Changing only a colour, the headline or the platform used to mean calling
+/generate-layout again: re-uploading and re-decoding the product and logo,
+calling the LLM and re-rendering every layer. `POST /assets` decodes the
+uploads once into pre-reduced PreparedAssets and returns a handle. Each entry
+also remembers the copy chosen per template and a few rendered base layers
+(background + product), so a re-render only composites what changed.
+
+Entries live in a bounded in-memory LRU and expire ASSET_STORE_TTL seconds
+after their last use.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Configuration
+
+ASSET_STORE_MAX_ITEMS = int(os.getenv("ASSET_STORE_MAX_ITEMS", "32"))
+ASSET_STORE_TTL = float(os.getenv("ASSET_STORE_TTL", "1800"))  # seconds since last use
+ASSET_LAYER_CACHE_SIZE = int(os.getenv("ASSET_LAYER_CACHE_SIZE", "4"))  # base layers kept per handle
+
+
+class AssetEntry:
+    """Decoded assets behind one handle, plus the copy and base layers derived from them"""
+
+    def __init__(self, product, logo=None, product_name: str = "", layer_cache_size: int = ASSET_LAYER_CACHE_SIZE):
+        self.product = product
+        self.logo = logo
+        self.product_name = product_name
+        self.copies = {}  # template id -> {"headline", "cta"}
+        self.layer_cache_size = layer_cache_size
+        self._layers = OrderedDict()
+        self._lock = threading.Lock()
+        self.layer_hits = 0
+        self.layer_misses = 0
+
+    def layer(self, key, build):
+        """Memoized `build()` result for `key` (least recently used layers are dropped)"""
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is not None:
+                self._layers.move_to_end(key)
+                self.layer_hits += 1
+                return layer
+            self.layer_misses += 1
+        layer = build()
+        with self._lock:
+            self._layers[key] = layer
+            while len(self._layers) > self.layer_cache_size:
+                self._layers.popitem(last=False)
+        return layer
+
+
+class AssetStore:
+    """Bounded TTL'd LRU of AssetEntry objects keyed by opaque handles"""
+
+    def __init__(self, max_items: int = ASSET_STORE_MAX_ITEMS, ttl: float = ASSET_STORE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict()  # handle -> (expires_at, entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def add(self, entry: AssetEntry) -> str:
+        handle = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            # Oldest-used entries sit at the front, so expired ones are dropped from there
+            while self._entries and next(iter(self._entries.values()))[0] <= now:
+                self._entries.popitem(last=False)
+            self._entries[handle] = (now + self.ttl, entry)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        return handle
+
+    def get(self, handle: str):
+        """The entry for `handle` (refreshing its TTL), or None if unknown or expired"""
+        now = time.time()
+        with self._lock:
+            item = self._entries.pop(handle, None)
+            if item is None or item[0] <= now:
+                self.misses += 1
+                return None
+            self._entries[handle] = (now + self.ttl, item[1])
+            self.hits += 1
+            return item[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "handles": len(self._entries),
+                "max_handles": self.max_items,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+            }
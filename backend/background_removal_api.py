@@ -1,11 +1,21 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from rembg import remove
 from PIL import Image
+from session_pool import get_pool, preload, pool_stats, remove, resolve_model, SUPPORTED_MODELS
+from batch_inference import remove_batch, remove_low_res, mask_from_bytes, BATCH_CHUNK_SIZE, MASK_INFERENCE_MAX_SIDE
+from result_cache import ResultCache, cache_key
+from workers import WorkerPool
+from encoding import EncodeSettings, encode_image, resolve_encoding
+from result_store import LocalResultStore, RESPONSE_MODE, publish, result_routes, validate_response_mode
+from metrics import TimingMiddleware, metrics_routes, stage
+from image_limits import DOWNSCALE_ON_DECODE, MAX_IMAGE_MEGAPIXELS, ImageInfo, PixelBudget, memory_budget, read_header
+from startup import Startup, health_routes
+import asyncio
 import io
-import base64
+import json
 import uuid
+from contextlib import AsyncExitStack
 from datetime import datetime
 import os
 
@@ -22,22 +32,41 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage timings: Server-Timing on every response, histograms at /metrics
+app.add_middleware(TimingMiddleware, service="bg-removal")
+app.include_router(metrics_routes())
+
+# Models load in the background after startup; /ready reports when they can serve
+startup = Startup("bg-removal")
+app.include_router(health_routes(startup))
+
 # Configuration
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+BG_MAX_MEGAPIXELS = float(os.getenv("BG_MAX_MEGAPIXELS", str(MAX_IMAGE_MEGAPIXELS)))
+BG_DOWNSCALE_ON_DECODE = os.getenv("BG_DOWNSCALE_ON_DECODE", "1" if DOWNSCALE_ON_DECODE else "0") == "1"
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "10"))
+MAX_STREAM_FILES = int(os.getenv("MAX_STREAM_FILES", "1000"))
+STREAM_CHUNKS_IN_FLIGHT = int(os.getenv("STREAM_CHUNKS_IN_FLIGHT", "2"))  # bounds memory of streaming batches
+BATCH_ENCODING = EncodeSettings("png")  # batch cutouts: the single endpoint's default, so results are shared
 
-def validate_image(file: UploadFile) -> None:
-    """Validate uploaded image file"""
-    # Check file extension
-    ext = file.filename.split('.')[-1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
-        )
-    
+# Decode, inference and encode run here, never on the event loop
+workers = WorkerPool("bg-removal")
+
+# Uploads are checked against this from their header, before decoding
+pixel_budget = PixelBudget(BG_MAX_MEGAPIXELS, BG_DOWNSCALE_ON_DECODE)
+
+# Finished results keyed by input hash + model/options
+result_cache = ResultCache()
+
+# JSON responses reference outputs by URL into this store
+result_store = LocalResultStore()
+app.include_router(result_routes(result_store))
+
+def validate_image(file: UploadFile) -> ImageInfo:
+    """Validate an uploaded image from its size and header, without decoding it"""
     # Check file size
     file.file.seek(0, 2)
     size = file.file.tell()
@@ -48,140 +77,371 @@ def validate_image(file: UploadFile) -> None:
             status_code=400,
             detail=f"File too large. Max size: {MAX_FILE_SIZE / 1024 / 1024}MB"
         )
+    
+    # Sniff the real format and check the dimensions (the extension is not trusted)
+    return pixel_budget.check(read_header(file.file))
+
+def validate_model(model: str) -> str:
+    """Validate the requested rembg model"""
+    try:
+        return resolve_model(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def remove_with_pool(image: Image.Image, model: str) -> Image.Image:
+    """Run rembg with a pooled, pre-loaded session"""
+    with get_pool(model).session() as session:
+        return remove(image, session=session)
+
+def decode_image(contents: bytes) -> Image.Image:
+    """Decode an upload into an RGB image"""
+    with stage("decode"):
+        # Within the pixel budget, downscaled while decoding if that's enabled
+        return pixel_budget.decode(contents, "RGB")
+
+def encode_png(image: Image.Image) -> tuple:
+    """PNG-encode an image, returning the bytes and its size"""
+    with stage("encode"):
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG")
+    return buffered.getvalue(), image.size
+
+def process_image(contents: bytes, model: str, low_res: bool = False, encoding: EncodeSettings = EncodeSettings("png")) -> tuple:
+    """
+    Decode, remove background and encode one image (runs in the worker pool).
+    Returns (bytes, size, encode time in ms).
+    """
+    input_image = decode_image(contents)
+    
+    # Remove background using a pooled rembg session
+    with stage("inference"):
+        if low_res:
+            output_image = remove_low_res(input_image, model)
+        else:
+            output_image = remove_with_pool(input_image, model)
+    data, encode_ms = encode_image(output_image, encoding)
+    return data, output_image.size, encode_ms
+
+def cutout_cache_key(contents: bytes, model: str, low_res: bool, encoding: EncodeSettings) -> str:
+    """Result cache key for a cutout, the same for the single and batch endpoints"""
+    return cache_key(contents, model=model, low_res=low_res, **encoding.cache_options())
+
+def process_mask(contents: bytes, model: str, mask_format: str) -> tuple:
+    """Infer the alpha mask from a reduced decode and encode it (runs in the worker pool)"""
+    with stage("inference"):
+        mask = mask_from_bytes(contents, model)
+    if mask_format == "raw":
+        return mask.tobytes(), mask.size
+    return encode_png(mask)
+
+def remove_batch_safe(images: list, model: str) -> list:
+    """Batched removal; a failure of the whole batch is reported for every image"""
+    try:
+        with stage("inference"):
+            return remove_batch(images, model)
+    except Exception as e:
+        return [e] * len(images)
+
+@app.on_event("startup")
+async def load_models():
+    """Create and warm up the session pools in the background (see /ready)"""
+    startup.begin(models=lambda: workers.run(preload))
+
+@app.on_event("startup")
+async def start_result_gc():
+    app.state.result_gc = asyncio.create_task(result_store.gc_loop())
+
+@app.on_event("shutdown")
+def stop_workers():
+    app.state.result_gc.cancel()
+    startup.cancel()
+    workers.shutdown()
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {
         "service": "CreativeGen Background Removal API",
-        "status": "operational",
-        "version": "1.0.0"
+        "status": "operational" if startup.ready else startup.state,
+        "version": "1.0.0",
+        "models": list(SUPPORTED_MODELS),
+        "session_pools": pool_stats(),
+        "workers": workers.stats(),
+        "cache": result_cache.stats(),
+        "result_store": result_store.stats(),
+        "pixel_budget": pixel_budget.stats(),
+        "memory_budget": memory_budget.stats(),
+        "startup": startup.status()
     }
 
 @app.post("/api/remove-background")
 async def remove_background(
+    request: Request,
     file: UploadFile = File(...),
-    return_format: str = "png"
+    return_format: str = "png",
+    model: str = None,
+    low_res: bool = False,
+    output_format: str = "png",
+    quality: int = None,
+    compress_level: int = None,
+    lossless: bool = False
 ):
     """
     Remove background from uploaded image
     
     Parameters:
     - file: Image file (PNG, JPG, JPEG, WEBP)
-    - return_format: Output format ('png' or 'base64')
+    - return_format: Response type ('png' for the raw image, or JSON with a result store
+      'url' or an inline 'base64' data URL)
+    - model: rembg model (u2net, u2netp, isnet, silueta); defaults to REMBG_MODEL
+    - low_res: Infer the mask on a downscaled copy and apply it to the full-size image
+    - output_format: Image encoding ('png' or 'webp'; both keep alpha)
+    - quality: WebP quality (1-100); compress_level: PNG zlib level (0-9); lossless: lossless WebP
     
     Returns:
-    - PNG image with transparent background or base64 encoded string
+    - Image with transparent background or base64 encoded string
     """
+    model = validate_model(model)
+    try:
+        encoding = resolve_encoding(output_format, quality, compress_level, lossless, allowed=("png", "webp"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         # Validate input
-        validate_image(file)
+        info = validate_image(file)
         
         # Read uploaded file
-        contents = await file.read()
-        input_image = Image.open(io.BytesIO(contents))
-        
-        # Convert to RGB if necessary
-        if input_image.mode != 'RGB':
-            input_image = input_image.convert('RGB')
+        with stage("upload_read"):
+            contents = await file.read()
         
-        # Remove background using rembg
-        output_image = remove(input_image)
+        # A cache hit skips decoding and inference entirely
+        key = cutout_cache_key(contents, model, low_res, encoding)
+        cached = await asyncio.to_thread(result_cache.get, key)
+        if cached:
+            image_bytes, meta = cached
+            width, height = meta["width"], meta["height"]
+            encode_ms = meta.get("encode_ms", 0.0)
+        else:
+            # Decode, remove background and encode in the worker pool, once memory allows
+            async with workers.admit(), memory_budget.reserve(pixel_budget.memory_cost(info)):
+                image_bytes, (width, height), encode_ms = await workers.run(process_image, contents, model, low_res, encoding)
+            await asyncio.to_thread(
+                result_cache.put, key, image_bytes, {"width": width, "height": height, "encode_ms": encode_ms}
+            )
         
         # Prepare response based on format
-        if return_format == "base64":
-            # Convert to base64
-            buffered = io.BytesIO()
-            output_image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
+        if return_format in ("base64", "url"):
+            mode = "data_url" if return_format == "base64" else "url"
+            image_ref = await publish(result_store, request, image_bytes, encoding.media_type, mode)
             
             return JSONResponse({
                 "success": True,
                 "data": {
-                    "image": f"data:image/png;base64,{img_base64}",
+                    "image": image_ref,
                     "original_filename": file.filename,
-                    "format": "png",
+                    "format": encoding.format,
+                    "bytes": len(image_bytes),
+                    "encode_ms": encode_ms,
+                    "model": model,
+                    "cached": cached is not None,
                     "size": {
-                        "width": output_image.width,
-                        "height": output_image.height
+                        "width": width,
+                        "height": height
                     }
                 },
                 "timestamp": datetime.now().isoformat()
             })
         else:
-            # Return as PNG file
-            img_byte_arr = io.BytesIO()
-            output_image.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
-            
+            # Return as an image file
             return StreamingResponse(
-                img_byte_arr,
-                media_type="image/png",
+                io.BytesIO(image_bytes),
+                media_type=encoding.media_type,
                 headers={
-                    "Content-Disposition": f"attachment; filename=removed_bg_{file.filename}"
+                    "Content-Disposition": f"attachment; filename=removed_bg_{file.filename}",
+                    "X-Cache": "HIT" if cached else "MISS",
+                    "X-Encode-Ms": str(encode_ms)
                 }
             )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Background removal failed: {str(e)}"
         )
 
-@app.post("/api/batch-remove-background")
-async def batch_remove_background(
-    files: list[UploadFile] = File(...)
+@app.post("/api/remove-background/mask")
+async def remove_background_mask(
+    file: UploadFile = File(...),
+    model: str = None,
+    mask_format: str = "png"
 ):
     """
-    Remove background from multiple images
+    Return only the 8-bit foreground mask for an uploaded image
+    
+    The mask is inferred from a reduced decode and upsampled to the original
+    resolution, so clients that already hold the original can composite it
+    themselves instead of downloading a full RGBA PNG.
     
     Parameters:
-    - files: List of image files
+    - file: Image file (PNG, JPG, JPEG, WEBP)
+    - model: rembg model (u2net, u2netp, isnet, silueta); defaults to REMBG_MODEL
+    - mask_format: 'png' (grayscale PNG) or 'raw' (width*height bytes, row-major)
     
     Returns:
-    - JSON with base64 encoded images
+    - Mask as image/png or application/octet-stream (size in X-Mask-Width/X-Mask-Height)
     """
-    if len(files) > 10:
+    model = validate_model(model)
+    if mask_format not in ("png", "raw"):
+        raise HTTPException(status_code=400, detail="Invalid mask_format. Allowed: png, raw")
+
+    try:
+        info = validate_image(file)
+        with stage("upload_read"):
+            contents = await file.read()
+        
+        key = cache_key(contents, model=model, kind="mask", format=mask_format)
+        cached = await asyncio.to_thread(result_cache.get, key)
+        if cached:
+            mask_bytes, meta = cached
+            width, height = meta["width"], meta["height"]
+        else:
+            # Inference runs on a reduced decode; the mask itself is full size
+            cost = pixel_budget.memory_cost(info, (MASK_INFERENCE_MAX_SIDE, MASK_INFERENCE_MAX_SIDE)) + info.pixels
+            async with workers.admit(), memory_budget.reserve(cost):
+                mask_bytes, (width, height) = await workers.run(process_mask, contents, model, mask_format)
+            await asyncio.to_thread(result_cache.put, key, mask_bytes, {"width": width, "height": height})
+        
+        return StreamingResponse(
+            io.BytesIO(mask_bytes),
+            media_type="image/png" if mask_format == "png" else "application/octet-stream",
+            headers={
+                "X-Mask-Width": str(width),
+                "X-Mask-Height": str(height),
+                "X-Cache": "HIT" if cached else "MISS"
+            }
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
         raise HTTPException(
-            status_code=400,
-            detail="Maximum 10 files allowed per batch"
+            status_code=500,
+            detail=f"Mask generation failed: {str(e)}"
         )
+
+async def run_batch(files: list, model: str, request: Request, response_mode: str = RESPONSE_MODE) -> list:
+    """Decode, remove background and encode a batch, keeping per-file errors isolated"""
+    # Headers are checked first, so the batch reserves memory for what it will actually decode
+    infos = []
+    for file in files:
+        try:
+            infos.append(validate_image(file))
+        except HTTPException as e:
+            infos.append(e)
+    cost = sum(pixel_budget.memory_cost(info) for info in infos if isinstance(info, ImageInfo))
+    async with memory_budget.reserve(cost):
+        return await process_batch(files, infos, model, request, response_mode)
+
+async def process_batch(files: list, infos: list, model: str, request: Request, response_mode: str) -> list:
+    """run_batch for uploads already validated (`infos` holds an ImageInfo or the validation error per file)"""
+    async def load_file(file, info):
+        if isinstance(info, Exception):
+            raise info
+        with stage("upload_read"):
+            contents = await file.read()
+        key = cutout_cache_key(contents, model, False, BATCH_ENCODING)
+        cached = await asyncio.to_thread(result_cache.get, key)
+        image = None if cached else await workers.run(decode_image, contents)
+        return key, cached, image
+    
+    # Read, look up and decode all uploads concurrently; failures stay attached to their index
+    loaded = await asyncio.gather(*(load_file(file, info) for file, info in zip(files, infos)), return_exceptions=True)
     
-    results = []
-    errors = []
+    # Run every decoded cache miss through the model as one chunked batch
+    misses = [
+        idx for idx, item in enumerate(loaded)
+        if not isinstance(item, BaseException) and item[1] is None
+    ]
+    cutouts = {}
+    if misses:
+        images = await workers.run(remove_batch_safe, [loaded[idx][2] for idx in misses], model)
+        cutouts = dict(zip(misses, images))
     
-    for idx, file in enumerate(files):
+    async def encode_result(idx, file):
         try:
-            validate_image(file)
-            contents = await file.read()
-            input_image = Image.open(io.BytesIO(contents))
-            
-            if input_image.mode != 'RGB':
-                input_image = input_image.convert('RGB')
-            
-            output_image = remove(input_image)
+            item = loaded[idx]
+            if isinstance(item, BaseException):
+                raise item
+            key, cached, _ = item
+            if cached:
+                png_bytes, meta = cached
+            else:
+                cutout = cutouts[idx]
+                if isinstance(cutout, BaseException):
+                    raise cutout
+                png_bytes, encode_ms = await workers.run(encode_image, cutout, BATCH_ENCODING)
+                meta = {"width": cutout.width, "height": cutout.height, "encode_ms": encode_ms}
+                await asyncio.to_thread(result_cache.put, key, png_bytes, meta)
+            image_ref = await publish(result_store, request, png_bytes, "image/png", response_mode)
             
-            buffered = io.BytesIO()
-            output_image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-            
-            results.append({
+            return {
                 "index": idx,
                 "filename": file.filename,
                 "success": True,
-                "image": f"data:image/png;base64,{img_base64}",
+                "image": image_ref,
+                "cached": cached is not None,
                 "size": {
-                    "width": output_image.width,
-                    "height": output_image.height
+                    "width": meta["width"],
+                    "height": meta["height"]
                 }
-            })
+            }
         except Exception as e:
-            errors.append({
+            return {
                 "index": idx,
                 "filename": file.filename,
                 "success": False,
                 "error": str(e)
-            })
+            }
+    
+    outcomes = await asyncio.gather(*(encode_result(idx, file) for idx, file in enumerate(files)))
+    return list(outcomes)
+
+@app.post("/api/batch-remove-background")
+async def batch_remove_background(
+    request: Request,
+    files: list[UploadFile] = File(...),
+    model: str = None,
+    response_mode: str = RESPONSE_MODE
+):
+    """
+    Remove background from multiple images
+    
+    Parameters:
+    - files: List of image files
+    - model: rembg model (u2net, u2netp, isnet, silueta); defaults to REMBG_MODEL
+    - response_mode: 'url' (result store URLs) or 'data_url' (inline base64)
+    
+    Returns:
+    - JSON with a URL (or data URL) per image
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_BATCH_FILES} files allowed per batch"
+        )
+    model = validate_model(model)
+    try:
+        response_mode = validate_response_mode(response_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async with workers.admit():
+        outcomes = await run_batch(files, model, request, response_mode)
+    results = [o for o in outcomes if o["success"]]
+    errors = [o for o in outcomes if not o["success"]]
     
     return JSONResponse({
         "success": len(errors) == 0,
@@ -189,9 +449,124 @@ async def batch_remove_background(
         "failed": len(errors),
         "results": results,
         "errors": errors,
+        "model": model,
         "timestamp": datetime.now().isoformat()
     })
 
+async def stream_batch(files: list, model: str, request: Request, response_mode: str = RESPONSE_MODE):
+    """
+    Yield batch outcomes chunk by chunk, in completion order.
+    
+    At most STREAM_CHUNKS_IN_FLIGHT chunks exist at once: the next chunk is
+    started only after a finished chunk's outcomes have all been taken by the
+    consumer, so a slow client holds back processing instead of letting
+    finished results pile up in memory.
+    """
+    async def process_chunk(start):
+        outcomes = await run_batch(files[start:start + BATCH_CHUNK_SIZE], model, request, response_mode)
+        for outcome in outcomes:
+            outcome["index"] += start
+        return outcomes
+    
+    starts = iter(range(0, len(files), BATCH_CHUNK_SIZE))
+    pending = set()
+    try:
+        while True:
+            while len(pending) < max(1, STREAM_CHUNKS_IN_FLIGHT):
+                start = next(starts, None)
+                if start is None:
+                    break
+                pending.add(asyncio.create_task(process_chunk(start)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for outcome in task.result():
+                    yield outcome
+    finally:
+        for task in pending:
+            task.cancel()
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """A StreamingResponse that releases its worker pool admission once sent, failed or abandoned"""
+    
+    def __init__(self, content, admission: AsyncExitStack, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admission = admission
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.admission.aclose()
+
+def format_event(payload: dict, stream_format: str, event: str = "result") -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps(payload) + "\n"
+
+@app.post("/api/batch-remove-background/stream")
+async def batch_remove_background_stream(
+    request: Request,
+    files: list[UploadFile] = File(...),
+    model: str = None,
+    stream_format: str = "ndjson",
+    response_mode: str = RESPONSE_MODE
+):
+    """
+    Remove background from many images, streaming each result as soon as it is done
+    
+    Parameters:
+    - files: List of image files
+    - model: rembg model (u2net, u2netp, isnet, silueta); defaults to REMBG_MODEL
+    - stream_format: 'ndjson' (one JSON object per line) or 'sse' (Server-Sent Events)
+    - response_mode: 'url' (result store URLs) or 'data_url' (inline base64)
+    
+    Returns:
+    - One event per file (same shape as the batch endpoint's results/errors, may arrive
+      out of order; use "index"), followed by a summary event with "done": true
+    """
+    if len(files) > MAX_STREAM_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_STREAM_FILES} files allowed per streaming batch"
+        )
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Invalid stream_format. Allowed: ndjson, sse")
+    model = validate_model(model)
+    try:
+        response_mode = validate_response_mode(response_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def events():
+        processed = failed = 0
+        async for outcome in stream_batch(files, model, request, response_mode):
+            if outcome["success"]:
+                processed += 1
+            else:
+                failed += 1
+            yield format_event(outcome, stream_format)
+        yield format_event({
+            "done": True,
+            "success": failed == 0,
+            "processed": processed,
+            "failed": failed,
+            "model": model,
+            "timestamp": datetime.now().isoformat()
+        }, stream_format, event="done")
+    
+    # Admission is checked before the response starts (so a full pool is a 503)
+    # and held until the response is done, even if the stream is never iterated
+    admission = AsyncExitStack()
+    await admission.enter_async_context(workers.admit())
+    return AdmittedStreamingResponse(
+        events(),
+        admission,
+        media_type="text/event-stream" if stream_format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,155 @@
+"""
+Batched rembg inference.
+
+`rembg.remove()` runs the model on one image at a time. For the batch endpoint
+all decoded uploads are resized to the model input size, stacked into one
+tensor and sent through ONNX Runtime in chunks. Each predicted mask is then
+scaled back to its own image's resolution and applied as alpha.
+
+Preprocessing and postprocessing mirror the per-image rembg sessions, so the
+masks match what `remove()` would produce for the same image.
+
+The low-resolution helpers reuse the same path for single images: the mask is
+predicted from a downscaled copy (JPEG uploads are decoded with draft mode so
+the full-size pixels are never materialized) and only the single-channel mask
+is upsampled back to the original resolution.
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from session_pool import get_pool, resolve_model
+
+# Configuration
+
+BATCH_CHUNK_SIZE = int(os.getenv("REMBG_BATCH_SIZE", "8"))
+MASK_INFERENCE_MAX_SIDE = int(os.getenv("MASK_INFERENCE_MAX_SIDE", "1024"))
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Public model name -> (mean, std, input size), as used by the rembg sessions
+MODEL_INPUTS = {
+    "u2net": (IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "u2netp": (IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "silueta": (IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "isnet": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+
+def preprocess(img: Image.Image, model: str) -> np.ndarray:
+    """Resize and normalize one image into a (3, H, W) float32 tensor"""
+    mean, std, size = MODEL_INPUTS[model]
+    arr = np.asarray(img.convert("RGB").resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+    arr = arr / max(float(arr.max()), 1e-6)
+    arr = (arr - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return arr.transpose((2, 0, 1))
+
+
+def postprocess(pred: np.ndarray, original_size: tuple) -> Image.Image:
+    """Min-max normalize one (H, W) prediction and scale it back to the original size"""
+    mi, ma = float(pred.min()), float(pred.max())
+    pred = (pred - mi) / max(ma - mi, 1e-6)
+    mask = Image.fromarray((pred.clip(0, 1) * 255).astype(np.uint8), mode="L")
+    return mask.resize(original_size, Image.Resampling.LANCZOS)
+
+
+def _max_batch(session) -> int:
+    # Some exported models have a fixed batch dimension; respect it
+    dim = session.inner_session.get_inputs()[0].shape[0]
+    return dim if isinstance(dim, int) and dim > 0 else 0
+
+
+def predict_masks(session, images: list, model: str, chunk_size: int = BATCH_CHUNK_SIZE, output_sizes: list = None) -> list:
+    """
+    Predict one mask per image, running the model on chunks of stacked inputs.
+
+    Masks are scaled to each image's size, or to `output_sizes` when given.
+    Returns a list aligned with `images` holding either a mask or the exception
+    raised for that image, so one failure does not sink the rest of the batch.
+    """
+    output_sizes = output_sizes or [img.size for img in images]
+    fixed = _max_batch(session)
+    chunk_size = max(1, min(chunk_size, fixed) if fixed else chunk_size)
+    input_name = session.inner_session.get_inputs()[0].name
+    masks = [None] * len(images)
+
+    for start in range(0, len(images), chunk_size):
+        chunk = images[start:start + chunk_size]
+        try:
+            batch = np.stack([preprocess(img, model) for img in chunk])
+            preds = session.inner_session.run(None, {input_name: batch})[0][:, 0, :, :]
+            for offset, pred in enumerate(preds):
+                masks[start + offset] = postprocess(pred, output_sizes[start + offset])
+        except Exception:
+            # Retry the chunk image by image to isolate the failing input
+            for offset, img in enumerate(chunk):
+                try:
+                    pred = session.inner_session.run(
+                        None, {input_name: preprocess(img, model)[np.newaxis]}
+                    )[0][0, 0, :, :]
+                    masks[start + offset] = postprocess(pred, output_sizes[start + offset])
+                except Exception as e:
+                    masks[start + offset] = e
+    return masks
+
+
+def remove_batch(images: list, model: str = None, chunk_size: int = BATCH_CHUNK_SIZE) -> list:
+    """Batched equivalent of `remove()`: returns an RGBA cutout (or exception) per image"""
+    from rembg.bg import naive_cutout  # heavy import, deferred until first use
+
+    model = resolve_model(model)
+    images = [ImageOps.exif_transpose(img) for img in images]
+    with get_pool(model).session() as session:
+        masks = predict_masks(session, images, model, chunk_size)
+    return [
+        mask if isinstance(mask, Exception) else naive_cutout(img, mask)
+        for img, mask in zip(images, masks)
+    ]
+
+
+# Low-resolution mask inference
+
+def _oriented_size(img: Image.Image) -> tuple:
+    # Size after EXIF orientation is applied, read without decoding pixels
+    orientation = img.getexif().get(0x0112, 1)
+    return (img.height, img.width) if orientation in (5, 6, 7, 8) else img.size
+
+
+def load_for_mask(contents: bytes, max_side: int = MASK_INFERENCE_MAX_SIDE) -> tuple:
+    """Decode a reduced copy for mask inference. Returns (small RGB image, original size)"""
+    img = Image.open(io.BytesIO(contents))
+    original_size = _oriented_size(img)
+    # JPEG only: let the decoder scale by 1/2, 1/4 or 1/8 instead of decoding full size
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return img, original_size
+
+
+def predict_mask(image: Image.Image, model: str = None, output_size: tuple = None) -> Image.Image:
+    """Predict a mask for one image, scaled to `output_size` (default: the image's size)"""
+    model = resolve_model(model)
+    with get_pool(model).session() as session:
+        mask = predict_masks(session, [image], model, chunk_size=1, output_sizes=[output_size or image.size])[0]
+    if isinstance(mask, Exception):
+        raise mask
+    return mask
+
+
+def mask_from_bytes(contents: bytes, model: str = None, max_side: int = MASK_INFERENCE_MAX_SIDE) -> Image.Image:
+    """8-bit mask at the upload's original resolution, inferred from a reduced decode"""
+    small, original_size = load_for_mask(contents, max_side)
+    return predict_mask(small, model, output_size=original_size)
+
+
+def remove_low_res(image: Image.Image, model: str = None, max_side: int = MASK_INFERENCE_MAX_SIDE) -> Image.Image:
+    """Cutout whose mask was inferred on a downscaled copy and applied to the full-size pixels"""
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    small = image.copy()
+    small.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    image.putalpha(predict_mask(small, model, output_size=image.size))
+    return image
@@ -0,0 +1,123 @@
+"""
+Parity check and benchmark for the one-pass compliance scanner.
+
+Compares `compliance.Scanner` against a port of the browser's rule-by-rule
+scanner (frontend/lib/compliance/scanner.ts: one regex search per rule per
+text) on synthetic ad copy. It fails if the two disagree about which texts
+are flagged, or if the lead guard changes any finding. It then reports
+texts/second for:
+
+- rule_by_rule: every rule searched separately over each text
+- one_pass: `Scanner.scan` per text
+- one_pass_bulk: `Scanner.scan_many` over all texts (one pass in total)
+
+    cd backend
+    python -m benchmarks.compliance [--texts 5000] [--repeat 5] [--json results.json]
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+
+from benchmarks import synthetic
+from compliance import RULES, Finding, Scanner
+
+CORPORA = {
+    "clean": dict(offer_rate=0.0, sensitive_rate=0.0),
+    "offers": dict(offer_rate=0.5, sensitive_rate=0.0),
+    "mixed": dict(offer_rate=0.3, sensitive_rate=0.02),
+    "sensitive": dict(offer_rate=0.3, sensitive_rate=0.5),
+}
+
+
+class RuleByRule:
+    """scanner.ts: each rule's regex searched separately, flagged rule ids in RULES order"""
+
+    def __init__(self, rules=RULES):
+        flags = re.ASCII
+        self.rules = [
+            (rule.id, re.compile(rule.pattern, flags | re.IGNORECASE if rule.ignore_case else flags)) for rule in rules
+        ]
+
+    def scan(self, text: str) -> list:
+        return [rule_id for rule_id, regex in self.rules if regex.search(text)]
+
+
+def unguarded(rules=RULES) -> re.Pattern:
+    """The combined alternation without the lead lookahead"""
+    groups = "|".join(
+        f"(?P<{rule.id}>{f'(?i:{rule.pattern})' if rule.ignore_case else rule.pattern})" for rule in rules
+    )
+    return re.compile(groups, re.ASCII)
+
+
+def parity(texts: list, scanner: Scanner) -> list:
+    """(index, problem) for every text where the scanners disagree"""
+    problems = []
+    reference = RuleByRule()
+    plain = unguarded()
+    bulk = scanner.scan_many(texts)
+    for i, text in enumerate(texts):
+        findings = scanner.scan(text)
+        if bool(findings) != bool(reference.scan(text)):
+            problems.append((i, f"flagged={bool(findings)} but rule-by-rule found {reference.scan(text)}"))
+        if findings != [Finding(m.lastgroup, m.start(), m.end()) for m in plain.finditer(text)]:
+            problems.append((i, "lead guard changed the findings"))
+        if findings != bulk[i]:
+            problems.append((i, "scan_many differs from scan"))
+    return problems
+
+
+def bench(fn, repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=5000, help="texts per corpus")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    scanner = Scanner()
+    reference = RuleByRule()
+    corpora = {name: synthetic.ad_copy(args.texts, seed=i, **rates) for i, (name, rates) in enumerate(CORPORA.items())}
+
+    problems = {name: parity(texts, scanner) for name, texts in corpora.items()}
+    for name, found in problems.items():
+        for i, problem in found[:5]:
+            print(f"❌ {name}[{i}] {corpora[name][i]!r}: {problem}")
+    if not any(problems.values()):
+        print("✅ One-pass scanner flags the same texts as rule-by-rule scanning on every corpus")
+
+    results = []
+    print(f"\n{'corpus':<12}{'flagged':>9}{'rule_by_rule':>14}{'one_pass':>11}{'bulk':>11}{'speedup':>9}  (texts/s)")
+    for name, texts in corpora.items():
+        timings = {
+            "rule_by_rule": bench(lambda: [reference.scan(t) for t in texts], args.repeat),
+            "one_pass": bench(lambda: [scanner.scan(t) for t in texts], args.repeat),
+            "one_pass_bulk": bench(lambda: scanner.scan_many(texts), args.repeat),
+        }
+        rates = {key: len(texts) / seconds for key, seconds in timings.items()}
+        flagged = sum(1 for findings in scanner.scan_many(texts) if findings)
+        results.append({"corpus": name, "texts": len(texts), "flagged": flagged, **{k: round(v) for k, v in rates.items()}})
+        print(
+            f"{name:<12}{flagged:>9}{rates['rule_by_rule']:>14,.0f}{rates['one_pass']:>11,.0f}"
+            f"{rates['one_pass_bulk']:>11,.0f}{rates['one_pass_bulk'] / rates['rule_by_rule']:>8.2f}x"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"problems": problems, "corpora": results}, f, indent=2)
+
+    sys.exit(1 if any(problems.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+End-to-end load test for /generate-layout and /api/batch-remove-background.
+
+Starts the Groq stub (groq_stub.py) with the requested latency and error
+rate, serves the apps either in this process (httpx ASGI transport, no
+network) or as uvicorn subprocesses, then sweeps concurrency x image size
+with a closed-loop async load generator: each of C clients sends its next
+request as soon as the previous one returns.
+
+Per scenario it reports p50/p95/p99 latency, requests per second, error rate,
+status codes, peak RSS of the server process tree (sampled from /proc; in
+process mode that includes the load generator) and the mean Server-Timing
+stage durations. The best RPS per target is reported
+as its saturation throughput.
+
+    cd backend
+    python -m benchmarks.loadtest --mode uvicorn --targets layout,batch \\
+        --concurrency 1,4,16 --sizes 800x800,2000x2000 --requests 50 --json load.json
+
+Uploads get random trailing bytes so the result cache doesn't turn repeated
+requests into hits (--allow-cache-hits to measure the cached path), and
+every layout request uses a new product name so copy comes from the stub.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+from benchmarks import synthetic
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    # name -> (module, readiness path)
+    "layout": ("ai_layout_api", "/ready"),
+    "batch": ("background_removal_api", "/ready"),
+}
+
+SERVER_TIMING = re.compile(r"([\w-]+)(?:;desc=\"[^\"]*\")?;dur=([\d.]+)")
+
+
+# Process memory
+
+def _children(pid: int) -> list:
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return []
+    children = []
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return children
+
+
+def tree_rss(pid: int):
+    """Resident memory of `pid` and all its descendants in bytes (None without /proc)"""
+    total, found, stack = 0, False, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        found = True
+                        break
+        except OSError:
+            continue
+        stack.extend(_children(current))
+    return total if found else None
+
+
+class RssSampler:
+    """Peak tree RSS of some processes, sampled every `interval` seconds"""
+
+    def __init__(self, pids: list, interval: float = 0.05):
+        self.pids = pids
+        self.interval = interval
+        self.peak = None
+        self._task = None
+
+    def sample(self) -> None:
+        values = [tree_rss(pid) for pid in self.pids]
+        values = [v for v in values if v is not None]
+        if values:
+            self.peak = max(self.peak or 0, sum(values))
+
+    async def _loop(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.sample()
+
+
+# Servers
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_uvicorn(module: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, path: str, proc: subprocess.Popen = None, timeout: float = 180) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode} during startup")
+        try:
+            response = await client.get(path)
+        except httpx.TransportError:
+            response = None
+        if response is not None and response.status_code == 200:
+            return
+        if path == "/ready" and response is not None and response.json().get("status") == "failed":
+            raise RuntimeError(f"server startup failed: {response.text}")
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"server not ready after {timeout:.0f}s")
+
+
+def server_env(args) -> dict:
+    env = dict(os.environ)
+    if args.groq_url:
+        env.update(GROQ_API_KEY=env.get("GROQ_API_KEY") or "stub", GROQ_BASE_URL=args.groq_url)
+    if args.quiet_servers:
+        env["VERBOSE_LOGS"] = "0"
+    return env
+
+
+@asynccontextmanager
+async def groq_stub(args):
+    """Run groq_stub.py on a free port with the configured behaviour; yields its URL"""
+    if args.no_stub:
+        yield args.groq_url
+        return
+    port = free_port()
+    env = dict(
+        os.environ,
+        STUB_LATENCY_MS=str(args.stub_latency_ms),
+        STUB_JITTER_MS=str(args.stub_jitter_ms),
+        STUB_ERROR_RATE=str(args.stub_error_rate),
+    )
+    proc = spawn_uvicorn("groq_stub", port, env)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=url) as client:
+            await wait_ready(client, "/docs", proc, timeout=30)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+@asynccontextmanager
+async def serve(target: str, args):
+    """Yield (client, pids to watch) for a target, in-process or under uvicorn"""
+    module, ready_path = TARGETS[target]
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if args.mode == "inprocess":
+        # Settings are read at import time, so the environment is set first
+        os.environ.update(server_env(args))
+        app = __import__(module).app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout, limits=limits) as client:
+                # Startup tasks run in the background after the lifespan starts
+                await wait_ready(client, ready_path)
+                yield client, [os.getpid()]
+        return
+    port = free_port()
+    proc = spawn_uvicorn(module, port, server_env(args))
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout, limits=limits) as client:
+            await wait_ready(client, ready_path, proc)
+            yield client, [proc.pid]
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+# Requests
+
+class Uploads:
+    """Synthetic JPEG uploads per size, made unique per request unless cache hits are allowed"""
+
+    def __init__(self, allow_cache_hits: bool):
+        self.allow_cache_hits = allow_cache_hits
+        self._images = {}
+        self._logo = synthetic.encode(synthetic.logo((400, 400)), "PNG")
+
+    def packshot(self, size: tuple) -> bytes:
+        if size not in self._images:
+            self._images[size] = synthetic.encode(synthetic.packshot(size, seed=size[0] ^ size[1]))
+        data = self._images[size]
+        # Decoders stop at the JPEG end marker, so trailing bytes only change the hash
+        return data if self.allow_cache_hits else data + os.urandom(16)
+
+    def logo(self) -> bytes:
+        return self._logo
+
+
+def build_request(target: str, size: tuple, uploads: Uploads, args, n: int) -> dict:
+    if target == "layout":
+        return {
+            "url": "/generate-layout",
+            "files": {
+                "product_image": ("packshot.jpg", uploads.packshot(size), "image/jpeg"),
+                "logo_image": ("logo.png", uploads.logo(), "image/png"),
+            },
+            "data": {
+                "product_name": f"Load Test Product {n}" if not args.allow_cache_hits else "Load Test Product",
+                "num_variations": str(args.num_variations),
+                "platform": args.platform,
+            },
+        }
+    return {
+        "url": "/api/batch-remove-background",
+        "files": [("files", (f"packshot{i}.jpg", uploads.packshot(size), "image/jpeg")) for i in range(args.batch_files)],
+    }
+
+
+def is_success(response: httpx.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    try:
+        return response.json().get("success", True) is not False
+    except ValueError:
+        return False
+
+
+# Scenarios
+
+def percentile(values: list, q: float):
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+
+async def warm_up(client, target: str, size: tuple, uploads: Uploads, args) -> None:
+    """Sequential requests that fill caches and pools before measuring (results ignored)"""
+    for n in range(args.warmup):
+        request = build_request(target, size, uploads, args, -n)
+        try:
+            await client.post(request["url"], files=request["files"], data=request.get("data"))
+        except httpx.HTTPError:
+            pass
+
+
+async def run_scenario(client, pids, target: str, size: tuple, concurrency: int, uploads: Uploads, args) -> dict:
+    latencies, statuses, stages = [], {}, {}
+    ok = 0
+    issued = 0
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    def next_request():
+        nonlocal issued
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        if deadline is None and issued >= args.requests:
+            return None
+        issued += 1
+        return build_request(target, size, uploads, args, issued)
+
+    async def client_loop():
+        nonlocal ok
+        while (request := next_request()) is not None:
+            started = time.perf_counter()
+            try:
+                response = await client.post(request["url"], files=request["files"], data=request.get("data"))
+                status = str(response.status_code)
+                success = is_success(response)
+                for name, dur in SERVER_TIMING.findall(response.headers.get("server-timing", "")):
+                    stages.setdefault(name, []).append(float(dur))
+            except httpx.HTTPError as e:
+                status, success = type(e).__name__, False
+            latencies.append(1000 * (time.perf_counter() - started))
+            statuses[status] = statuses.get(status, 0) + 1
+            ok += success
+
+    with RssSampler(pids) as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    result = {
+        "target": target,
+        "concurrency": concurrency,
+        "image_size": f"{size[0]}x{size[1]}",
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "error_rate": round((total - ok) / total, 4) if total else None,
+        "status_counts": statuses,
+        "duration_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 3) if elapsed else None,
+        "ok_rps": round(ok / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": round(float(np.mean(latencies)), 2) if latencies else None,
+            "max": round(max(latencies), 2) if latencies else None,
+        },
+        "peak_rss_mb": round(rss.peak / 2**20, 1) if rss.peak else None,
+        "server_timing_ms": {name: round(float(np.mean(durs)), 2) for name, durs in stages.items()},
+    }
+    print(
+        f"{target:<8}{result['image_size']:>11}{concurrency:>6}{total:>7}{result['rps'] or 0:>9.2f}"
+        f"{result['latency_ms']['p50'] or 0:>10.1f}{result['latency_ms']['p95'] or 0:>10.1f}"
+        f"{result['latency_ms']['p99'] or 0:>10.1f}{100 * (result['error_rate'] or 0):>8.1f}%"
+        f"{result['peak_rss_mb'] or 0:>10.1f}",
+        file=sys.stderr,
+    )
+    return result
+
+
+def parse_size(value: str) -> tuple:
+    w, h = value.lower().split("x")
+    return int(w), int(h)
+
+
+async def main_async(args) -> dict:
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    targets = [t.strip() for t in args.targets.split(",")]
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        raise SystemExit(f"Unknown target(s): {', '.join(unknown)}. Allowed: {', '.join(TARGETS)}")
+    uploads = Uploads(args.allow_cache_hits)
+
+    scenarios, failures = [], {}
+    async with groq_stub(args) as groq_url:
+        args.groq_url = groq_url
+        print(f"{'target':<8}{'size':>11}{'conc':>6}{'reqs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}"
+              f"{'p99 ms':>10}{'errors':>9}{'rss MB':>10}", file=sys.stderr)
+        for target in targets:
+            async with AsyncExitStack() as stack:
+                try:
+                    client, pids = await stack.enter_async_context(serve(target, args))
+                except Exception as e:
+                    failures[target] = f"{type(e).__name__}: {e}"
+                    print(f"❌ {target}: could not start: {failures[target]}", file=sys.stderr)
+                    continue
+                for size in sizes:
+                    uploads.packshot(size)  # generate before timing starts
+                    await warm_up(client, target, size, uploads, args)
+                    for concurrency in concurrencies:
+                        scenarios.append(await run_scenario(client, pids, target, size, concurrency, uploads, args))
+
+    saturation = {}
+    for result in scenarios:
+        best = saturation.get(result["target"])
+        if result["ok_rps"] is not None and (best is None or result["ok_rps"] > best["ok_rps"]):
+            saturation[result["target"]] = {
+                "ok_rps": result["ok_rps"], "concurrency": result["concurrency"], "image_size": result["image_size"]
+            }
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "mode": args.mode,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests_per_scenario": None if args.duration else args.requests,
+            "duration_s": args.duration or None,
+            "stub": None if args.no_stub else {
+                "latency_ms": args.stub_latency_ms, "jitter_ms": args.stub_jitter_ms, "error_rate": args.stub_error_rate
+            },
+            "num_variations": args.num_variations,
+            "batch_files": args.batch_files,
+            "allow_cache_hits": args.allow_cache_hits,
+        },
+        "scenarios": scenarios,
+        "saturation": saturation,
+        "failed_targets": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="uvicorn")
+    parser.add_argument("--targets", default="layout,batch", help="comma-separated: layout, batch")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts")
+    parser.add_argument("--sizes", default="800x800,2000x2000", help="comma-separated upload sizes (WxH)")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--duration", type=float, default=0, help="seconds per scenario (overrides --requests)")
+    parser.add_argument("--warmup", type=int, default=2, help="sequential requests per target and size before measuring")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--num-variations", type=int, default=3)
+    parser.add_argument("--platform", default="instagram_story")
+    parser.add_argument("--batch-files", type=int, default=4, help="images per batch request")
+    parser.add_argument("--allow-cache-hits", action="store_true", help="send identical uploads")
+    parser.add_argument("--stub-latency-ms", type=float, default=300)
+    parser.add_argument("--stub-jitter-ms", type=float, default=100)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-stub", action="store_true", help="don't start the stub; use --groq-url or offline copy")
+    parser.add_argument("--groq-url", help="Groq-compatible base URL to use with --no-stub")
+    parser.add_argument("--quiet-servers", action=argparse.BooleanOptionalAction, default=True,
+                        help="run servers with VERBOSE_LOGS=0")
+    parser.add_argument("--json", help="write results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    sys.exit(1 if results["failed_targets"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Microbenchmarks for the image and text hot paths.
+
+Cases (inputs are synthetic and generated offline, see benchmarks/synthetic.py):
+  render_layout/<template>@<WxH>  every template at every platform size
+  parse_color                     hex, short hex, CSS names and junk
+  sanitize_headline               headlines with emoji, accents and box glyphs
+  fit_headline                    fitting those headlines into a template's headline box
+  extract_json_from_text/<kind>   realistic LLM outputs (fenced, <think>, prose, batch, broken)
+  compliance/<kind>               one headline + CTA, and 1000 texts in one bulk pass
+  rembg_remove/<model>            one packshot through a pooled session of a small model (skipped if it can't be loaded)
+  encode/<kind>, base64/<kind>    PNG/JPEG encode and data-URL encoding of rendered outputs
+
+Each case is run in `--rounds` rounds of at least `--min-time` seconds; the
+per-call median, min and max across rounds are reported.
+
+    cd backend
+    python -m benchmarks.microbench --json baseline.json
+    # ...change something...
+    python -m benchmarks.microbench --compare baseline.json [--threshold 0.15] [--json new.json]
+    python -m benchmarks.microbench --input new.json --compare baseline.json   # compare saved results
+
+With --compare the exit status is 1 if any case's median got slower than the
+baseline by more than the threshold (a fraction; 0.15 = 15%).
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import PIL
+
+import ai_layout_api as layout
+import text_fit
+from benchmarks import synthetic
+from compliance import Scanner
+from encoding import EncodeSettings, encode_image
+
+TEXT = {"headline": "Silence The Noise Everywhere", "cta": "Shop Now"}
+COLORS = {"primary": (24, 48, 160, 255), "text": (255, 255, 255, 255)}
+
+COLOR_INPUTS = [
+    "#1E90FF", "#fff", "1e90ff", " Tomato ", "rebeccapurple", "lightgoldenrodyellow",
+    "", "#12345", "not-a-color", "#GGHHII",
+]
+
+HEADLINES = [
+    "Silence The Noise",
+    "🔥 Unleash Bold Comfort 🔥",
+    "Crème Brûlée Dreams — Naturally ✨",
+    "■ Own Every Moment □",
+    "  Adventure   Ready\tWarmth  ",
+    "Pure Comfort 💧 For Every 🌍 Journey, Every Day",
+]
+
+LLM_OUTPUTS = {
+    "plain": '{"headline": "Silence The Noise", "cta": "Shop Now"}',
+    "fenced": 'Here is your ad copy:\n```json\n{\n  "headline": "Adventure Ready Warmth",\n  "cta": "Explore Now"\n}\n```',
+    "think": (
+        "<think>\nThe user wants an emotional angle for a puffer jacket. Focus on warmth, the outdoors "
+        "and belonging. Keep the headline under six words and the CTA to two words.\n"
+        "Candidates: 'Warmth That Follows You', 'Own Every Summit'. The second is punchier.\n</think>\n"
+        '{"headline": "Own Every Summit", "cta": "Get Yours"}'
+    ),
+    "prose": (
+        'Sure! Based on the "Luxury" angle, I would go with something understated. '
+        '{"headline": "Quiet Luxury, Loud Comfort", "cta": "Discover More"} '
+        "Let me know if you want alternatives."
+    ),
+    "batch": json.dumps({"ads": [
+        {"headline": "Silence The Noise", "cta": "Shop Now"},
+        {"headline": "Warmth That Follows You", "cta": "Find Yours"},
+        {"headline": "Last Chance This Season", "cta": "Buy Today"},
+        {"headline": "Crafted For The Few", "cta": "Discover"},
+    ]}, indent=2),
+    "broken": "{headline: 'Made To Last', cta: \"Shop Now\",\n}",
+}
+
+
+# Runner
+
+def measure(fn, rounds: int, min_time: float) -> dict:
+    """Per-call timings of `fn` over `rounds` calibrated rounds, in ms"""
+    fn()  # warm caches (fits, text masks, fonts, sessions)
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.2))
+    samples = [elapsed / loops]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - started) / loops)
+    return {
+        "median_ms": round(1000 * statistics.median(samples), 5),
+        "min_ms": round(1000 * min(samples), 5),
+        "max_ms": round(1000 * max(samples), 5),
+        "loops": loops,
+        "rounds": rounds,
+    }
+
+
+# Cases
+
+def render_cases():
+    product = synthetic.cutout((1200, 1600), seed=1)
+    logo = synthetic.logo((400, 400), seed=2)
+    sizes = sorted(set(layout.PLATFORM_DIMENSIONS.values()))
+    prepared_product = layout.PreparedAsset(product, layout.max_product_box(layout.LAYOUT_TEMPLATES, sizes))
+    prepared_logo = layout.PreparedAsset(logo, layout.max_logo_box(sizes))
+    for template in layout.LAYOUT_TEMPLATES:
+        for size in sizes:
+            yield f"render_layout/{template['id']}@{size[0]}x{size[1]}", (
+                lambda t=template, s=size: layout.render_layout(t, prepared_product, prepared_logo, TEXT, COLORS, s)
+            )
+
+
+def text_cases():
+    yield "parse_color", lambda: [layout.parse_color(c) for c in COLOR_INPUTS]
+    yield "sanitize_headline", lambda: [layout.sanitize_headline(h) for h in HEADLINES]
+    plan = layout.template_index.plan(layout.LAYOUT_TEMPLATES[0], (1080, 1080)).headline
+    headlines = [layout.sanitize_headline(h) for h in HEADLINES]
+    yield "fit_headline", lambda: [
+        text_fit.fit_text(h, plan.box, plan.font_size, plan.min_font_size, layout.headline_font) for h in headlines
+    ]
+    for kind, text in LLM_OUTPUTS.items():
+        yield f"extract_json_from_text/{kind}", lambda t=text: layout.extract_json_from_text(t)
+    scanner = Scanner()
+    yield "compliance/copy", lambda: scanner.scan_many([TEXT["headline"], TEXT["cta"]])
+    texts = synthetic.ad_copy(1000, seed=4)
+    yield "compliance/bulk_1000", lambda: scanner.scan_many(texts)
+
+
+def encode_cases():
+    creative = layout.render_layout(
+        layout.LAYOUT_TEMPLATES[0],
+        layout.PreparedAsset(synthetic.cutout(seed=1), (1080, 1920)),
+        layout.PreparedAsset(synthetic.logo(seed=2), (200, 200)),
+        TEXT, COLORS, (1080, 1920)
+    )
+    cutout = synthetic.cutout((1200, 1600), seed=1)
+    outputs = {"creative_1080x1920": creative, "cutout_1200x1600": cutout}
+    for name, image in outputs.items():
+        yield f"encode/png/{name}", lambda i=image: encode_image(i, EncodeSettings("png"))
+    yield "encode/jpeg/creative_1080x1920", lambda: encode_image(creative, EncodeSettings("jpeg"))
+    for name, image in outputs.items():
+        data, _ = encode_image(image, EncodeSettings("png"))
+        yield f"base64/png/{name}", lambda d=data: f"data:image/png;base64,{base64.b64encode(d).decode()}"
+
+
+def rembg_cases(model: str):
+    name = f"rembg_remove/{model}"
+    try:
+        # The serving path: a pooled session with the production ONNX Runtime options
+        from session_pool import get_pool, remove
+        pool = get_pool(model)
+        pool.fill()
+    except Exception as e:  # model not downloaded and no network, or rembg not installed
+        yield name, f"skipped: {type(e).__name__}: {e}"
+        return
+    image = synthetic.packshot((800, 1066), seed=3)
+
+    def run_once():
+        with pool.session() as session:
+            return remove(image, session=session)
+
+    yield name, run_once
+
+
+def all_cases(rembg_model: str):
+    yield from render_cases()
+    yield from text_cases()
+    yield from encode_cases()
+    yield from rembg_cases(rembg_model)
+
+
+def run(args) -> dict:
+    pattern = re.compile(args.filter) if args.filter else None
+    cases = {}
+    for name, fn in all_cases(args.rembg_model):
+        if pattern and not pattern.search(name):
+            continue
+        if isinstance(fn, str):
+            cases[name] = {"skipped": fn}
+            print(f"{name:<48} {fn[:70]}")
+            continue
+        cases[name] = measure(fn, args.rounds, args.min_time)
+        print(f"{name:<48}{cases[name]['median_ms']:>12.4f} ms  (min {cases[name]['min_ms']:.4f})")
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pillow": PIL.__version__,
+            "numpy": np.__version__,
+            "rounds": args.rounds,
+            "min_time": args.min_time,
+        },
+        "cases": cases,
+    }
+
+
+# Comparison
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Print a comparison table and return the names of cases that regressed past `threshold`"""
+    regressions = []
+    print(f"\n{'case':<48}{'baseline ms':>13}{'current ms':>13}{'change':>9}")
+    for name, result in current["cases"].items():
+        before = baseline["cases"].get(name)
+        if not before or "median_ms" not in before or "median_ms" not in result:
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  ❌"
+        elif change < -threshold:
+            flag = "  ✅"
+        print(f"{name:<48}{before['median_ms']:>13.4f}{result['median_ms']:>13.4f}{100 * change:>8.1f}%{flag}")
+    missing = sorted(set(baseline["cases"]) - set(current["cases"]))
+    if missing:
+        print(f"\n⚠️ Not in the current run: {', '.join(missing)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per round")
+    parser.add_argument("--filter", help="only run cases whose name matches this regex")
+    parser.add_argument("--rembg-model", default="u2netp")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--input", help="load results from this file instead of running")
+    parser.add_argument("--compare", help="baseline results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before failing (fraction)")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            results = json.load(f)
+    else:
+        results = run(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} case(s) regressed by more than {100 * args.threshold:.0f}%")
+            sys.exit(1)
+        print(f"\n✅ No case regressed by more than {100 * args.threshold:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Accuracy check and benchmark for headline fitting.
+
+`text_fit.fit_text` measures text with cached per-(font, size) advance
+tables. This compares it with the same binary search measured the direct way,
+with `multiline_textbbox` at every probe, over synthetic headlines for every
+template and platform size:
+
+- every fitted headline is rasterized-measured with `multiline_textbbox`
+  and must stay inside its box (it fails otherwise);
+- how often both fitters pick the same size and line breaks, and how many
+  pixels smaller the advance tables (which ignore kerning) pick on average;
+- microseconds per fit: bbox probes, advance tables cold (first use of each
+  font size) and warm.
+
+    cd backend
+    python -m benchmarks.text_fit [--headlines 300] [--json results.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+import ai_layout_api as layout
+import text_fit
+from benchmarks import synthetic
+
+PROBE = ImageDraw.Draw(Image.new("L", (1, 1)))
+
+
+def bbox_size(text: str, size: int, align: str) -> tuple:
+    left, top, right, bottom = PROBE.multiline_textbbox(
+        (0, 0), text, font=layout.headline_font(size), anchor="mm" if align == "center" else "lm", align=align
+    )
+    return right - left, bottom - top
+
+
+def reference_fit(text: str, plan) -> tuple:
+    """fit_text's search and greedy wrap, with every line and block measured by textbbox"""
+    words = text.split()
+    max_width, max_height = plan.box
+
+    def wrap(size):
+        lines, line = [], []
+        for word in words:
+            candidate = " ".join(line + [word])
+            if bbox_size(candidate, size, plan.align)[0] <= max_width:
+                line.append(word)
+            elif not line:
+                return None
+            else:
+                lines.append(" ".join(line))
+                line = [word]
+                if bbox_size(word, size, plan.align)[0] > max_width:
+                    return None
+        return lines + [" ".join(line)]
+
+    best = None
+    low, high = plan.min_font_size, plan.font_size
+    while low <= high:
+        size = (low + high) // 2
+        lines = wrap(size)
+        if lines is not None and bbox_size("\n".join(lines), size, plan.align)[1] <= max_height:
+            best = ("\n".join(lines), size)
+            low = size + 1
+        else:
+            high = size - 1
+    return best
+
+
+def per_fit_us(fn, cases: list) -> float:
+    started = time.perf_counter()
+    for text, plan in cases:
+        fn(text, plan)
+    return 1e6 * (time.perf_counter() - started) / len(cases)
+
+
+def fast_fit(text: str, plan) -> tuple:
+    return text_fit.fit_text(text, plan.box, plan.font_size, plan.min_font_size, layout.headline_font)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--headlines", type=int, default=300)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    headlines = [h for h in synthetic.ad_copy(args.headlines * 2, seed=7, sensitive_rate=0.0) if len(h.split()) > 2]
+    headlines = [layout.sanitize_headline(f"{h} {h}") for h in headlines[:args.headlines]]  # long enough to need fitting
+    sizes = sorted(set(layout.PLATFORM_DIMENSIONS.values()))
+    plans = [layout.template_index.plan(t, size).headline for t in layout.LAYOUT_TEMPLATES for size in sizes]
+    cases = [(text, plan) for text in headlines for plan in plans]
+
+    cold = per_fit_us(fast_fit, cases[:len(plans)])
+    warm = per_fit_us(fast_fit, cases)
+    reference_cases = cases[::max(1, len(cases) // 500)]
+    reference = per_fit_us(reference_fit, reference_cases)
+
+    overflows = []
+    same = fitted = 0
+    for text, plan in cases:
+        wrapped, size = fast_fit(text, plan)
+        width, height = bbox_size(wrapped, size, plan.align)
+        fits = width <= plan.box[0] and height <= plan.box[1]
+        if size > plan.min_font_size or fits:
+            fitted += 1
+            if not fits:
+                overflows.append((text, plan, size, (width, height)))
+    gaps = []
+    for text, plan in reference_cases:
+        expected, fitted_as = reference_fit(text, plan), fast_fit(text, plan)
+        same += expected == fitted_as
+        if expected is not None:
+            gaps.append(expected[1] - fitted_as[1])
+
+    for text, plan, size, measured in overflows[:5]:
+        print(f"❌ {text!r} at {size}px measures {measured} in box {plan.box}")
+    if not overflows:
+        print(f"✅ All {fitted} fitted headlines stay inside their boxes (measured with multiline_textbbox)")
+    agreement = same / len(reference_cases)
+    mean_gap = sum(gaps) / len(gaps) if gaps else 0.0
+    print(f"Same size and line breaks as textbbox probing: {100 * agreement:.1f}% of {len(reference_cases)} fits")
+    print(f"Font size vs textbbox probing: {mean_gap:+.2f}px smaller on average, at most {max(gaps, default=0)}px")
+    print(f"\n{'fitter':<28}{'us/fit':>10}")
+    print(f"{'textbbox probes':<28}{reference:>10.1f}")
+    print(f"{'glyph tables (cold)':<28}{cold:>10.1f}")
+    print(f"{'glyph tables (warm)':<28}{warm:>10.1f}")
+    print(f"speedup (warm): {reference / warm:.1f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "fits": len(cases), "overflows": len(overflows), "agreement": round(agreement, 4), "mean_size_gap": round(mean_gap, 3),
+                "us_per_fit": {"textbbox": round(reference, 2), "cold": round(cold, 2), "warm": round(warm, 2)},
+            }, f, indent=2)
+
+    sys.exit(1 if overflows else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Server-side compliance scanning for ad copy.
+
+Port of the browser rules in frontend/lib/compliance/rules.ts (keep both in
+sync). The browser scanner runs every rule's regex over the text in turn;
+here all rules are compiled into one alternation with a named group per
+rule, so each text is scanned once and every match reports its rule id and
+span. A lookahead of each rule's cheapest necessary prefix ("lead") guards
+the alternation, so most positions are rejected without trying any rule.
+
+Matches don't overlap: where two rules match at the same position, the one
+listed first in RULES claims the span, so RULES is ordered from the most to
+the least specific. A text is flagged exactly when some rule matches it.
+"""
+
+import bisect
+import os
+import re
+import threading
+from dataclasses import dataclass
+
+# Configuration
+
+COPY_COMPLIANCE = os.getenv("COPY_COMPLIANCE", "1") == "1"  # discard LLM copy that trips a rule
+COMPLIANCE_MAX_TEXTS = int(os.getenv("COMPLIANCE_MAX_TEXTS", "10000"))  # per bulk request
+COMPLIANCE_MAX_CHARS = int(os.getenv("COMPLIANCE_MAX_CHARS", "2000000"))  # total per bulk request
+
+# Texts are scanned together joined by this character; no rule can match across it
+SEPARATOR = "\x00"
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: str
+    name: str
+    pattern: str
+    message: str
+    lead: str  # necessary condition at the start of every match
+    ignore_case: bool = False
+
+
+RULES = [
+    Rule(
+        "email", "Email address",
+        r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}",
+        "⚠️ Email address detected — treat as personal data",
+        lead=r"[A-Za-z0-9._%+-]*+@", ignore_case=True,
+    ),
+    Rule(
+        "api_key", "API key / token pattern",
+        r"\b(?:sk|pk|api|token|key)[-_]?[A-Za-z0-9]{20,}\b",
+        "⚠️ API key/token pattern detected — credential leak risk",
+        lead=r"\b(?i:sk|pk|api|token|key)", ignore_case=True,
+    ),
+    Rule(
+        "pan", "PAN-style identifier",
+        r"\b[A-Z]{5}\d{4}[A-Z]\b",
+        "⚠️ PAN-like pattern detected — Indian tax identifier (sensitive)",
+        lead=r"\b[A-Z]{5}\d",
+    ),
+    Rule(
+        "credit_card", "Credit card pattern",
+        r"\b(?:\d{4}[-\s]?){3}\d{4}\b",
+        "⚠️ Credit card pattern detected — payment data (highly sensitive)",
+        lead=r"\b\d",
+    ),
+    Rule(
+        "aadhaar", "Aadhaar-like pattern",
+        r"\b\d{4}\s?\d{4}\s?\d{4}\b",
+        "⚠️ 12-digit pattern detected — may be Aadhaar (highly sensitive)",
+        lead=r"\b\d",
+    ),
+    Rule(
+        "phone", "Phone number",
+        r"(?:\+?\d{1,3}[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}",
+        "⚠️ Phone number detected — verify consent before storing",
+        lead=r"[+(]?\d",
+    ),
+    Rule(
+        "long_token", "Long alphanumeric string",
+        r"\b[A-Za-z0-9]{32,}\b",
+        "⚠️ Long token-like string detected — may be sensitive credential",
+        lead=r"\b[A-Za-z0-9]{32}",
+    ),
+]
+
+
+def compile_rules(rules) -> re.Pattern:
+    """One pattern for all rules: a lookahead of their leads, then one named group per rule"""
+    leads = "|".join(dict.fromkeys(rule.lead for rule in rules))
+    groups = "|".join(
+        f"(?P<{rule.id}>{f'(?i:{rule.pattern})' if rule.ignore_case else rule.pattern})" for rule in rules
+    )
+    # ASCII: \d, \s and \b behave as in the browser's (non-unicode) regexes
+    return re.compile(f"(?=(?:{leads}))(?:{groups})", re.ASCII)
+
+
+@dataclass(frozen=True)
+class Finding:
+    rule: str
+    start: int
+    end: int
+
+    def as_dict(self) -> dict:
+        return {"rule": self.rule, "start": self.start, "end": self.end}
+
+
+class Scanner:
+    """Single-pass scanner over RULES, with counters for /health"""
+
+    def __init__(self, rules=RULES):
+        self.rules = {rule.id: rule for rule in rules}
+        self.pattern = compile_rules(rules)
+        self._lock = threading.Lock()
+        self.scanned = 0
+        self.flagged = 0
+        self.by_rule = dict.fromkeys(self.rules, 0)
+
+    def _count(self, results: list) -> None:
+        with self._lock:
+            self.scanned += len(results)
+            for findings in results:
+                if findings:
+                    self.flagged += 1
+                for finding in findings:
+                    self.by_rule[finding.rule] += 1
+
+    def scan(self, text: str) -> list:
+        """Findings in `text`, in order"""
+        findings = [Finding(m.lastgroup, m.start(), m.end()) for m in self.pattern.finditer(text)]
+        self._count([findings])
+        return findings
+
+    def scan_many(self, texts: list) -> list:
+        """Findings for each of `texts`, from one pass over all of them"""
+        if any(SEPARATOR in text for text in texts):
+            return [self.scan(text) for text in texts]
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        results = [[] for _ in texts]
+        for m in self.pattern.finditer(SEPARATOR.join(texts)):
+            i = bisect.bisect_right(starts, m.start()) - 1
+            results[i].append(Finding(m.lastgroup, m.start() - starts[i], m.end() - starts[i]))
+        self._count(results)
+        return results
+
+    def stats(self) -> dict:
+        return {"scanned": self.scanned, "flagged": self.flagged, "by_rule": dict(self.by_rule)}
+
+
+scanner = Scanner()
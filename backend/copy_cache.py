@@ -0,0 +1,208 @@
+"""
+TTL cache for validated LLM ad copy, with request coalescing.
+
+The same product names keep coming back with the same angle, so validated
+`{headline, cta}` results are cached per (normalized product name, angle).
+Each key can hold several alternatives; until COPY_CACHE_ALTERNATIVES have
+been collected, new upstream calls are still made and their results added.
+Identical concurrent requests share a single upstream call.
+
+Entries live in memory and are optionally persisted to SQLite so they
+survive restarts.
+"""
+
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from metrics import COPY_CACHE_EVENTS
+
+# Configuration
+
+COPY_CACHE_TTL = float(os.getenv("COPY_CACHE_TTL", str(24 * 3600)))  # seconds
+COPY_CACHE_MAX_KEYS = int(os.getenv("COPY_CACHE_MAX_KEYS", "10000"))
+COPY_CACHE_ALTERNATIVES = int(os.getenv("COPY_CACHE_ALTERNATIVES", "1"))  # distinct results to collect per key
+COPY_CACHE_DB = os.getenv("COPY_CACHE_DB", "")  # empty = memory only
+
+
+def normalize_key(product_name: str, angle: str) -> str:
+    name = re.sub(r"\s+", " ", (product_name or "").strip().lower())
+    return f"{name}\x1f{angle}"
+
+
+def is_valid_copy(data) -> bool:
+    return (
+        isinstance(data, dict)
+        and isinstance(data.get("headline"), str) and data["headline"].strip() != ""
+        and isinstance(data.get("cta"), str) and data["cta"].strip() != ""
+    )
+
+
+class CopyCache:
+    """In-memory TTL cache of copy alternatives with optional SQLite write-through"""
+
+    def __init__(
+        self,
+        ttl: float = COPY_CACHE_TTL,
+        max_keys: int = COPY_CACHE_MAX_KEYS,
+        alternatives: int = COPY_CACHE_ALTERNATIVES,
+        db_path: str = COPY_CACHE_DB,
+    ):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.alternatives = max(1, alternatives)
+        self.db_path = db_path or None
+        self._entries = {}  # key -> list of (expires_at, {"headline", "cta"})
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> asyncio.Future, only touched from the event loop
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        if self.db_path:
+            self._init_db()
+
+    # Persistence
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _init_db(self) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS copy_cache ("
+                "key TEXT NOT NULL, headline TEXT NOT NULL, cta TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS copy_cache_key ON copy_cache (key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS copy_cache_expires ON copy_cache (expires_at)")
+            conn.execute("DELETE FROM copy_cache WHERE expires_at <= ?", (now,))
+            rows = conn.execute("SELECT key, headline, cta, expires_at FROM copy_cache").fetchall()
+        for key, headline, cta, expires_at in sorted(rows, key=lambda row: row[3]):
+            items = self._entries.pop(key, [])  # re-inserted: most recently written last, as in put
+            items.append((expires_at, {"headline": headline, "cta": cta}))
+            self._entries[key] = items[-self.alternatives:]
+        # The file may have been written with a larger COPY_CACHE_MAX_KEYS, or by several processes
+        evicted = []
+        while len(self._entries) > self.max_keys:
+            key = next(iter(self._entries))
+            self._entries.pop(key)
+            evicted.append((key,))
+        if evicted:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM copy_cache WHERE key = ?", evicted)
+
+    def _persist(self, key: str, data: dict, expires_at: float) -> None:
+        """Write one alternative; in the same transaction purge expired rows and keep the key's newest ones"""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO copy_cache (key, headline, cta, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, data["headline"], data["cta"], expires_at),
+                )
+                conn.execute("DELETE FROM copy_cache WHERE expires_at <= ?", (time.time(),))
+                conn.execute(
+                    "DELETE FROM copy_cache WHERE key = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM copy_cache WHERE key = ? ORDER BY rowid DESC LIMIT ?)",
+                    (key, key, self.alternatives),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ [Copy Cache] SQLite write failed: {e}")
+
+    # Sync API
+
+    def lookup(self, product_name: str, angle: str, count: int = None) -> list:
+        """Up to `count` unexpired alternatives for a key (all of them by default)"""
+        key = normalize_key(product_name, angle)
+        now = time.time()
+        with self._lock:
+            alive = [(exp, data) for exp, data in self._entries.get(key, []) if exp > now]
+            if alive:
+                self._entries[key] = alive
+            else:
+                self._entries.pop(key, None)
+        items = [data for _, data in alive]
+        return items[:count] if count else items
+
+    def get(self, product_name: str, angle: str):
+        """One random alternative once enough have been collected, else None"""
+        items = self.lookup(product_name, angle)
+        if len(items) >= self.alternatives:
+            self._count("hits")
+            return dict(random.choice(items))
+        self._count("misses")
+        return None
+
+    def _count(self, event: str) -> None:
+        with self._lock:
+            setattr(self, event, getattr(self, event) + 1)
+        COPY_CACHE_EVENTS.inc(event)
+
+    def put(self, product_name: str, angle: str, data: dict) -> None:
+        if not is_valid_copy(data):
+            return
+        data = {"headline": data["headline"], "cta": data["cta"]}
+        key = normalize_key(product_name, angle)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            items = self._entries.pop(key, [])
+            if any(existing == data for _, existing in items):
+                self._entries[key] = items
+                return
+            items.append((expires_at, data))
+            self._entries[key] = items[-self.alternatives:]  # re-inserted: most recently written last
+            while len(self._entries) > self.max_keys:
+                self._entries.pop(next(iter(self._entries)))
+        if self.db_path:
+            self._persist(key, data, expires_at)
+
+    # Async API
+
+    async def get_or_fetch(self, product_name: str, angle: str, fetch):
+        """
+        Return cached copy, or await `fetch()` (a coroutine factory) and cache
+        its result. Concurrent callers for the same key share one fetch.
+        """
+        cached = self.get(product_name, angle)
+        if cached:
+            return cached
+
+        key = normalize_key(product_name, angle)
+        future = self._inflight.get(key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await fetch()
+            if is_valid_copy(data):
+                await asyncio.to_thread(self.put, product_name, angle, data)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = len(self._entries)
+            hits, misses, coalesced = self.hits, self.misses, self.coalesced
+        return {
+            "hits": hits,
+            "misses": misses,
+            "coalesced": coalesced,
+            "keys": keys,
+            "persistent": self.db_path is not None,
+        }
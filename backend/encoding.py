@@ -0,0 +1,90 @@
+"""
+Output encoding shared by both services.
+
+Pillow's default lossless PNG is the slowest stage after inference for large
+opaque canvases and produces the biggest payloads. `EncodeSettings` describes
+the requested output (PNG with a chosen compress level, lossy or lossless
+WebP with alpha, or JPEG for opaque images) and `encode_image` applies it,
+reporting encode time and output size.
+"""
+
+import io
+import os
+import time
+from dataclasses import dataclass
+
+from PIL import Image
+
+import metrics
+
+# Configuration
+
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "png")
+OUTPUT_QUALITY = int(os.getenv("OUTPUT_QUALITY", "90"))  # WebP/JPEG quality, 1-100
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "6"))  # 0 (fastest) - 9 (smallest)
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+
+@dataclass(frozen=True)
+class EncodeSettings:
+    format: str = OUTPUT_FORMAT
+    quality: int = OUTPUT_QUALITY
+    compress_level: int = PNG_COMPRESS_LEVEL
+    lossless: bool = False  # WebP only
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def cache_options(self) -> dict:
+        """Only the fields that affect the output of this format"""
+        if self.format == "png":
+            return {"format": "png", "compress_level": self.compress_level}
+        if self.format == "webp" and self.lossless:
+            return {"format": "webp", "lossless": True, "quality": self.quality}
+        return {"format": self.format, "quality": self.quality}
+
+
+def resolve_encoding(
+    output_format: str = None,
+    quality: int = None,
+    compress_level: int = None,
+    lossless: bool = False,
+    allowed=tuple(MEDIA_TYPES),
+) -> EncodeSettings:
+    """Validate request options into EncodeSettings. Raises ValueError on bad input."""
+    fmt = (output_format or OUTPUT_FORMAT).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in allowed:
+        raise ValueError(f"Invalid output_format '{output_format}'. Allowed: {', '.join(allowed)}")
+    quality = OUTPUT_QUALITY if quality is None else quality
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be between 1 and 100")
+    compress_level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+    if not 0 <= compress_level <= 9:
+        raise ValueError("compress_level must be between 0 and 9")
+    return EncodeSettings(fmt, quality, compress_level, bool(lossless))
+
+
+def encode_image(image: Image.Image, settings: EncodeSettings = EncodeSettings()) -> tuple:
+    """Encode an image. Returns (bytes, encode time in ms)."""
+    started = time.perf_counter()
+    buf = io.BytesIO()
+    if settings.format == "png":
+        image.save(buf, format="PNG", compress_level=settings.compress_level)
+    elif settings.format == "webp":
+        # method 4 is Pillow's default speed/size trade-off; alpha is kept as-is
+        image.save(buf, format="WEBP", quality=settings.quality, lossless=settings.lossless, method=4)
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buf, format="JPEG", quality=settings.quality, optimize=False)
+    elapsed = time.perf_counter() - started
+    metrics.record("encode", elapsed)
+    return buf.getvalue(), round(1000 * elapsed, 2)
@@ -0,0 +1,78 @@
+"""
+Local stand-in for the Groq chat-completions API.
+
+Used to test and load-test copy generation without network access or API
+costs. Point the layout service at it with:
+
+    uvicorn groq_stub:app --port 8099
+    GROQ_API_KEY=stub GROQ_BASE_URL=http://localhost:8099 uvicorn ai_layout_api:app --port 8000
+
+Latency and failures are configurable through environment variables.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Configuration
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "300"))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", "100"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))  # 0..1, fraction of calls answered with 500
+
+HEADLINES = ["Silence The Noise", "Adventure Ready Warmth", "Own Every Moment", "Pure Bold Comfort", "Made To Last"]
+CTAS = ["Shop Now", "Listen Now", "Explore Gear", "Get Yours", "Buy Today"]
+
+app = FastAPI(title="Groq API stub")
+
+
+def fake_ad() -> dict:
+    return {"headline": random.choice(HEADLINES), "cta": random.choice(CTAS)}
+
+
+def fake_content(prompt: str) -> str:
+    # Batch prompts list numbered tones and ask for {"ads": [...]}
+    if '"ads"' in prompt:
+        n = len(re.findall(r"^\d+\. ", prompt, flags=re.MULTILINE)) or 1
+        return json.dumps({"ads": [fake_ad() for _ in range(n)]})
+    return json.dumps(fake_ad())
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(max(0.0, STUB_LATENCY_MS + random.uniform(-STUB_JITTER_MS, STUB_JITTER_MS)) / 1000)
+
+    if random.random() < STUB_ERROR_RATE:
+        return JSONResponse(status_code=500, content={"error": {"message": "stub: injected failure", "type": "internal_server_error"}})
+
+    prompt = body["messages"][-1]["content"]
+    content = fake_content(prompt)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        },
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8099)
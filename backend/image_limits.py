@@ -0,0 +1,305 @@
+"""
+Header-first upload validation, pixel budgets and a per-process memory budget.
+
+A file extension and a byte size say nothing about what decoding will cost:
+a 200 KB PNG can be 30000x30000 pixels and allocate gigabytes in
+`Image.open(...).convert()`. Uploads are therefore checked before any pixel
+is decoded:
+
+- `read_header` sniffs the format from its magic bytes (PNG, JPEG, WebP)
+  and reads the dimensions from the image header only;
+- a `PixelBudget` per service rejects images above its megapixel limit
+  (413), or with downscale-on-decode enabled decodes them reduced to fit
+  (JPEGs are decoded at 1/2, 1/4 or 1/8 scale directly; other formats up to
+  MAX_DECODE_MEGAPIXELS are decoded and then shrunk);
+- `MemoryBudget` bounds the estimated decode/inference/encode memory of all
+  requests in flight in this process. Requests wait for room, and get
+  503 + Retry-After if none frees up within MEMORY_WAIT_TIMEOUT.
+"""
+
+import asyncio
+import io
+import math
+import os
+import warnings
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from PIL import Image
+
+from workers import ServerBusy
+
+# Configuration
+
+MAX_IMAGE_MEGAPIXELS = float(os.getenv("MAX_IMAGE_MEGAPIXELS", "40"))  # default per-service budget
+DOWNSCALE_ON_DECODE = os.getenv("DOWNSCALE_ON_DECODE", "0") == "1"  # shrink oversized images instead of rejecting them
+MAX_DECODE_MEGAPIXELS = float(os.getenv("MAX_DECODE_MEGAPIXELS", "80"))  # hard cap on pixels a decode may allocate
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "0"))  # 0 = half of the memory available to this process
+MEMORY_BYTES_PER_PIXEL = int(os.getenv("MEMORY_BYTES_PER_PIXEL", "20"))  # peak bytes per decoded pixel across stages
+MEMORY_WAIT_TIMEOUT = float(os.getenv("MEMORY_WAIT_TIMEOUT", "10"))  # seconds
+
+FORMATS = ("png", "jpeg", "webp")
+
+
+class UnsupportedImage(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
+
+class ImageTooLarge(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=413, detail=detail)
+
+
+# Header probing
+
+@dataclass(frozen=True)
+class ImageInfo:
+    format: str
+    width: int
+    height: int
+
+    @property
+    def size(self) -> tuple:
+        return self.width, self.height
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def sniff_format(head: bytes):
+    """Image format from the leading magic bytes, or None"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def read_header(source) -> ImageInfo:
+    """
+    Format and dimensions of an upload (bytes or a seekable file) without
+    decoding pixels. File positions are restored. Raises UnsupportedImage.
+    """
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    position = fp.tell()
+    try:
+        fmt = sniff_format(fp.read(16))
+        if fmt is None:
+            raise UnsupportedImage(f"Unsupported image type. Allowed: {', '.join(FORMATS)}")
+        fp.seek(position)
+        try:
+            with warnings.catch_warnings():
+                # Size limits are enforced by PixelBudget, not Pillow's warning
+                warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+                with Image.open(fp, formats=[fmt.upper()]) as img:
+                    return ImageInfo(fmt, *img.size)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e))
+        except (OSError, SyntaxError, ValueError) as e:
+            raise UnsupportedImage(f"Could not read the {fmt.upper()} header: {e}")
+    finally:
+        fp.seek(position)
+
+
+# Pixel budgets
+
+def _draft_scale(info: ImageInfo, target: tuple) -> int:
+    # Largest JPEG DCT scale (1, 2, 4, 8) that still decodes at least `target`
+    scale = 1
+    while scale < 8 and info.width // (scale * 2) >= target[0] and info.height // (scale * 2) >= target[1]:
+        scale *= 2
+    return scale
+
+
+class PixelBudget:
+    """Per-service limit on image dimensions, with optional downscale-on-decode"""
+
+    def __init__(
+        self,
+        max_megapixels: float = MAX_IMAGE_MEGAPIXELS,
+        downscale: bool = DOWNSCALE_ON_DECODE,
+        max_decode_megapixels: float = MAX_DECODE_MEGAPIXELS,
+        bytes_per_pixel: int = MEMORY_BYTES_PER_PIXEL,
+    ):
+        self.max_pixels = int(max_megapixels * 1_000_000)
+        self.downscale = downscale
+        self.max_decode_pixels = int(max(max_megapixels, max_decode_megapixels) * 1_000_000)
+        self.bytes_per_pixel = bytes_per_pixel
+        self.rejected = 0
+        self.downscaled = 0
+
+    def fit(self, size: tuple) -> tuple:
+        """`size` scaled down (aspect kept) to fit the megapixel budget"""
+        w, h = size
+        if w * h <= self.max_pixels:
+            return size
+        ratio = math.sqrt(self.max_pixels / (w * h))
+        return max(1, int(w * ratio)), max(1, int(h * ratio))
+
+    def _target(self, info: ImageInfo, box: tuple = None) -> tuple:
+        # Smallest size worth decoding: within the budget and no larger than `box`
+        target = self.fit(info.size)
+        if box:
+            target = (min(target[0], box[0]), min(target[1], box[1]))
+        return target
+
+    def decode_pixels(self, info: ImageInfo, box: tuple = None) -> int:
+        """Pixels the decoder will allocate for this upload (JPEGs are drafted to what's needed)"""
+        target = self._target(info, box)
+        if info.format != "jpeg" or target == info.size:
+            return info.pixels
+        scale = _draft_scale(info, target)
+        return math.ceil(info.width / scale) * math.ceil(info.height / scale)
+
+    def memory_cost(self, info: ImageInfo, box: tuple = None) -> int:
+        """Estimated peak bytes to decode, process and encode this upload"""
+        return self.decode_pixels(info, box) * self.bytes_per_pixel
+
+    def check(self, info: ImageInfo, box: tuple = None) -> ImageInfo:
+        """Raise ImageTooLarge unless `info` can be decoded within this budget"""
+        megapixels = info.pixels / 1_000_000
+        if info.pixels > self.max_pixels and not self.downscale:
+            self.rejected += 1
+            raise ImageTooLarge(
+                f"Image is {info.width}x{info.height} ({megapixels:.1f} MP); the limit is {self.max_pixels / 1_000_000:g} MP"
+            )
+        if self.decode_pixels(info, box) > self.max_decode_pixels:
+            self.rejected += 1
+            raise ImageTooLarge(
+                f"Image is {info.width}x{info.height} ({megapixels:.1f} MP); {info.format.upper()} images can't be "
+                f"decoded above {self.max_decode_pixels / 1_000_000:g} MP"
+            )
+        return info
+
+    def decode(self, data: bytes, mode: str = "RGB", box: tuple = None) -> Image.Image:
+        """
+        Check the header, then decode `data` into `mode` within the budget.
+        With `box`, JPEGs are decoded at the smallest scale still covering
+        `box` (callers fit the image to it themselves).
+        """
+        info = self.check(read_header(data), box)
+        target = self._target(info, box)
+        img = Image.open(io.BytesIO(data), formats=[info.format.upper()])
+        if target != info.size:
+            # JPEG only: decode at 1/2, 1/4 or 1/8 scale instead of full size
+            img.draft("RGB", target)
+        img = img.convert(mode) if img.mode != mode else img
+        img.load()
+        if img.width * img.height > self.max_pixels:
+            img.thumbnail(self.fit(img.size), Image.LANCZOS)
+            self.downscaled += 1
+        return img
+
+    def stats(self) -> dict:
+        return {
+            "max_megapixels": self.max_pixels / 1_000_000,
+            "downscale_on_decode": self.downscale,
+            "max_decode_megapixels": self.max_decode_pixels / 1_000_000,
+            "rejected": self.rejected,
+            "downscaled": self.downscaled,
+        }
+
+
+# Memory budget
+
+def available_memory():
+    """Bytes of memory this process may use (cgroup limit or physical RAM), or None"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value)
+        except OSError:
+            pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_memory_budget() -> int:
+    if MEMORY_BUDGET_MB > 0:
+        return MEMORY_BUDGET_MB * 2**20
+    available = available_memory()
+    return available // 2 if available else 2 * 2**30
+
+
+class MemoryBudget:
+    """
+    Bytes reserved by requests in flight in this process. Reservations are
+    granted first-come first-served; one larger than the whole budget waits
+    until it can run alone.
+    """
+
+    def __init__(self, limit: int = None, wait_timeout: float = MEMORY_WAIT_TIMEOUT):
+        self.limit = limit or default_memory_budget()
+        self.wait_timeout = wait_timeout
+        # Only touched from the event loop thread
+        self._used = 0
+        self._waiters = []  # (bytes, future) in arrival order
+        self.peak = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def _grant(self, nbytes: int) -> None:
+        self._used += nbytes
+        self.peak = max(self.peak, self._used)
+
+    def _wake(self) -> None:
+        while self._waiters and self._used + self._waiters[0][0] <= self.limit:
+            nbytes, future = self._waiters.pop(0)
+            if not future.done():
+                self._grant(nbytes)
+                future.set_result(None)
+
+    def _release(self, nbytes: int) -> None:
+        self._used -= nbytes
+        self._wake()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        """Hold `nbytes` of the budget, waiting up to wait_timeout (then ServerBusy)"""
+        nbytes = min(max(0, int(nbytes)), self.limit)
+        if not self._waiters and self._used + nbytes <= self.limit:
+            self._grant(nbytes)
+        else:
+            self.waited += 1
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((nbytes, future))
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except BaseException as e:
+                if future.done() and not future.cancelled():
+                    self._release(nbytes)  # granted just as we gave up
+                else:
+                    future.cancel()
+                    self._waiters = [w for w in self._waiters if w[1] is not future]
+                    self._wake()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected += 1
+                    raise ServerBusy()
+                raise
+        try:
+            yield
+        finally:
+            self._release(nbytes)
+
+    def stats(self) -> dict:
+        return {
+            "limit_mb": round(self.limit / 2**20, 1),
+            "reserved_mb": round(self._used / 2**20, 1),
+            "peak_mb": round(self.peak / 2**20, 1),
+            "waiting": len(self._waiters),
+            "waited": self.waited,
+            "rejected": self.rejected,
+        }
+
+
+# Shared by every service in this process
+memory_budget = MemoryBudget()
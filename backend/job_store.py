@@ -0,0 +1,390 @@
+"""
+Persistent SQLite store for asynchronous campaign jobs.
+
+A job is one submission of many packshots; each packshot is an item. Items
+are the unit of work: job workers (job_worker.py) claim the oldest queued
+item, process it and record its result, so any number of worker processes
+can pull from the same queue.
+
+- A claim is a lease. Items whose worker died are put back in the queue when
+  the lease expires, or at once when the worker ran on this host and its
+  process is gone, so jobs resume after a crash or restart.
+- A failed item is retried with exponential backoff until JOB_MAX_ATTEMPTS;
+  after that it stays failed until the job is retried.
+- Uploads are kept on disk next to the database until the job is collected,
+  JOB_TTL seconds after it finished.
+
+Job status is derived from its items: queued, running, completed (every item
+done or failed) or cancelled.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Configuration
+
+JOB_STORE_DIR = os.getenv("JOB_STORE_DIR", os.path.join(tempfile.gettempdir(), "creativegen-jobs"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # per item, including the first
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))  # seconds before the first retry, doubled each time
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))  # an item running longer is handed to another worker
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))  # seconds a finished job is kept
+JOB_GC_INTERVAL = int(os.getenv("JOB_GC_INTERVAL", "600"))  # seconds
+
+HOST = socket.gethostname()
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, params TEXT NOT NULL, total INTEGER NOT NULL, "
+    "created_at REAL NOT NULL, updated_at REAL NOT NULL, cancelled INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS job_items ("
+    "job_id TEXT NOT NULL, idx INTEGER NOT NULL, product_name TEXT NOT NULL, status TEXT NOT NULL, "
+    "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, worker TEXT, lease_until REAL, "
+    "result TEXT, error TEXT, started_at REAL, finished_at REAL, PRIMARY KEY (job_id, idx))",
+    # Index entries end with the rowid, so queued items come out in submission order
+    "CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status)",
+]
+
+# In an UPDATE of job_items: whether the item's job has been cancelled
+JOB_CANCELLED = "(SELECT cancelled FROM jobs WHERE id = job_items.job_id)"
+
+ITEM_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+
+def worker_id() -> str:
+    return f"{HOST}:{os.getpid()}"
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """Jobs and their items in SQLite (WAL), with uploads under `root`/inputs"""
+
+    def __init__(
+        self,
+        root: str = JOB_STORE_DIR,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_delay: float = JOB_RETRY_DELAY,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        ttl: int = JOB_TTL,
+    ):
+        self.root = root
+        self.db_path = os.path.join(root, "jobs.db")
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.collected = 0
+        os.makedirs(os.path.join(root, "inputs"), exist_ok=True)
+        conn = self._connect()
+        try:
+            # Readers (status polls) don't block the workers' writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    # Connections
+
+    def _connect(self):
+        # Autocommit; writes take the database lock up front with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def input_path(self, job_id: str, name) -> str:
+        return os.path.join(self.root, "inputs", job_id, str(name))
+
+    # Submission (API)
+
+    def create(self, params: dict, products: list, logo=None) -> str:
+        """
+        Store uploads and queue one item per product. `products` is a list of
+        (product name, readable file); `logo` is a readable file or None.
+        Returns the job id.
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(self.input_path(job_id, "logo")))
+        sources = [(i, fp) for i, (_, fp) in enumerate(products)] + ([("logo", logo)] if logo else [])
+        for name, fp in sources:
+            fp.seek(0)
+            with open(self.input_path(job_id, name), "wb") as out:
+                shutil.copyfileobj(fp, out)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, params, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(dict(params, logo=bool(logo))), len(products), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, product_name, status, available_at) VALUES (?, ?, ?, 'queued', ?)",
+                [(job_id, i, name, now) for i, (name, _) in enumerate(products)],
+            )
+        with self._lock:
+            self.submitted += 1
+        return job_id
+
+    # Work queue (workers)
+
+    def claim(self, worker: str):
+        """
+        Lease the oldest available item to `worker`: a dict with "job_id",
+        "index", "product_name", "attempt" and the job's "params", or None.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._release(conn, "status = 'running' AND lease_until < ?", (now,), "lease expired")
+            row = conn.execute(
+                "UPDATE job_items SET status = 'running', attempts = attempts + 1, worker = ?, "
+                "lease_until = ?, started_at = ? "
+                "WHERE rowid = (SELECT rowid FROM job_items WHERE status = 'queued' AND available_at <= ? "
+                "AND job_id NOT IN (SELECT id FROM jobs WHERE cancelled = 1) ORDER BY rowid LIMIT 1) "
+                "RETURNING job_id, idx, product_name, attempts",
+                (worker, now + self.lease_seconds, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            params = conn.execute("SELECT params FROM jobs WHERE id = ?", (row["job_id"],)).fetchone()["params"]
+        return {
+            "job_id": row["job_id"],
+            "index": row["idx"],
+            "product_name": row["product_name"],
+            "attempt": row["attempts"],
+            "params": json.loads(params),
+        }
+
+    def _release(self, conn, where: str, args: tuple, error: str) -> int:
+        """Requeue running items matching `where` (fail them once out of attempts, cancel them if the job was)"""
+        now = time.time()
+        return conn.execute(
+            "UPDATE job_items SET "
+            f"status = CASE WHEN {JOB_CANCELLED} THEN 'cancelled' WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            f"finished_at = CASE WHEN {JOB_CANCELLED} OR attempts >= ? THEN ? END, "
+            "available_at = ?, worker = NULL, lease_until = NULL, error = ? "
+            f"WHERE {where}",
+            (self.max_attempts, self.max_attempts, now, now, f"Worker lost: {error}", *args),
+        ).rowcount
+
+    def complete(self, item: dict, worker: str, result: dict) -> bool:
+        """Record a finished item; False if the lease was lost meanwhile"""
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE job_items SET status = 'done', result = ?, error = NULL, finished_at = ?, lease_until = NULL "
+                "WHERE job_id = ? AND idx = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result), now, item["job_id"], item["index"], worker),
+            ).rowcount
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, item["job_id"]))
+        return updated == 1
+
+    def fail(self, item: dict, worker: str, error: str) -> bool:
+        """Record a failed attempt; True if the item will be retried"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "UPDATE job_items SET "
+                f"status = CASE WHEN {JOB_CANCELLED} THEN 'cancelled' WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                f"finished_at = CASE WHEN {JOB_CANCELLED} OR attempts >= ? THEN ? END, "
+                "available_at = ? + ? * (1 << (attempts - 1)), worker = NULL, lease_until = NULL, error = ? "
+                "WHERE job_id = ? AND idx = ? AND worker = ? AND status = 'running' "
+                "RETURNING status",
+                (self.max_attempts, self.max_attempts, now, now, self.retry_delay, error,
+                 item["job_id"], item["index"], worker),
+            ).fetchone()
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, item["job_id"]))
+        return row is not None and row["status"] == "queued"
+
+    def recover(self) -> int:
+        """Requeue items held by workers on this host whose process is gone; returns how many"""
+        with self._transaction() as conn:
+            workers = [row["worker"] for row in conn.execute(
+                "SELECT DISTINCT worker FROM job_items WHERE status = 'running'"
+            )]
+            lost = [w for w in workers if w.rsplit(":", 1)[0] == HOST and not pid_alive(int(w.rsplit(":", 1)[1]))]
+            return sum(
+                self._release(conn, "status = 'running' AND worker = ?", (w,), "process exited") for w in lost
+            )
+
+    # Control (API)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job's queued items; running items finish, but are cancelled
+        rather than requeued if they fail. False if the job is unknown.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if not conn.execute("UPDATE jobs SET cancelled = 1, updated_at = ? WHERE id = ?", (now, job_id)).rowcount:
+                return False
+            conn.execute(
+                "UPDATE job_items SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+        return True
+
+    def retry(self, job_id: str) -> int:
+        """Requeue failed and cancelled items with fresh attempts; returns how many, or -1 if unknown"""
+        now = time.time()
+        with self._transaction() as conn:
+            if not conn.execute("UPDATE jobs SET cancelled = 0, updated_at = ? WHERE id = ?", (now, job_id)).rowcount:
+                return -1
+            return conn.execute(
+                "UPDATE job_items SET status = 'queued', attempts = 0, available_at = ?, finished_at = NULL, error = NULL "
+                "WHERE job_id = ? AND status IN ('failed', 'cancelled')",
+                (now, job_id),
+            ).rowcount
+
+    # Queries (API)
+
+    def status(self, job_id: str):
+        """Job status, progress and counts by item status, or None if unknown"""
+        conn = self._connect()
+        try:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict.fromkeys(ITEM_STATUSES, 0)
+            counts.update(conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            # Failed items, and queued ones waiting to retry after an error
+            errors = conn.execute(
+                "SELECT idx, status, attempts, available_at, error FROM job_items WHERE job_id = ? AND ("
+                "status = 'failed' OR (status = 'queued' AND attempts > 0 AND error IS NOT NULL)) "
+                "ORDER BY idx LIMIT 20",
+                (job_id,),
+            ).fetchall()
+            finished_at = conn.execute(
+                "SELECT MAX(finished_at) FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        active = counts["queued"] + counts["running"]
+        if job["cancelled"]:
+            status = "cancelled"
+        elif not active:
+            status = "completed"
+        elif counts["queued"] == job["total"]:
+            status = "queued"
+        else:
+            status = "running"
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": job["total"],
+            "items": counts,
+            "progress": round((counts["done"] + counts["failed"]) / job["total"], 4) if job["total"] else 1.0,
+            "created_at": job["created_at"],
+            "finished_at": finished_at if not active else None,
+            "errors": [
+                {
+                    "index": e["idx"],
+                    "status": e["status"],
+                    "attempts": e["attempts"],
+                    "retry_at": e["available_at"] if e["status"] == "queued" else None,
+                    "error": e["error"],
+                }
+                for e in errors
+            ],
+        }
+
+    def items(self, job_id: str) -> list:
+        """Every item of a job in submission order, with its result once done"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT idx, product_name, status, attempts, result, error FROM job_items WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "index": row["idx"],
+                "product_name": row["product_name"],
+                "status": row["status"],
+                "attempts": row["attempts"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+            }
+            for row in rows
+        ]
+
+    # Garbage collection
+
+    def gc(self) -> int:
+        """Delete jobs (and their uploads) finished more than `ttl` ago; returns the number removed"""
+        cutoff = time.time() - self.ttl
+        with self._transaction() as conn:
+            expired = [row["id"] for row in conn.execute(
+                "SELECT id FROM jobs WHERE updated_at < ? AND NOT EXISTS ("
+                "SELECT 1 FROM job_items WHERE job_id = jobs.id AND status IN ('queued', 'running'))",
+                (cutoff,),
+            )]
+            for job_id in expired:
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.root, "inputs", job_id), ignore_errors=True)
+        with self._lock:
+            self.collected += len(expired)
+        return len(expired)
+
+    async def gc_loop(self, interval: int = JOB_GC_INTERVAL) -> None:
+        while True:
+            removed = await asyncio.to_thread(self.gc)
+            if removed:
+                print(f"🧹 [Job Store] Collected {removed} finished jobs")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        try:
+            counts = dict.fromkeys(ITEM_STATUSES, 0)
+            counts.update(conn.execute("SELECT status, COUNT(*) FROM job_items GROUP BY status").fetchall())
+            workers = conn.execute(
+                "SELECT COUNT(DISTINCT worker) FROM job_items WHERE status = 'running'"
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            return {
+                "root": self.root,
+                "submitted": self.submitted,
+                "collected": self.collected,
+                "items": counts,
+                "busy_workers": workers,
+            }
@@ -0,0 +1,237 @@
+"""
+Job workers: processes that pull campaign items from the job store.
+
+Each worker claims the oldest queued item (one packshot of a job), removes
+its background with the pooled rembg sessions, renders the job's templates
+at every platform size with `render_variation` and writes the outputs to the
+result store. Workers coordinate only through SQLite, so throughput grows
+with the number of worker processes.
+
+The pipeline API starts JOB_WORKERS of them with the app and replaces any
+that die. More can run alongside on the same host:
+
+    cd backend
+    python -m job_worker --workers 4
+
+The services are imported inside the worker, after its ONNX Runtime thread
+count is set, so each of N workers uses about 1/N of the cores.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from functools import lru_cache
+
+from job_store import JobStore, worker_id
+
+# Configuration
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))  # processes started by the pipeline API; 0 = none
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # seconds between claims while the queue is empty
+JOB_STOP_TIMEOUT = float(os.getenv("JOB_STOP_TIMEOUT", "10"))  # seconds to finish the current item on shutdown
+JOB_RESTART_DELAY = float(os.getenv("JOB_RESTART_DELAY", "5"))  # seconds before restarting a dead worker, doubled each time
+JOB_RESTART_MAX_DELAY = float(os.getenv("JOB_RESTART_MAX_DELAY", "300"))  # cap; a worker up this long resets the delay
+
+
+@lru_cache(maxsize=4)
+def job_logo(path: str, box: tuple):
+    """A job's logo, decoded once per worker"""
+    import ai_layout_api as layout
+
+    with open(path, "rb") as f:
+        return layout.decode_prepared(f.read(), box)
+
+
+def process_item(item: dict, store: JobStore) -> dict:
+    """Cut out one packshot and render every template x platform for it; returns the item's result"""
+    import ai_layout_api as layout
+    import background_removal_api as removal
+    from batch_inference import remove_low_res
+    from encoding import EncodeSettings
+    from metrics import stage
+
+    started = time.perf_counter()
+    params = item["params"]
+    templates = params["templates"]
+    targets = {name: tuple(size) for name, size in params["targets"].items()}
+    sizes = sorted(set(targets.values()))
+    colors = {key: tuple(value) for key, value in params["colors"].items()}
+    encoding = EncodeSettings(**params["encoding"])
+
+    with open(store.input_path(item["job_id"], item["index"]), "rb") as f:
+        image = removal.decode_image(f.read())
+    if params["remove_background"]:
+        with stage("inference"):
+            if params["low_res"]:
+                image = remove_low_res(image, params["model"])
+            else:
+                image = removal.remove_with_pool(image, params["model"])
+    product_img = layout.PreparedAsset(image.convert("RGBA"), layout.max_product_box(templates, sizes))
+    logo_img = None
+    if params["logo"]:
+        logo_img = job_logo(store.input_path(item["job_id"], "logo"), layout.max_logo_box(sizes))
+
+    copies = [layout.generate_ad_copy(item["product_name"], i) for i in range(len(templates))]
+    keys = {}
+    for i, template in enumerate(templates):
+        for size in sizes:
+            data, _ = layout.render_variation(template, product_img, logo_img, copies[i], colors, size, encoding)
+            keys[(i, size)] = layout.result_store.put(data, encoding.media_type)
+
+    return {
+        "templates": [t["id"] for t in templates],
+        "platforms": {name: [keys[(i, size)] for i in range(len(templates))] for name, size in targets.items()},
+        "copy": copies,
+        "cutout_size": {"width": image.width, "height": image.height},
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def work(parent: int = None, threads: int = None) -> None:
+    """Claim and process items until SIGTERM/SIGINT, or until `parent` exits"""
+    if threads:
+        os.environ.setdefault("ORT_INTRA_OP_THREADS", str(threads))
+    stopping = threading.Event()
+    # The current item is finished first; the lease covers a hard kill
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    store = JobStore()
+    me = worker_id()
+    print(f"👷 [Job Worker {me}] Started")
+    while not stopping.is_set():
+        if parent is not None and os.getppid() != parent:
+            break
+        item = store.claim(me)
+        if item is None:
+            stopping.wait(JOB_POLL_INTERVAL)
+            continue
+        try:
+            result = process_item(item, store)
+        except Exception as e:
+            retrying = store.fail(item, me, f"{type(e).__name__}: {e}")
+            print(
+                f"❌ [Job {item['job_id']}] Item {item['index']} failed on attempt {item['attempt']}: {e}"
+                + (" Retrying later." if retrying else "")
+            )
+            continue
+        if not store.complete(item, me, result):
+            print(f"⚠️ [Job {item['job_id']}] Item {item['index']} finished after its lease was lost")
+    print(f"👋 [Job Worker {me}] Stopped")
+
+
+class JobWorkers:
+    """
+    A fixed number of worker processes; dead ones are replaced and their items
+    requeued. A worker that keeps dying soon after starting (a bad model file,
+    a missing dependency) is restarted with exponential backoff, up to
+    JOB_RESTART_MAX_DELAY between attempts, rather than every check.
+    """
+
+    def __init__(self, store: JobStore, count: int = JOB_WORKERS):
+        self.store = store
+        self.count = max(0, count)
+        self.threads = max(1, (os.cpu_count() or 1) // max(1, self.count))
+        self._processes = []  # per slot: the process, or None while waiting to restart
+        self._started = []  # per slot: monotonic start time
+        self._failures = []  # per slot: exits in a row without staying up JOB_RESTART_MAX_DELAY
+        self._restart_at = []  # per slot: monotonic time of the next restart
+        self.restarts = 0
+
+    def _spawn(self):
+        # A fresh interpreter: no inherited event loop, sockets, threads or ONNX sessions
+        process = multiprocessing.get_context("spawn").Process(
+            target=work, kwargs={"parent": os.getpid(), "threads": self.threads}, name="job-worker", daemon=True
+        )
+        process.start()
+        return process
+
+    def start(self) -> None:
+        if self._processes or not self.count:
+            return
+        recovered = self.store.recover()
+        if recovered:
+            print(f"♻️ [Job Workers] Requeued {recovered} items left running by a previous process")
+        self._processes = [self._spawn() for _ in range(self.count)]
+        self._started = [time.monotonic()] * self.count
+        self._failures = [0] * self.count
+        self._restart_at = [0.0] * self.count
+
+    def check(self) -> None:
+        """Replace exited workers once their backoff has passed (is_alive reaps them, so recover sees them gone)"""
+        now = time.monotonic()
+        for i, process in enumerate(self._processes):
+            if process is None:
+                if now >= self._restart_at[i]:
+                    self._processes[i] = self._spawn()
+                    self._started[i] = now
+                    self.restarts += 1
+                continue
+            if process.is_alive():
+                continue
+            recovered = self.store.recover()
+            if now - self._started[i] >= JOB_RESTART_MAX_DELAY:
+                self._failures[i] = 0
+            self._failures[i] += 1
+            delay = min(JOB_RESTART_MAX_DELAY, JOB_RESTART_DELAY * 2 ** (self._failures[i] - 1))
+            print(
+                f"⚠️ [Job Workers] Worker {process.pid} exited ({process.exitcode}); {recovered} items requeued, "
+                f"restarting in {delay:.0f}s (exit {self._failures[i]} in a row)"
+            )
+            self._processes[i] = None
+            self._restart_at[i] = now + delay
+
+    async def supervise(self, interval: float = 5) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.check)
+
+    def stop(self, timeout: float = JOB_STOP_TIMEOUT) -> None:
+        running = [process for process in self._processes if process is not None]
+        for process in running:
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._processes = []
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        waiting = [i for i, process in enumerate(self._processes) if process is None]
+        return {
+            "processes": self.count,
+            "alive": sum(1 for process in self._processes if process is not None and process.is_alive()),
+            "ort_threads_per_worker": self.threads,
+            "restarts": self.restarts,
+            "waiting_to_restart": len(waiting),
+            "next_restart_in": round(max(0.0, min(self._restart_at[i] for i in waiting) - now), 1) if waiting else None,
+            "consecutive_failures": max(self._failures, default=0),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued campaign jobs from the job store")
+    parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS), help="worker processes")
+    args = parser.parse_args()
+
+    workers = JobWorkers(JobStore(), args.workers)
+    workers.start()
+    try:
+        while True:
+            time.sleep(5)
+            workers.check()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        workers.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Per-stage timing for both services.
+
+Code wraps the work it wants measured in `stage(name)` (upload read, decode,
+inference, LLM call, render, encode, base64, ...). Every measurement goes
+into a Prometheus histogram served at GET /metrics, and into the current
+request's timings, which `TimingMiddleware` sends back as a `Server-Timing`
+header (stages repeated within a request are summed).
+
+Work running in a WorkerPool is captured in the worker (thread or process)
+and replayed into the calling request by `WorkerPool.run`, so stages timed
+inside process workers are not lost.
+
+The histograms are kept in-process with no external dependency; with several
+uvicorn workers, each process exports its own series.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import MutableHeaders
+
+# Configuration
+
+VERBOSE_LOGS = os.getenv("VERBOSE_LOGS", "1").lower() not in ("0", "false", "no")  # per-request prints on the hot path
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+
+
+def log(message: str) -> None:
+    """Print a per-request status line, unless VERBOSE_LOGS is off"""
+    if VERBOSE_LOGS:
+        print(message)
+
+
+# Histograms
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """Minimal thread-safe Prometheus histogram with fixed buckets and labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # label values -> [bucket counts..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{_format_number(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {values[-1]!r}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Minimal thread-safe Prometheus gauge with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._series = {}  # label values -> value
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._series[labels] = float(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, value in series:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{base}}} {value!r}")
+        return lines
+
+
+class Counter(Gauge):
+    """Minimal thread-safe Prometheus counter with labels"""
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0.0) + amount
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} counter"
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "creativegen_stage_seconds", "Time spent in each processing stage", ("service", "stage")
+)
+REQUEST_SECONDS = Histogram(
+    "creativegen_request_seconds", "HTTP request latency until the response starts",
+    ("service", "method", "route", "status")
+)
+STARTUP_SECONDS = Gauge(
+    "creativegen_startup_seconds", "Seconds from process start until each startup phase finished",
+    ("service", "phase")
+)
+COPY_CACHE_EVENTS = Counter(
+    "creativegen_copy_cache_total", "Ad copy cache lookups by outcome: hits, misses or coalesced", ("event",)
+)
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, STARTUP_SECONDS, COPY_CACHE_EVENTS]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# Request timings
+
+class Timings:
+    """Stage durations recorded during one request (or one worker call when `service` is None)"""
+
+    def __init__(self, service: str = None):
+        self.service = service
+        self.records = []  # (stage, seconds) in completion order
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.records.append((name, seconds))
+
+    def header(self, total: float = None) -> str:
+        """Server-Timing value: one entry per stage (summed), plus the total if given"""
+        with self._lock:
+            totals = {}
+            for name, seconds in self.records:
+                total_s, count = totals.get(name, (0.0, 0))
+                totals[name] = (total_s + seconds, count + 1)
+        entries = [
+            f'{name};desc="{count} calls";dur={1000 * seconds:.2f}' if count > 1 else f"{name};dur={1000 * seconds:.2f}"
+            for name, (seconds, count) in totals.items()
+        ]
+        if total is not None:
+            entries.append(f"total;dur={1000 * total:.2f}")
+        return ", ".join(entries)
+
+
+_current = contextvars.ContextVar("creativegen_timings", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    """Record a stage duration for the current request and its histogram"""
+    timings = _current.get()
+    if timings is None:
+        STAGE_SECONDS.observe(seconds, "", name)
+        return
+    timings.add(name, seconds)
+    # Worker captures are observed when the calling request replays them
+    if timings.service is not None:
+        STAGE_SECONDS.observe(seconds, timings.service, name)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage `name` (also works around awaits)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def captured(fn, args, kwargs) -> tuple:
+    """Call `fn` collecting the stages it records: returns (result, [(stage, seconds)])"""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        return fn(*args, **kwargs), timings.records
+    finally:
+        _current.reset(token)
+
+
+def replay(records: list) -> None:
+    for name, seconds in records:
+        record(name, seconds)
+
+
+# HTTP
+
+class TimingMiddleware:
+    """
+    ASGI middleware: collects the request's stage timings, adds a
+    Server-Timing header and observes the request latency histogram.
+    """
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = Timings(self.service)
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+                REQUEST_SECONDS.observe(elapsed, self.service, scope["method"], _route(scope), str(status))
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.header(elapsed))
+                headers.append("Timing-Allow-Origin", "*")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+
+
+def _route(scope) -> str:
+    # Route templates keep label cardinality bounded (/results/{key}, not every key)
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def metrics_routes() -> APIRouter:
+    """GET /metrics in the Prometheus text exposition format"""
+    router = APIRouter()
+
+    @router.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return router
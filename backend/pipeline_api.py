@@ -0,0 +1,380 @@
+"""
+Single-upload pipeline: background removal chained into layout generation.
+
+The two-service flow uploads the packshot to :8001, pulls the PNG back into
+the browser and re-uploads it to :8000, so the same pixels are encoded, sent
+and decoded three times. This service hosts both APIs in one process and adds
+`POST /api/pipeline`, which takes the raw packshot once, removes the
+background and hands the in-memory RGBA cutout straight to the renderer.
+Copy generation starts immediately and overlaps with inference.
+
+    uvicorn pipeline_api:app --port 8002
+
+All routes of both services (/api/remove-background, /generate-layout, ...)
+are served here as well.
+
+Campaigns too large for one request (hundreds of packshots) are submitted
+to `POST /api/jobs` instead. Jobs are kept in a SQLite job store and
+processed by worker processes; see job_store.py and job_worker.py.
+"""
+
+import asyncio
+import dataclasses
+import json
+import os
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import ai_layout_api as layout
+import background_removal_api as removal
+from batch_inference import remove_low_res
+from encoding import resolve_encoding
+from image_limits import memory_budget
+from job_store import JobStore
+from job_worker import JobWorkers
+from metrics import TimingMiddleware, stage
+from result_store import RESPONSE_MODE, public_url, validate_response_mode
+from startup import health_routes
+
+app = FastAPI(
+    title="CreativeGen Pipeline API",
+    description="Background removal and layout generation from a single upload",
+    version="1.0.0"
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=False,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+app.add_middleware(TimingMiddleware, service="pipeline")
+
+# Configuration
+JOB_MAX_ITEMS = int(os.getenv("JOB_MAX_ITEMS", "500"))  # packshots per job
+
+# Campaign jobs: persisted in SQLite, processed by worker processes
+job_store = JobStore()
+job_workers = JobWorkers(job_store)
+
+
+def cutout_prepared(contents: bytes, model: str, low_res: bool, max_box: tuple) -> tuple:
+    """
+    Decode, remove the background and pre-reduce the cutout for rendering
+    (runs in the background-removal worker pool). Returns (PreparedAsset, size).
+    """
+    image = removal.decode_image(contents)
+    with stage("inference"):
+        if low_res:
+            cutout = remove_low_res(image, model)
+        else:
+            cutout = removal.remove_with_pool(image, model)
+    return layout.PreparedAsset(cutout.convert("RGBA"), max_box), cutout.size
+
+
+@app.post("/api/pipeline")
+async def pipeline(
+    request: Request,
+    product_image: UploadFile = File(...),
+    logo_image: UploadFile = File(None),
+    product_name: str = Form(""),
+    primary_color: str = Form("#ffffff"),
+    text_color: str = Form("#000000"),
+    platform: str = Form("instagram_story"),
+    platforms: str = Form(None),
+    num_variations: int = Form(3),
+    copy_mode: str = Form(layout.AD_COPY_MODE),
+    model: str = Form(None),
+    low_res: bool = Form(False),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    lossless: bool = Form(False),
+    response_mode: str = Form(RESPONSE_MODE),
+    stream: bool = Form(False),
+    stream_format: str = Form("ndjson")
+):
+    """
+    Remove the packshot's background and render layout variations from it.
+
+    Takes the same fields as /generate-layout plus `model` and `low_res` for
+    background removal. The response has the /generate-layout shape plus
+    "removal_ms". With `stream=true` each variation is sent as soon as it is
+    rendered ({"template", "index", "platforms", "image", "encoding"}, as
+    ndjson or sse), followed by a summary event with "done": true.
+    """
+    model = removal.validate_model(model)
+    try:
+        encoding = resolve_encoding(output_format, quality, compress_level, lossless)
+        response_mode = validate_response_mode(response_mode)
+        targets = layout.resolve_targets(platform, platforms)
+        sizes = sorted(set(targets.values()))
+        templates = layout.template_index.select(num_variations, sizes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Invalid stream_format. Allowed: ndjson, sse")
+    logo_box = layout.max_logo_box(sizes)
+    cost = removal.pixel_budget.memory_cost(removal.validate_image(product_image))
+    if logo_image:
+        cost += layout.upload_cost([(layout.check_upload(logo_image, logo_box), logo_box)])
+
+    # Admission and memory are held for the whole pipeline, including a streamed response
+    admission = AsyncExitStack()
+    await admission.enter_async_context(layout.workers.admit())
+    planner = None
+    try:
+        await admission.enter_async_context(memory_budget.reserve(cost))
+        colors = {
+            "primary": layout.parse_color(primary_color),
+            "text": layout.parse_color(text_color)
+        }
+        # Copy requests are sent now and overlap with background removal
+        planner = layout.CopyPlanner(product_name, len(templates), mode=copy_mode)
+
+        contents = await layout.read_upload(product_image)
+        logo_task = None
+        if logo_image:
+            logo_task = asyncio.create_task(
+                layout.workers.run(layout.decode_prepared, await layout.read_upload(logo_image), logo_box)
+            )
+
+        started = time.perf_counter()
+        product_img, cutout_size = await removal.workers.run(
+            cutout_prepared, contents, model, low_res, layout.max_product_box(templates, sizes)
+        )
+        removal_ms = round(1000 * (time.perf_counter() - started), 2)
+        logo_img = await logo_task if logo_task else None
+    except BaseException as e:
+        if planner is not None:
+            planner.cancel()
+        await admission.aclose()
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, Exception):
+            raise HTTPException(status_code=500, detail=f"Background removal failed: {str(e)}")
+        raise
+
+    grid = layout.render_grid(
+        request, templates, planner, product_img, logo_img, colors, sizes, encoding, response_mode
+    )
+    summary = {
+        "templates": [t["id"] for t in templates],
+        "model": model,
+        "cutout_size": {"width": cutout_size[0], "height": cutout_size[1]},
+        "removal_ms": removal_ms,
+    }
+
+    if not stream:
+        try:
+            rendered = {}
+            async for i, size, ref, stats in grid:
+                rendered[(i, size)] = (ref, stats)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Layout rendering failed: {str(e)}")
+        finally:
+            await admission.aclose()
+        grouped, encode_stats = layout.group_variations(templates, targets, rendered)
+        if not platforms:
+            return JSONResponse(content=dict(summary, variations=grouped[platform], encoding=encode_stats[platform]))
+        return JSONResponse(content=dict(summary, platforms=grouped, encoding=encode_stats))
+
+    async def events():
+        try:
+            async for i, size, ref, stats in grid:
+                yield removal.format_event({
+                    "template": templates[i]["id"],
+                    "index": i,
+                    "platforms": [name for name, target in targets.items() if target == size],
+                    "image": ref,
+                    "encoding": stats
+                }, stream_format)
+            yield removal.format_event(
+                dict(summary, done=True, success=True, timestamp=datetime.now().isoformat()),
+                stream_format, event="done"
+            )
+        except Exception as e:
+            yield removal.format_event({"done": True, "success": False, "error": str(e)}, stream_format, event="done")
+        finally:
+            await admission.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if stream_format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# JOBS
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    product_images: list[UploadFile] = File(...),
+    logo_image: UploadFile = File(None),
+    product_name: str = Form(""),
+    product_names: str = Form(None),
+    primary_color: str = Form("#ffffff"),
+    text_color: str = Form("#000000"),
+    platform: str = Form("instagram_story"),
+    platforms: str = Form(None),
+    num_variations: int = Form(3),
+    align: str = Form(None),
+    remove_background: bool = Form(True),
+    model: str = Form(None),
+    low_res: bool = Form(False),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    lossless: bool = Form(False)
+):
+    """
+    Queue a campaign: every packshot gets the /api/pipeline treatment
+    (background removal, then the same templates rendered for every platform).
+
+    `product_names` is an optional JSON list with one name per packshot;
+    otherwise `product_name` is used for all of them. Set
+    `remove_background=false` for packshots that are already cut out.
+    Returns 202 with the job id; poll GET /api/jobs/{job_id} for progress and
+    fetch GET /api/jobs/{job_id}/result for the images.
+    """
+    if len(product_images) > JOB_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many packshots. Maximum per job: {JOB_MAX_ITEMS}")
+    names = [product_name] * len(product_images)
+    if product_names:
+        try:
+            names = json.loads(product_names)
+        except json.JSONDecodeError:
+            names = None
+        if not isinstance(names, list) or len(names) != len(product_images) or not all(isinstance(n, str) for n in names):
+            raise HTTPException(status_code=400, detail="product_names must be a JSON list of strings, one per product image")
+    model = removal.validate_model(model)
+    try:
+        encoding = resolve_encoding(output_format, quality, compress_level, lossless)
+        targets = layout.resolve_targets(platform, platforms)
+        sizes = sorted(set(targets.values()))
+        templates = layout.template_index.select(num_variations, sizes, align)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def validate_uploads():
+        # Headers only: a bad file is rejected now rather than failing its item later
+        for i, file in enumerate(product_images):
+            try:
+                removal.validate_image(file)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f"product_images[{i}]: {e.detail}")
+        if logo_image:
+            layout.check_upload(logo_image, layout.max_logo_box(sizes))
+
+    await asyncio.to_thread(validate_uploads)
+    params = {
+        # The templates themselves, so queued items render the same after a restart
+        "templates": templates,
+        "targets": {name: list(size) for name, size in targets.items()},
+        "colors": {"primary": layout.parse_color(primary_color), "text": layout.parse_color(text_color)},
+        "encoding": dataclasses.asdict(encoding),
+        "remove_background": remove_background,
+        "model": model,
+        "low_res": low_res,
+    }
+    job_id = await asyncio.to_thread(
+        job_store.create,
+        params,
+        [(name, file.file) for name, file in zip(names, product_images)],
+        logo_image.file if logo_image else None,
+    )
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(product_images),
+        "templates": [t["id"] for t in templates],
+        "status_url": str(request.url_for("job_status", job_id=job_id)),
+        "result_url": str(request.url_for("job_result", job_id=job_id)),
+    })
+
+
+async def job_or_404(job_id: str) -> dict:
+    status = await asyncio.to_thread(job_store.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return status
+
+
+@app.get("/api/jobs")
+async def job_queue():
+    """Queue depth by item status and the state of the worker processes"""
+    return {"queue": await asyncio.to_thread(job_store.stats), "workers": job_workers.stats()}
+
+
+@app.get("/api/jobs/{job_id}", name="job_status")
+async def job_status(job_id: str):
+    """Status, progress (finished items / total), item counts and the first errors"""
+    return await job_or_404(job_id)
+
+
+@app.get("/api/jobs/{job_id}/result", name="job_result")
+async def job_result(job_id: str, request: Request):
+    """
+    Every item with its status and, once done, its images as
+    {"platforms": {name: [URLs]}, "templates", "copy"}. Available while the
+    job runs, so finished items can be fetched early.
+    """
+    status = await job_or_404(job_id)
+    items = await asyncio.to_thread(job_store.items, job_id)
+    for item in items:
+        result = item["result"]
+        if result:
+            result["platforms"] = {
+                name: [public_url(request, key) for key in keys] for name, keys in result["platforms"].items()
+            }
+    return {"job_id": job_id, "status": status["status"], "progress": status["progress"], "items": items}
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel the job's queued items; items already running finish"""
+    if not await asyncio.to_thread(job_store.cancel, job_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return await job_or_404(job_id)
+
+
+@app.post("/api/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    """Queue the failed (and cancelled) items again with fresh attempts"""
+    requeued = await asyncio.to_thread(job_store.retry, job_id)
+    if requeued < 0:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return dict(await job_or_404(job_id), requeued=requeued)
+
+
+@app.on_event("startup")
+async def start_jobs():
+    job_workers.start()
+    app.state.job_tasks = [
+        asyncio.create_task(job_workers.supervise()),
+        asyncio.create_task(job_store.gc_loop()),
+    ]
+
+
+@app.on_event("shutdown")
+def stop_jobs():
+    for task in app.state.job_tasks:
+        task.cancel()
+    job_workers.stop()
+
+
+# /live and /ready cover both services (registered first, so they win over each service's own)
+app.include_router(health_routes(removal.startup, layout.startup))
+
+# Serve both services' routes (and their startup/shutdown hooks) from this
+# process. The first /results route wins; both stores share RESULT_STORE_DIR.
+app.include_router(removal.app.router)
+app.include_router(layout.app.router)
@@ -0,0 +1,263 @@
+"""
+Layout templates compiled into per-size render plans.
+
+Templates are written with fractional geometry ("product at x=0.5, 65% of the
+width"). Working that out into pixel boxes, font sizes and anchors on every
+render is wasted work, so each (template, platform size) pair is compiled
+once into an immutable `RenderPlan` with absolute geometry.
+
+Besides the built-in templates, extra ones can be loaded from a directory of
+JSON (or YAML, if PyYAML is installed) files, one template or a list per
+file. Every template is validated on load. `TemplateIndex` keeps the plans
+and indexes templates by headline alignment and supported aspect ratio, so
+selection is a filtered lookup instead of a scan.
+"""
+
+import glob
+import json
+import os
+import random
+from dataclasses import dataclass
+
+# Configuration
+
+LAYOUT_TEMPLATE_DIR = os.getenv("LAYOUT_TEMPLATE_DIR", "")  # extra templates; empty = built-ins only
+
+LOGO_SCALE = 0.12  # logo box edge as a fraction of canvas width
+HEADLINE_WRAP = 18  # characters per headline line (HEADLINE_FIT=wrap)
+HEADLINE_MARGIN = 0.05  # canvas fraction kept clear on each side of a default headline box
+HEADLINE_BOX_HEIGHT = 0.22  # default headline box height, canvas fraction
+HEADLINE_MIN_SCALE = 0.4  # smallest fitted headline, relative to the template's font size
+
+ALIGNMENTS = ("left", "center")
+ASPECTS = ("landscape", "square", "portrait")
+
+
+def aspect_of(size: tuple) -> str:
+    ratio = size[0] / size[1]
+    if ratio > 1.15:
+        return "landscape"
+    if ratio < 0.87:
+        return "portrait"
+    return "square"
+
+
+# Plans
+
+@dataclass(frozen=True, slots=True)
+class ProductPlan:
+    box: tuple  # (max width, max height) the product is fitted into
+    center_x: float
+    center_y: float
+
+    def origin(self, fitted_size: tuple) -> tuple:
+        return int(self.center_x - fitted_size[0] / 2), int(self.center_y - fitted_size[1] / 2)
+
+
+@dataclass(frozen=True, slots=True)
+class TextPlan:
+    x: int
+    y: int
+    align: str
+    font_size: int  # the largest size; fitted headlines may be smaller
+    box: tuple  # (max width, max height) a fitted headline must stay within
+    min_font_size: int
+
+
+@dataclass(frozen=True, slots=True)
+class CtaPlan:
+    x: int
+    y: int
+    align: str
+    font_size: int
+    pad_w: int
+    pad_h: int
+
+
+@dataclass(frozen=True, slots=True)
+class RenderPlan:
+    template_id: str
+    size: tuple
+    product: ProductPlan
+    headline: TextPlan
+    cta: CtaPlan
+    logo_box: tuple
+    logo_margin: tuple  # (right margin, top offset)
+
+
+def headline_box(headline: dict, size: tuple) -> tuple:
+    """
+    Pixel box a headline is fitted into, centred on its anchor vertically and
+    horizontally too when centre-aligned: the template's `w`/`h` fractions,
+    or by default the room between the anchor and the canvas edges.
+    """
+    w, h = size
+    x, y = headline["x"], headline["y"]
+    room_w = 2 * min(x, 1 - x) if headline["align"] == "center" else 1 - x
+    box_w = headline.get("w", max(0.1, room_w - 2 * HEADLINE_MARGIN))
+    box_h = headline.get("h", max(0.05, min(HEADLINE_BOX_HEIGHT, 2 * min(y, 1 - y) - 2 * HEADLINE_MARGIN)))
+    return int(w * box_w), int(h * box_h)
+
+
+def compile_plan(template: dict, size: tuple) -> RenderPlan:
+    """Resolve a template's fractional geometry for one canvas size"""
+    w, h = size
+    p, hl, c = template["product"], template["headline"], template["cta"]
+    logo_edge = int(w * LOGO_SCALE)
+    headline_size = max(48, int(w * 0.06))
+    return RenderPlan(
+        template_id=template["id"],
+        size=(w, h),
+        product=ProductPlan(box=(int(w * p["w"]), int(h * p["h"])), center_x=w * p["x"], center_y=h * p["y"]),
+        headline=TextPlan(
+            x=int(w * hl["x"]), y=int(h * hl["y"]), align=hl["align"], font_size=headline_size,
+            box=headline_box(hl, size), min_font_size=max(12, int(headline_size * HEADLINE_MIN_SCALE))
+        ),
+        cta=CtaPlan(
+            x=int(w * c["x"]), y=int(h * c["y"]), align=c["align"], font_size=max(32, int(w * 0.04)),
+            pad_w=int(w * 0.08), pad_h=int(h * 0.04)
+        ),
+        logo_box=(logo_edge, logo_edge),
+        logo_margin=(int(w * 0.04), int(h * 0.04)),
+    )
+
+
+# Loading and validation
+
+def _check_point(template_id: str, section: str, conf, keys: tuple) -> None:
+    if not isinstance(conf, dict):
+        raise ValueError(f"Template '{template_id}': '{section}' must be an object")
+    for key in keys:
+        value = conf.get(key)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 1:
+            raise ValueError(f"Template '{template_id}': {section}.{key} must be a number between 0 and 1")
+
+
+def validate_template(template) -> dict:
+    """Check a template's structure and return it with defaults filled in. Raises ValueError."""
+    if not isinstance(template, dict) or not isinstance(template.get("id"), str) or not template["id"]:
+        raise ValueError("Template must be an object with a non-empty string 'id'")
+    template_id = template["id"]
+    _check_point(template_id, "product", template.get("product"), ("x", "y", "w", "h"))
+    if template["product"]["w"] <= 0 or template["product"]["h"] <= 0:
+        raise ValueError(f"Template '{template_id}': product.w and product.h must be positive")
+    for section in ("headline", "cta"):
+        _check_point(template_id, section, template.get(section), ("x", "y"))
+        if template[section].get("align") not in ALIGNMENTS:
+            raise ValueError(f"Template '{template_id}': {section}.align must be one of {', '.join(ALIGNMENTS)}")
+    for key in ("w", "h"):
+        value = template["headline"].get(key, 1)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 < value <= 1:
+            raise ValueError(f"Template '{template_id}': headline.{key} must be a number above 0 and at most 1")
+    aspects = template.get("aspects", list(ASPECTS))
+    if not isinstance(aspects, list) or not aspects or any(a not in ASPECTS for a in aspects):
+        raise ValueError(f"Template '{template_id}': aspects must be a non-empty list of {', '.join(ASPECTS)}")
+    return dict(template, name=template.get("name", template_id), aspects=aspects)
+
+
+def _read_file(path: str):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"{path}: PyYAML is not installed; use JSON or `pip install pyyaml`")
+        return yaml.safe_load(f)
+
+
+def load_template_dir(path: str) -> list:
+    """Validated templates from every .json/.yaml/.yml file in `path` (sorted by file name)"""
+    templates = []
+    files = sorted(glob.glob(os.path.join(path, "*.json")) + glob.glob(os.path.join(path, "*.y*ml")))
+    for file in files:
+        data = _read_file(file)
+        for template in data if isinstance(data, list) else [data]:
+            try:
+                templates.append(validate_template(template))
+            except ValueError as e:
+                raise ValueError(f"{file}: {e}")
+    return templates
+
+
+def load_templates(builtin: list, template_dir: str = LAYOUT_TEMPLATE_DIR) -> list:
+    """Built-in templates plus those in `template_dir`; a file template replaces a built-in with the same id"""
+    by_id = {t["id"]: validate_template(t) for t in builtin}
+    if template_dir:
+        loaded = load_template_dir(template_dir)
+        for template in loaded:
+            by_id[template["id"]] = template
+        print(f"✅ Loaded {len(loaded)} layout templates from {template_dir}")
+    return list(by_id.values())
+
+
+# Index
+
+class TemplateIndex:
+    """Templates, their compiled plans per size, and lookups by id, alignment and aspect"""
+
+    def __init__(self, templates: list, sizes):
+        self.templates = templates
+        self._by_id = {t["id"]: t for t in templates}
+        self._by_align = {a: [] for a in ALIGNMENTS}
+        self._by_aspect = {a: [] for a in ASPECTS}
+        for template in templates:
+            self._by_align[template["headline"]["align"]].append(template)
+            for aspect in template["aspects"]:
+                self._by_aspect[aspect].append(template)
+        self._plans = {}
+        for template in templates:
+            for size in set(sizes):
+                self._plans[(template["id"], tuple(size))] = compile_plan(template, size)
+
+    def get(self, template_id: str):
+        return self._by_id.get(template_id)
+
+    def plan(self, template: dict, size: tuple) -> RenderPlan:
+        """
+        Precompiled plan for an indexed template id (ids are unique, so this also
+        works for copies of the template sent to worker processes). Other sizes
+        are compiled once and kept; unknown templates are compiled on the fly.
+        """
+        key = (template["id"], tuple(size))
+        plan = self._plans.get(key)
+        if plan is None:
+            indexed = self._by_id.get(template["id"])
+            plan = compile_plan(indexed or template, size)
+            if indexed is not None:
+                self._plans[key] = plan
+        return plan
+
+    def candidates(self, sizes=(), align: str = None) -> list:
+        """Templates usable at every size in `sizes`, optionally with this headline alignment"""
+        pools = [self._by_aspect[aspect_of(size)] for size in set(sizes)]
+        if align:
+            if align not in ALIGNMENTS:
+                raise ValueError(f"Invalid align '{align}'. Allowed: {', '.join(ALIGNMENTS)}")
+            pools.append(self._by_align[align])
+        if not pools:
+            return list(self.templates)
+        allowed = set.intersection(*(set(map(id, pool)) for pool in pools))
+        return [t for t in min(pools, key=len) if id(t) in allowed]
+
+    def select(self, n: int, sizes=(), align: str = None) -> list:
+        """Up to `n` random templates matching the filters. Raises ValueError if none match."""
+        pool = self.candidates(sizes, align)
+        if not pool:
+            raise ValueError("No layout template matches the requested platforms and alignment")
+        return random.sample(pool, min(n, len(pool)))
+
+    def font_sizes(self) -> set:
+        """Every CTA font size and fitted headline font size the compiled plans can render with"""
+        headline = {
+            size for p in self._plans.values() for size in range(p.headline.min_font_size, p.headline.font_size + 1)
+        }
+        return headline | {p.cta.font_size for p in self._plans.values()}
+
+    def stats(self) -> dict:
+        return {
+            "templates": len(self.templates),
+            "plans": len(self._plans),
+            "by_align": {a: len(ts) for a, ts in self._by_align.items()},
+            "by_aspect": {a: len(ts) for a, ts in self._by_aspect.items()},
+        }
@@ -0,0 +1,166 @@
+"""
+Content-addressed cache for background removal results.
+
+Designers re-upload the same packshots constantly, so results are cached by a
+hash of the uploaded bytes plus the model and options that produced them.
+A bounded in-memory LRU sits in front of an optional on-disk tier with
+size-based eviction (least recently used files go first).
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+# Configuration
+
+RESULT_CACHE_MAX_ITEMS = int(os.getenv("RESULT_CACHE_MAX_ITEMS", "256"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")  # empty = memory only
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+def cache_key(contents: bytes, **options) -> str:
+    """Hash of the input bytes plus every option that affects the output"""
+    digest = hashlib.sha256(contents)
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Memory LRU with an optional disk tier. Values are (bytes, metadata dict)."""
+
+    def __init__(
+        self,
+        max_items: int = RESULT_CACHE_MAX_ITEMS,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        disk_dir: str = RESULT_CACHE_DIR,
+        disk_max_bytes: int = RESULT_CACHE_DISK_MAX_BYTES,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(self.disk_dir) if e.is_file())
+
+    # Memory tier
+
+    def _remember(self, key: str, data: bytes, meta: dict) -> None:
+        if len(data) > self.max_bytes or self.max_items <= 0:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[0])
+        self._memory[key] = (data, meta)
+        self._memory_bytes += len(data)
+        while len(self._memory) > self.max_items or self._memory_bytes > self.max_bytes:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # Disk tier
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _read_disk(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                (meta_len,) = struct.unpack(">I", f.read(4))
+                meta = json.loads(f.read(meta_len))
+                data = f.read()
+            os.utime(path)  # mark as recently used
+            return data, meta
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _write_disk(self, key: str, data: bytes, meta: dict) -> None:
+        path = self._path(key)
+        meta_bytes = json.dumps(meta).encode()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(">I", len(meta_bytes)))
+                f.write(meta_bytes)
+                f.write(data)
+            existing = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path) - existing
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        entries = []
+        for e in os.scandir(self.disk_dir):
+            if e.is_file() and e.name.endswith(".bin"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)  # leave headroom so we don't evict on every write
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    # Public API
+
+    def get(self, key: str):
+        """Return (bytes, metadata) or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry
+        if self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, *entry)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes, meta: dict = None) -> None:
+        meta = meta or {}
+        with self._lock:
+            self._remember(key, data, meta)
+        if self.disk_dir:
+            self._write_disk(key, data, meta)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes if self.disk_dir else None,
+            }
@@ -0,0 +1,219 @@
+"""
+Content-addressed store for rendered outputs, served over HTTP.
+
+Returning images as base64 data URLs inflates responses by a third, keeps
+every image alive as a Python string and makes browser caching impossible.
+Outputs are instead written once under the sha256 of their bytes and the
+response carries a short URL. Objects are immutable, so they are served with
+a strong ETag (the hash), long-lived Cache-Control, If-None-Match and Range
+support. Objects not written or read within RESULT_STORE_TTL are garbage
+collected.
+
+The put/get/head/delete/list interface mirrors an object store so the local
+filesystem backend can be swapped for S3/GCS without touching the endpoints.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+import metrics
+
+# Configuration
+
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", os.path.join(tempfile.gettempdir(), "creativegen-results"))
+RESULT_STORE_TTL = int(os.getenv("RESULT_STORE_TTL", str(24 * 3600)))  # seconds since last write/read
+RESULT_STORE_GC_INTERVAL = int(os.getenv("RESULT_STORE_GC_INTERVAL", "600"))  # seconds
+RESULT_STORE_PUBLIC_URL = os.getenv("RESULT_STORE_PUBLIC_URL", "")  # e.g. https://cdn.example.com/results; default: this server
+RESPONSE_MODE = os.getenv("RESPONSE_MODE", "url")  # "url" or "data_url"
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "bin": "application/octet-stream",
+}
+EXTENSIONS = {media_type: ext for ext, media_type in CONTENT_TYPES.items()}
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}\.(png|webp|jpeg|bin)$")
+
+
+def validate_response_mode(mode: str) -> str:
+    mode = (mode or RESPONSE_MODE).lower()
+    if mode not in ("url", "data_url"):
+        raise ValueError(f"Invalid response_mode '{mode}'. Allowed: url, data_url")
+    return mode
+
+
+class LocalResultStore:
+    """Filesystem object store keyed by `<sha256>.<ext>`"""
+
+    def __init__(self, root: str = RESULT_STORE_DIR, ttl: int = RESULT_STORE_TTL):
+        self.root = root
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.dedup_writes = 0
+        self.collected = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.root, key[:2], key)
+
+    # Object store interface
+
+    def put(self, data: bytes, content_type: str) -> str:
+        """Store bytes and return their key; identical content is written once"""
+        key = f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS.get(content_type, 'bin')}"
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)  # refresh TTL
+            with self._lock:
+                self.dedup_writes += 1
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.writes += 1
+        return key
+
+    def head(self, key: str):
+        """Return {"path", "size", "content_type", "etag"} or None"""
+        if not KEY_PATTERN.match(key):
+            return None
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if time.time() - st.st_mtime > self.ttl:
+            return None
+        return {
+            "path": path,
+            "size": st.st_size,
+            "content_type": CONTENT_TYPES[key.rsplit(".", 1)[1]],
+            "etag": f'"{key.split(".", 1)[0]}"',
+        }
+
+    def get(self, key: str):
+        meta = self.head(key)
+        if meta is None:
+            return None
+        with open(meta["path"], "rb") as f:
+            return f.read()
+
+    def touch(self, key: str) -> None:
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def list(self):
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and KEY_PATTERN.match(entry.name):
+                        yield entry.name
+
+    # Garbage collection
+
+    def gc(self) -> int:
+        """Delete objects (and stale temp files) older than the TTL; returns the number removed"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass
+        with self._lock:
+            self.collected += removed
+        return removed
+
+    async def gc_loop(self, interval: int = RESULT_STORE_GC_INTERVAL) -> None:
+        while True:
+            removed = await asyncio.to_thread(self.gc)
+            if removed:
+                print(f"🧹 [Result Store] Collected {removed} expired objects")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "root": self.root,
+                "ttl": self.ttl,
+                "writes": self.writes,
+                "dedup_writes": self.dedup_writes,
+                "collected": self.collected,
+            }
+
+
+def public_url(request: Request, key: str) -> str:
+    """Absolute URL clients can fetch `key` from"""
+    if RESULT_STORE_PUBLIC_URL:
+        return f"{RESULT_STORE_PUBLIC_URL.rstrip('/')}/{key}"
+    return str(request.url_for("get_result", key=key))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def result_routes(store: LocalResultStore) -> APIRouter:
+    """GET/HEAD /results/{key} with ETag, Cache-Control and Range (handled by FileResponse)"""
+    router = APIRouter()
+
+    @router.api_route("/results/{key}", methods=["GET", "HEAD"], name="get_result")
+    async def get_result(key: str, request: Request):
+        meta = await asyncio.to_thread(store.head, key)
+        if meta is None:
+            raise HTTPException(status_code=404, detail="Result not found or expired")
+        headers = {
+            "ETag": meta["etag"],
+            "Cache-Control": f"public, max-age={store.ttl}, immutable",
+        }
+        if etag_matches(request.headers.get("if-none-match"), meta["etag"]):
+            return Response(status_code=304, headers=headers)
+        # Reads keep popular results alive
+        await asyncio.to_thread(store.touch, key)
+        return FileResponse(meta["path"], media_type=meta["content_type"], headers=headers)
+
+    return router
+
+
+async def publish(store: LocalResultStore, request: Request, data: bytes, content_type: str, mode: str = RESPONSE_MODE) -> str:
+    """Reference to `data` for a JSON response: a store URL, or an inline data URL"""
+    if mode == "data_url":
+        with metrics.stage("base64"):
+            return f"data:{content_type};base64,{base64.b64encode(data).decode()}"
+    with metrics.stage("store_write"):
+        key = await asyncio.to_thread(store.put, data, content_type)
+    return public_url(request, key)
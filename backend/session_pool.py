@@ -0,0 +1,227 @@
+"""
+Pooled rembg/ONNX sessions for the background removal service.
+
+Creating a rembg session loads the model weights into ONNX Runtime, which is
+far more expensive than a single inference. Sessions are therefore created once
+per model, kept in a fixed-size pool and checked out for each request.
+
+rembg and onnxruntime (with numba and the matting machinery) take seconds to
+import, so they are imported on first use, normally by the background
+`preload` at startup, not when the service module is imported.
+
+Model weights can be downloaded and verified ahead of time, e.g. at image
+build time, so startup never hits the network:
+
+    python -m session_pool --download u2net,u2netp [--verify]
+"""
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+# Configuration
+
+# Public model names accepted by the API, mapped to rembg session names
+SUPPORTED_MODELS = {
+    "u2net": "u2net",
+    "u2netp": "u2netp",
+    "isnet": "isnet-general-use",
+    "silueta": "silueta",
+}
+
+DEFAULT_MODEL = os.getenv("REMBG_MODEL", "u2net")
+POOL_SIZE = int(os.getenv("REMBG_POOL_SIZE", "1"))
+INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))  # 0 = let ONNX Runtime decide
+INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+PRELOAD_MODELS = [m.strip() for m in os.getenv("REMBG_PRELOAD_MODELS", DEFAULT_MODEL).split(",") if m.strip()]
+WARMUP_ON_START = os.getenv("REMBG_WARMUP", "1") == "1"
+
+# rembg pulls in numba (via pymatting). When numba is first imported off the
+# main thread, as the background preload does, its TBB threading layer keeps
+# the interpreter from exiting; prefer the OpenMP or workqueue layers.
+os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", "omp workqueue tbb")
+
+
+def resolve_model(model: str = None) -> str:
+    """Validate a public model name, falling back to the deployment default"""
+    model = (model or DEFAULT_MODEL).strip().lower()
+    if model not in SUPPORTED_MODELS:
+        raise ValueError(
+            f"Unsupported model '{model}'. Allowed: {', '.join(SUPPORTED_MODELS)}"
+        )
+    return model
+
+
+def remove(image: Image.Image, session) -> Image.Image:
+    """rembg.remove with an explicit session (rembg is imported on first use)"""
+    from rembg import remove as rembg_remove
+    return rembg_remove(image, session=session)
+
+
+def build_session_options():
+    """ONNX Runtime options shared by every pooled session"""
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if INTRA_OP_THREADS > 0:
+        opts.intra_op_num_threads = INTRA_OP_THREADS
+    if INTER_OP_THREADS > 0:
+        opts.inter_op_num_threads = INTER_OP_THREADS
+    return opts
+
+
+class SessionPool:
+    """Fixed-size pool of rembg sessions for one model"""
+
+    def __init__(self, model: str, size: int = POOL_SIZE):
+        self.model = model
+        self.size = max(1, size)
+        self._sessions = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        from rembg import new_session
+        return new_session(SUPPORTED_MODELS[self.model], sess_opts=build_session_options())
+
+    def fill(self) -> None:
+        """Create every session up front instead of on first checkout"""
+        with self._lock:
+            while self._created < self.size:
+                self._sessions.put(self._create())
+                self._created += 1
+
+    @contextmanager
+    def session(self):
+        """Check a session out of the pool, creating one lazily if the pool isn't full yet"""
+        try:
+            sess = self._sessions.get_nowait()
+        except queue.Empty:
+            sess = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    sess = self._create()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                sess = self._sessions.get()
+        try:
+            yield sess
+        finally:
+            self._sessions.put(sess)
+
+    def warm_up(self) -> None:
+        """Run one tiny inference per session so the first real request is not slow"""
+        self.fill()
+        sessions = [self._sessions.get() for _ in range(self.size)]
+        try:
+            blank = Image.new("RGB", (64, 64), (255, 255, 255))
+            for sess in sessions:
+                remove(blank, session=sess)
+        finally:
+            for sess in sessions:
+                self._sessions.put(sess)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "size": self.size,
+            "created": self._created,
+            "idle": self._sessions.qsize(),
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(model: str = None) -> SessionPool:
+    """Return the pool for a model, creating it on first use"""
+    model = resolve_model(model)
+    pool = _pools.get(model)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(model)
+            if pool is None:
+                pool = SessionPool(model)
+                _pools[model] = pool
+    return pool
+
+
+def preload(models=None, warm_up: bool = WARMUP_ON_START) -> None:
+    """Create (and optionally warm up) the pools for the configured models"""
+    for model in models or PRELOAD_MODELS:
+        pool = get_pool(model)
+        if warm_up:
+            pool.warm_up()
+        else:
+            pool.fill()
+        print(f"✅ rembg pool ready: model={pool.model}, sessions={pool.size}")
+
+
+def pool_stats() -> list:
+    return [pool.stats() for pool in _pools.values()]
+
+
+# Build-time model download and verification
+
+def session_class(model: str):
+    """rembg session class for a public model name"""
+    from rembg.sessions import sessions_class
+
+    name = SUPPORTED_MODELS[resolve_model(model)]
+    return next(cls for cls in sessions_class if cls.name() == name)
+
+
+def download(model: str) -> str:
+    """Download the model's weights unless already present (rembg checks the hash); returns the path"""
+    return str(session_class(model).download_models())
+
+
+def verify(path: str) -> None:
+    """Load the weights into ONNX Runtime, which fails on a truncated or corrupt file"""
+    import onnxruntime as ort
+
+    ort.InferenceSession(path, sess_options=build_session_options(), providers=["CPUExecutionProvider"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and verify rembg model weights ahead of startup")
+    parser.add_argument("--download", default=",".join(PRELOAD_MODELS), help="comma-separated models")
+    parser.add_argument("--verify", action="store_true", help="also load each model into ONNX Runtime")
+    args = parser.parse_args()
+
+    failed = []
+    for model in [m.strip() for m in args.download.split(",") if m.strip()]:
+        started = time.perf_counter()
+        try:
+            path = download(model)
+            if args.verify:
+                verify(path)
+        except Exception as e:
+            failed.append(model)
+            print(f"❌ {model}: {type(e).__name__}: {e}")
+            continue
+        size_mb = os.path.getsize(path) / 2**20
+        checked = ", verified" if args.verify else ""
+        print(f"✅ {model}: {path} ({size_mb:.1f} MB{checked}, {time.perf_counter() - started:.1f}s)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
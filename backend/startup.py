@@ -0,0 +1,142 @@
+"""
+Background startup, liveness and readiness.
+
+Importing a service only builds the app; heavy work (rembg/ONNX sessions,
+font and render-pool warm-up, the Groq SDK) runs in background tasks
+started from the app's startup hook, so the server accepts connections
+right away:
+
+- GET /live answers 200 as soon as the event loop runs (restart if not);
+- GET /ready answers 503 until every startup task has finished, then 200
+  (route traffic only when ready). Failed tasks are listed with their error.
+
+Startup is timed from process start: when the startup hook ran (interpreter
+plus imports), how long each task took and when the service became ready.
+The figures are in /ready and in the creativegen_startup_seconds gauge.
+"""
+
+import asyncio
+import os
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from metrics import STARTUP_SECONDS
+
+
+def process_age():
+    """Seconds since this process started (Linux /proc), or None"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name start at field 3; starttime is field 22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+PROCESS_STARTED = time.monotonic() - (process_age() or 0.0)
+
+
+def since_process_start() -> float:
+    return round(time.monotonic() - PROCESS_STARTED, 3)
+
+
+class Startup:
+    """Background startup tasks of one service, and the readiness they gate"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.tasks = {}  # name -> {"status": "pending" | "ok" | "failed", "seconds", "error"}
+        self.hook_seconds = None
+        self.ready_seconds = None
+        self._running = []
+
+    def begin(self, **tasks) -> None:
+        """Run each `name=async_fn` in the background (call from a startup hook)"""
+        if self.hook_seconds is not None:
+            return  # hooks of an included app can run twice (pipeline_api)
+        self.hook_seconds = since_process_start()
+        STARTUP_SECONDS.set(self.hook_seconds, self.service, "startup_hook")
+        for name, fn in tasks.items():
+            self.tasks[name] = {"status": "pending"}
+            self._running.append(asyncio.create_task(self._run(name, fn)))
+        self._check_ready()
+
+    async def _run(self, name: str, fn) -> None:
+        started = time.monotonic()
+        try:
+            await fn()
+        except Exception as e:
+            self.tasks[name] = {
+                "status": "failed",
+                "seconds": round(time.monotonic() - started, 3),
+                "error": f"{type(e).__name__}: {e}",
+            }
+            print(f"❌ [{self.service}] Startup task '{name}' failed: {e}")
+            return
+        self.tasks[name] = {"status": "ok", "seconds": round(time.monotonic() - started, 3)}
+        STARTUP_SECONDS.set(since_process_start(), self.service, name)
+        self._check_ready()
+
+    def _check_ready(self) -> None:
+        if self.ready and self.ready_seconds is None:
+            self.ready_seconds = since_process_start()
+            STARTUP_SECONDS.set(self.ready_seconds, self.service, "ready")
+            print(f"✅ {self.service} ready {self.ready_seconds:.2f}s after process start")
+
+    @property
+    def ready(self) -> bool:
+        return self.hook_seconds is not None and all(t["status"] == "ok" for t in self.tasks.values())
+
+    @property
+    def state(self) -> str:
+        if self.ready:
+            return "ready"
+        if any(t["status"] == "failed" for t in self.tasks.values()):
+            return "failed"
+        return "starting"
+
+    async def wait(self) -> bool:
+        """Wait for every startup task to finish; True if the service is ready"""
+        await asyncio.gather(*self._running, return_exceptions=True)
+        return self.ready
+
+    def cancel(self) -> None:
+        for task in self._running:
+            task.cancel()
+
+    def status(self) -> dict:
+        return {
+            "service": self.service,
+            "status": self.state,
+            "startup_hook_seconds": self.hook_seconds,
+            "ready_seconds": self.ready_seconds,
+            "tasks": dict(self.tasks),
+        }
+
+
+def health_routes(*startups: Startup) -> APIRouter:
+    """GET /live and GET /ready for one or more services hosted by this process"""
+    router = APIRouter()
+
+    @router.get("/live")
+    async def live():
+        return {"status": "alive", "uptime_seconds": since_process_start()}
+
+    @router.get("/ready")
+    async def ready():
+        services = [startup.status() for startup in startups]
+        is_ready = all(startup.ready for startup in startups)
+        if is_ready:
+            status = "ready"
+        elif any(startup.state == "failed" for startup in startups):
+            status = "failed"
+        else:
+            status = "starting"
+        return JSONResponse(status_code=200 if is_ready else 503, content={"status": status, "services": services})
+
+    return router
@@ -0,0 +1,25 @@
+"""
+Shared setup for the backend tests.
+
+The services are flat modules in backend/, imported the way uvicorn does.
+Stores that default to the system temp directory are pointed at a fresh one
+before any service module is imported, and the Groq key is cleared so no
+test reaches the network.
+
+    cd backend
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+_scratch = tempfile.mkdtemp(prefix="creativegen-tests-")
+os.environ["RESULT_STORE_DIR"] = os.path.join(_scratch, "results")
+os.environ["JOB_STORE_DIR"] = os.path.join(_scratch, "jobs")
+os.environ["JOB_WORKERS"] = "0"
+os.environ["GROQ_API_KEY"] = ""
+os.environ["VERBOSE_LOGS"] = "0"
@@ -0,0 +1,54 @@
+import asyncio
+
+import metrics
+from copy_cache import CopyCache
+
+
+def copy(i: int) -> dict:
+    return {"headline": f"Headline {i}", "cta": "Shop Now"}
+
+
+def test_load_trims_to_max_keys(tmp_path):
+    db = str(tmp_path / "copy.db")
+    writer = CopyCache(max_keys=10, db_path=db)
+    for i in range(10):
+        writer.put(f"Product {i}", "benefit", copy(i))
+
+    reader = CopyCache(max_keys=3, db_path=db)
+    assert reader.stats()["keys"] == 3
+    # The most recently written keys are kept
+    assert [bool(reader.lookup(f"Product {i}", "benefit")) for i in range(10)] == [False] * 7 + [True] * 3
+    assert CopyCache(max_keys=10, db_path=db).stats()["keys"] == 3
+
+
+def test_persisted_rows_stay_bounded(tmp_path):
+    db = str(tmp_path / "copy.db")
+    cache = CopyCache(alternatives=2, db_path=db)
+    for i in range(10):
+        cache.put("Lamp", "benefit", copy(i))
+
+    reloaded = CopyCache(alternatives=2, db_path=db)
+    assert reloaded.lookup("Lamp", "benefit") == [copy(8), copy(9)]
+
+
+def test_counters_are_exported_to_metrics():
+    def exported(event):
+        return metrics.COPY_CACHE_EVENTS._series.get((event,), 0.0)
+
+    before = {event: exported(event) for event in ("hits", "misses", "coalesced")}
+    cache = CopyCache()
+
+    async def scenario():
+        async def fetch():
+            await asyncio.sleep(0.01)
+            return copy(1)
+
+        # Two concurrent misses share one fetch, then the cached copy is a hit
+        await asyncio.gather(*(cache.get_or_fetch("Lamp", "benefit", fetch) for _ in range(2)))
+        await cache.get_or_fetch("Lamp", "benefit", fetch)
+
+    asyncio.run(scenario())
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["coalesced"]) == (1, 2, 1)
+    assert {event: exported(event) - before[event] for event in before} == {"hits": 1, "misses": 2, "coalesced": 1}
+    assert 'creativegen_copy_cache_total{event="hits"}' in metrics.render_metrics()
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs"))
+
+
+def submit(store, count=2) -> str:
+    return store.create({}, [(f"Product {i}", io.BytesIO(b"packshot")) for i in range(count)])
+
+
+def item_statuses(store, job_id) -> list:
+    return [item["status"] for item in store.items(job_id)]
+
+
+def test_failed_item_of_cancelled_job_is_not_retried(store):
+    job_id = submit(store)
+    item = store.claim("host:1")
+    assert store.cancel(job_id)
+
+    assert not store.fail(item, "host:1", "RuntimeError: boom")
+    assert item_statuses(store, job_id) == ["cancelled", "cancelled"]
+    assert store.claim("host:1") is None
+    assert store.status(job_id)["status"] == "cancelled"
+
+
+def test_expired_lease_of_cancelled_job_is_not_requeued(store):
+    job_id = submit(store, count=1)
+    store.lease_seconds = -1  # every lease is already expired
+    store.claim("host:1")
+    store.cancel(job_id)
+
+    assert store.claim("host:2") is None
+    assert item_statuses(store, job_id) == ["cancelled"]
+
+
+def test_retry_after_cancel_requeues(store):
+    job_id = submit(store, count=1)
+    item = store.claim("host:1")
+    store.cancel(job_id)
+    store.fail(item, "host:1", "RuntimeError: boom")
+
+    assert store.retry(job_id) == 1
+    item = store.claim("host:1")
+    assert item is not None and item["attempt"] == 1
+    assert store.complete(item, "host:1", {"ok": True})
+    assert store.status(job_id)["status"] == "completed"
+
+
+def test_failed_item_waiting_to_retry_reports_its_error(store):
+    job_id = submit(store, count=1)
+    store.fail(store.claim("host:1"), "host:1", "RuntimeError: boom")
+
+    errors = store.status(job_id)["errors"]
+    assert [(e["status"], e["attempts"], e["error"]) for e in errors] == [("queued", 1, "RuntimeError: boom")]
+    assert errors[0]["retry_at"] is not None
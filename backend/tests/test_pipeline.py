@@ -0,0 +1,88 @@
+import asyncio
+import io
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import ai_layout_api as layout
+import background_removal_api as removal
+import pipeline_api
+from copy_cache import CopyCache
+
+DELAY = 0.8  # seconds, for both the stub LLM and the stub inference
+
+
+def png_bytes(size=(320, 320)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def slow_services(monkeypatch):
+    """A stub LLM and a stub background removal that each take DELAY seconds"""
+    calls = []
+
+    async def slow_copy(product_name, variation_idx):
+        calls.append(time.perf_counter())
+        await asyncio.sleep(DELAY)
+        return {"headline": f"Headline {variation_idx}", "cta": "Shop Now"}
+
+    def slow_removal(image, model):
+        time.sleep(DELAY)
+        return image.convert("RGBA")
+
+    monkeypatch.setattr(layout, "generate_ad_copy_async", slow_copy)
+    monkeypatch.setattr(layout, "copy_cache", CopyCache(db_path=""))
+    monkeypatch.setattr(removal, "remove_with_pool", slow_removal)
+    return calls
+
+
+def post_pipeline(client, **fields):
+    return client.post(
+        "/api/pipeline",
+        files={"product_image": ("packshot.png", png_bytes(), "image/png")},
+        data={"product_name": "Trail Shoe", "platform": "instagram_square", "copy_mode": "parallel", **fields},
+    )
+
+
+def test_copy_overlaps_background_removal(slow_services):
+    client = TestClient(pipeline_api.app)  # no lifespan: no model preload or job workers
+    post_pipeline(client, num_variations="1", product_name="Warm Up")  # fonts, templates, thread pools
+
+    started = time.perf_counter()
+    response = post_pipeline(client, num_variations="2")
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200, response.text
+    assert len(response.json()["variations"]) == 2
+    # Copy requests go out before inference finishes, so the wall time is about
+    # max(llm, inference) plus rendering rather than their sum
+    assert slow_services[-1] - started < DELAY / 2
+    assert elapsed < 1.5 * DELAY
+
+
+def test_planner_fetches_on_creation(monkeypatch):
+    requested = []
+
+    async def record_copy(product_name, variation_idx):
+        requested.append(variation_idx)
+        return None
+
+    monkeypatch.setattr(layout, "generate_ad_copy_async", record_copy)
+    monkeypatch.setattr(layout, "copy_cache", CopyCache(db_path=""))
+
+    async def scenario():
+        planner = layout.CopyPlanner("Lamp", 3, mode="parallel")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        first = list(requested)
+        copies = [await planner.get(i) for i in range(3)]
+        return first, copies
+
+    first, copies = asyncio.run(scenario())
+    assert sorted(first) == [0, 1, 2]
+    assert sorted(requested) == [0, 1, 2]  # get() reuses the prefetch
+    assert all(copy["headline"] and copy["cta"] for copy in copies)  # offline fallback
@@ -0,0 +1,72 @@
+import base64
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import background_removal_api as removal
+from result_cache import ResultCache
+
+
+def jpeg_bytes(color=(30, 120, 200)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (96, 64), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The removal service with a fresh cache and a stub model that counts its calls"""
+    inferred = []
+
+    def stub_remove(image, model):
+        inferred.append(image.size)
+        return image.convert("RGBA")
+
+    def stub_batch(images, model):
+        return [stub_remove(image, model) for image in images]
+
+    monkeypatch.setattr(removal, "result_cache", ResultCache())
+    monkeypatch.setattr(removal, "remove_with_pool", stub_remove)
+    monkeypatch.setattr(removal, "remove_low_res", stub_remove)
+    monkeypatch.setattr(removal, "remove_batch_safe", stub_batch)
+    test_client = TestClient(removal.app)  # no lifespan: no model preload
+    test_client.inferred = inferred
+    return test_client
+
+
+def test_single_result_is_a_batch_cache_hit(client):
+    packshot = jpeg_bytes()
+    single = client.post("/api/remove-background", files={"file": ("a.jpg", packshot, "image/jpeg")})
+    assert single.status_code == 200 and single.headers["X-Cache"] == "MISS"
+
+    batch = client.post(
+        "/api/batch-remove-background",
+        files=[("files", ("a.jpg", packshot, "image/jpeg")), ("files", ("b.jpg", jpeg_bytes((200, 90, 10)), "image/jpeg"))],
+        params={"response_mode": "data_url"},
+    )
+    results = batch.json()["results"]
+    assert [r["cached"] for r in results] == [True, False]
+    assert results[0]["image"] == "data:image/png;base64," + base64.b64encode(single.content).decode()
+    assert len(client.inferred) == 2  # the shared packshot was inferred once
+
+
+def test_batch_result_is_a_single_cache_hit(client):
+    packshot = jpeg_bytes()
+    client.post("/api/batch-remove-background", files=[("files", ("a.jpg", packshot, "image/jpeg"))])
+
+    single = client.post("/api/remove-background", files={"file": ("a.jpg", packshot, "image/jpeg")})
+    assert single.headers["X-Cache"] == "HIT"
+    assert len(client.inferred) == 1
+
+
+def test_options_that_change_the_output_miss(client):
+    packshot = jpeg_bytes()
+    client.post("/api/remove-background", files={"file": ("a.jpg", packshot, "image/jpeg")})
+
+    low_res = client.post(
+        "/api/remove-background", files={"file": ("a.jpg", packshot, "image/jpeg")}, params={"low_res": "true"}
+    )
+    assert low_res.headers["X-Cache"] == "MISS"
+    assert len(client.inferred) == 2
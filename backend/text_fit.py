@@ -0,0 +1,138 @@
+"""
+Headline fitting from cached glyph metrics.
+
+Wrapping a headline at a fixed number of characters and drawing it at a
+fixed size lets long copy run off the canvas. `fit_text` instead picks the
+largest font size, and the line breaks at that size, for which the text fits
+a box in pixels: a binary search over sizes, wrapping the words greedily at
+each probe.
+
+Measuring every probe with `textbbox` would lay out and rasterize-measure the
+text through FreeType several times per variation. Instead each (font, size)
+gets a `FontMetrics` table of per-character advance widths, filled the first
+time a character is seen at that size, so a probe is a few dictionary
+lookups per word. Glyph ink can reach past the advances at either end of a
+line, so the widest overhangs seen are kept too and subtracted from the box.
+Kerning is ignored: it only tightens text, so lines are never under-estimated
+(benchmarks/text_fit.py checks the results against `multiline_textbbox`).
+"""
+
+from functools import lru_cache
+
+# Pillow's default extra spacing between lines of multiline text, in pixels
+LINE_SPACING = 4
+
+# Characters whose ink spans the tallest ascent and deepest descent of Latin text
+INK_SAMPLE = "ÁÉÍbdfhkltgjpqy|"
+
+
+class FontMetrics:
+    """Advance widths and line geometry of one font at one size, measured once per character"""
+
+    __slots__ = ("font", "advances", "left_overhang", "right_overhang", "line_height", "ink_height", "space")
+
+    def __init__(self, font):
+        self.font = font
+        self.advances = {}
+        self.left_overhang = 0
+        self.right_overhang = 0
+        # Multiline text puts lines this far apart (as ImageDraw computes it)
+        self.line_height = font.getbbox("A")[3] + LINE_SPACING
+        _, top, _, bottom = font.getbbox(INK_SAMPLE)
+        self.ink_height = bottom - top
+        self.space = self.width(" ")
+
+    def width(self, text: str) -> float:
+        """Advance width of `text`, summed from the per-character table"""
+        advances = self.advances
+        try:
+            return sum(map(advances.__getitem__, text))
+        except KeyError:
+            for char in text:
+                if char not in advances:
+                    advances[char] = self.font.getlength(char)
+                    left, _, right, _ = self.font.getbbox(char)
+                    self.left_overhang = max(self.left_overhang, -left)
+                    self.right_overhang = max(self.right_overhang, right - advances[char])
+            return sum(map(advances.__getitem__, text))
+
+    @property
+    def overhang(self) -> float:
+        """Ink a line may have beyond its advance width, plus a pixel for bbox rounding"""
+        return self.left_overhang + self.right_overhang + 1
+
+    def block_height(self, lines: int) -> float:
+        return (lines - 1) * self.line_height + self.ink_height
+
+
+@lru_cache(maxsize=512)
+def font_metrics(font) -> FontMetrics:
+    """The metrics table of a font object (fonts are shared per path and size, see load_font)"""
+    return FontMetrics(font)
+
+
+def wrap_words(words: list, metrics: FontMetrics, max_width: float):
+    """Greedy word wrap to `max_width`; None if some word alone is wider"""
+    widths = [metrics.width(word) for word in words]
+    max_width -= metrics.overhang  # after measuring, so every character's overhang is known
+    lines = []
+    line = []
+    line_width = 0.0
+    for word, word_width in zip(words, widths):
+        if word_width > max_width:
+            return None
+        if line and line_width + metrics.space + word_width > max_width:
+            lines.append(" ".join(line))
+            line = [word]
+            line_width = word_width
+        else:
+            line_width += (metrics.space if line else 0.0) + word_width
+            line.append(word)
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def break_words(words: list, metrics: FontMetrics, max_width: float) -> list:
+    """Word wrap that also splits words wider than `max_width` between characters"""
+    pieces = []
+    limit = max_width - metrics.overhang
+    for word in words:
+        piece = ""
+        for char in word:
+            if piece and metrics.width(piece + char) > limit:
+                pieces.append(piece)
+                piece = ""
+            piece += char
+        pieces.append(piece)
+    widest = max(map(metrics.width, pieces), default=0.0) + metrics.overhang
+    return wrap_words(pieces, metrics, max(max_width, widest))
+
+
+def fit_text(text: str, box: tuple, max_size: int, min_size: int, font_for) -> tuple:
+    """
+    The largest size in [min_size, max_size] at which `text` wraps into `box`
+    (width, height), by binary search. `font_for(size)` returns the font.
+    Returns (text with line breaks, font size). When nothing fits, the text
+    is wrapped at `min_size`, splitting words if it must, and may overflow.
+    """
+    words = text.split()
+    if not words:
+        return "", max_size
+    max_width, max_height = box
+    best = None
+    low, high = min_size, max_size
+    while low <= high:
+        size = (low + high) // 2
+        metrics = font_metrics(font_for(size))
+        lines = wrap_words(words, metrics, max_width)
+        if lines is not None and metrics.block_height(len(lines)) <= max_height:
+            best = (lines, size)
+            low = size + 1
+        else:
+            high = size - 1
+    if best is None:
+        metrics = font_metrics(font_for(min_size))
+        best = (wrap_words(words, metrics, max_width) or break_words(words, metrics, max_width), min_size)
+    lines, size = best
+    return "\n".join(lines), size
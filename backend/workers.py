@@ -0,0 +1,146 @@
+"""
+Bounded worker pool for CPU-bound stages (inference, rendering, encoding).
+
+FastAPI runs `async def` endpoints on the event loop, so any synchronous
+CPU work done inline blocks every other request, including health checks.
+`WorkerPool.run` hands the work to a thread or process pool.
+`WorkerPool.admit` applies admission control per request: once every worker
+is busy and the wait queue is full, new requests are rejected with
+503 + Retry-After instead of piling up.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+import metrics
+
+# Configuration
+
+WORKER_POOL_KIND = os.getenv("WORKER_POOL_KIND", "thread")  # "thread" or "process"
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", str(os.cpu_count() or 1)))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", str(2 * WORKER_POOL_SIZE)))
+WORKER_RETRY_AFTER = int(os.getenv("WORKER_RETRY_AFTER", "1"))  # seconds
+
+
+class ServerBusy(HTTPException):
+    """Raised when the worker pool and its admission queue are both full"""
+
+    def __init__(self, retry_after: int = WORKER_RETRY_AFTER):
+        super().__init__(
+            status_code=503,
+            detail="Server busy, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def _timed_call(fn, args, kwargs):
+    # Runs inside the worker; wall-clock time so it is comparable across processes.
+    # Stage timings recorded by `fn` travel back with the result.
+    started = time.time()
+    result, stages = metrics.captured(fn, args, kwargs)
+    return started, result, stages
+
+
+class WorkerPool:
+    """Thread/process executor with a bounded admission queue"""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = WORKER_POOL_KIND,
+        max_workers: int = WORKER_POOL_SIZE,
+        max_queue: int = WORKER_QUEUE_SIZE,
+        retry_after: int = WORKER_RETRY_AFTER,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown worker pool kind '{kind}'. Use 'thread' or 'process'")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._executor = None
+
+        # Counters are only touched from the event loop thread
+        self._admitted = 0
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def executor(self):
+        # Created lazily so process pools are not forked at import time
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @asynccontextmanager
+    async def admit(self):
+        """Admit one request, or raise ServerBusy if the pool and its queue are full"""
+        if self._admitted >= self.capacity:
+            self._rejected += 1
+            raise ServerBusy(self.retry_after)
+        self._admitted += 1
+        try:
+            yield
+        finally:
+            self._admitted -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` in the pool and await its result (its stage timings join this request's)"""
+        self._pending += 1
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            started, result, stages = await loop.run_in_executor(
+                self.executor, _timed_call, fn, args, kwargs
+            )
+            metrics.replay(stages)
+            wait = max(0.0, started - submitted)
+            self._completed += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            return result
+        finally:
+            self._pending -= 1
+
+    async def warm_up(self) -> None:
+        """Start every worker now (forking and importing) rather than on the first requests"""
+        loop = asyncio.get_running_loop()
+        # Overlapping sleeps make the executor start one worker per call
+        await asyncio.gather(*(loop.run_in_executor(self.executor, time.sleep, 0.05) for _ in range(self.max_workers)))
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "queue_limit": self.max_queue,
+            "admitted_requests": self._admitted,
+            "in_flight": min(self._pending, self.max_workers),
+            "queue_depth": max(0, self._pending - self.max_workers),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(1000 * self._wait_total / self._completed, 2) if self._completed else 0.0,
+            "max_wait_ms": round(1000 * self._wait_max, 2),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -863,12 +863,17 @@ export default function CreativeGenStudio() {
     }
   };
 
-  const handleDownloadSelectedLayout = (index: number) => {
-    const dataUrl = layoutVariations[index];
+  const handleDownloadSelectedLayout = async (index: number) => {
+    const imageUrl = layoutVariations[index];
+    // Variations are result-store URLs on another origin; download via a blob URL
+    const blob = await (await fetch(imageUrl)).blob();
+    const ext = blob.type.split('/')[1] || 'png';
+    const objectUrl = URL.createObjectURL(blob);
     const a = document.createElement('a');
-    a.href = dataUrl;
-    a.download = `creativegen-layout-${index + 1}-${aiInputs.platform}.png`;
+    a.href = objectUrl;
+    a.download = `creativegen-layout-${index + 1}-${aiInputs.platform}.${ext}`;
     a.click();
+    URL.revokeObjectURL(objectUrl);
     setIsPreviewOpen(false);
     setLayoutVariations([]);
     showStatus('Layout downloaded!', 'success');
@@ -43,6 +43,83 @@ export async function removeBackground(file: File): Promise<string> {
   });
 }
 
+export interface BatchStreamResult {
+  index: number;
+  filename: string;
+  success: boolean;
+  image?: string; // result store URL (or base64 data URL with response_mode=data_url)
+  cached?: boolean;
+  size?: {
+    width: number;
+    height: number;
+  };
+  error?: string;
+}
+
+export interface BatchStreamSummary {
+  done: true;
+  success: boolean;
+  processed: number;
+  failed: number;
+  model: string;
+  timestamp: string;
+}
+
+/**
+ * Remove backgrounds from many files, calling `onResult` for each image as soon as
+ * the server finishes it (results may arrive out of order; use `index`).
+ */
+export async function removeBackgroundBatchStream(
+  files: File[],
+  onResult: (result: BatchStreamResult) => void,
+  options: { model?: string; signal?: AbortSignal } = {}
+): Promise<BatchStreamSummary> {
+  const formData = new FormData();
+  files.forEach((file) => formData.append('files', file));
+
+  const params = new URLSearchParams({ stream_format: 'ndjson' });
+  if (options.model) params.set('model', options.model);
+
+  const response = await fetch(`${API_BASE_URL}/api/batch-remove-background/stream?${params}`, {
+    method: 'POST',
+    body: formData,
+    signal: options.signal,
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error('Failed to remove backgrounds');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let summary: BatchStreamSummary | null = null;
+
+  const handleLine = (line: string): BatchStreamSummary | null => {
+    if (!line.trim()) return null;
+    const event = JSON.parse(line);
+    if (event.done) return event as BatchStreamSummary;
+    onResult(event as BatchStreamResult);
+    return null;
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() ?? '';
+    for (const line of lines) {
+      summary = handleLine(line) ?? summary;
+    }
+  }
+  summary = handleLine(buffer + decoder.decode()) ?? summary;
+
+  if (!summary) {
+    throw new Error('Background removal stream ended unexpectedly');
+  }
+  return summary;
+}
 
 /**
  * Check API health
@@ -1,6 +1,7 @@
 // lib/compliance/rules.ts
 // Deterministic regex-based rules for sensitive data detection
 // This does NOT guarantee legal compliance — it only surfaces risk indicators
+// Mirrored on the server in backend/compliance.py — keep both in sync
 
 export interface ComplianceRule {
   name: string;